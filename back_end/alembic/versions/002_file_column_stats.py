@@ -0,0 +1,33 @@
+"""Add file_column_stats table
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Per-column running statistics, merged on every append
+    op.create_table('file_column_stats',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('file_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('column_name', sa.String(length=255), nullable=False),
+        sa.Column('stats', postgresql.JSON(astext_type=sa.Text()), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('file_id', 'column_name', name='uq_file_column_stats_file_column')
+    )
+    op.create_index('ix_file_column_stats_file_id', 'file_column_stats', ['file_id'])
+
+def downgrade():
+    op.drop_index('ix_file_column_stats_file_id', table_name='file_column_stats')
+    op.drop_table('file_column_stats')
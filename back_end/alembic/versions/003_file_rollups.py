@@ -0,0 +1,41 @@
+"""Add file_rollups table
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Day/week/month rollups per numeric column of date-indexed files
+    op.create_table('file_rollups',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('file_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('value_column', sa.String(length=255), nullable=False),
+        sa.Column('granularity', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('sum', sa.Float(), nullable=False),
+        sa.Column('min', sa.Float(), nullable=True),
+        sa.Column('max', sa.Float(), nullable=True),
+        sa.Column('open', sa.Float(), nullable=True),
+        sa.Column('close', sa.Float(), nullable=True),
+        sa.Column('first_at', sa.DateTime(), nullable=True),
+        sa.Column('last_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('file_id', 'value_column', 'granularity', 'period_start', name='uq_file_rollups_period')
+    )
+    op.create_index('ix_file_rollups_file_id', 'file_rollups', ['file_id'])
+
+def downgrade():
+    op.drop_index('ix_file_rollups_file_id', table_name='file_rollups')
+    op.drop_table('file_rollups')
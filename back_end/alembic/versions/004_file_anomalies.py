@@ -0,0 +1,36 @@
+"""Add file_anomalies table
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Rows flagged by the local anomaly scan
+    op.create_table('file_anomalies',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('file_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('row_index', sa.Integer(), nullable=False),
+        sa.Column('column_name', sa.String(length=255), nullable=True),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('value', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('detail', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_file_anomalies_file_id', 'file_anomalies', ['file_id'])
+
+def downgrade():
+    op.drop_index('ix_file_anomalies_file_id', table_name='file_anomalies')
+    op.drop_table('file_anomalies')
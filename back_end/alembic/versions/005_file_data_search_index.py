@@ -0,0 +1,25 @@
+"""Add full-text search index over file_data
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Expression index over every string value of a row; must match the
+    # expression built in app/services/search_service.py
+    op.execute(
+        "CREATE INDEX ix_file_data_search ON file_data USING GIN "
+        "(jsonb_to_tsvector('simple'::regconfig, CAST(data AS JSONB), '[\"string\"]'::jsonb))"
+    )
+
+def downgrade():
+    op.execute("DROP INDEX ix_file_data_search")
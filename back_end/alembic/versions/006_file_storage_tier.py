@@ -0,0 +1,26 @@
+"""Add storage tier and access time to files
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Cold files have their rows archived out of file_data
+    op.add_column('files', sa.Column('storage_tier', sa.String(length=20), nullable=False, server_default='hot'))
+    op.add_column('files', sa.Column('last_accessed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_files_storage_tier', 'files', ['storage_tier'])
+
+def downgrade():
+    op.drop_index('ix_files_storage_tier', table_name='files')
+    op.drop_column('files', 'last_accessed_at')
+    op.drop_column('files', 'storage_tier')
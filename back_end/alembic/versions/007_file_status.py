@@ -0,0 +1,28 @@
+"""Add upload status to files
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Chunked uploads stay "uploading" (hidden from reads) until finalized
+    op.add_column('files', sa.Column('status', sa.String(length=20), nullable=False, server_default='ready'))
+    op.create_index('ix_files_status', 'files', ['status'])
+    op.execute(
+        "UPDATE files SET status = 'uploading' "
+        "WHERE file_path LIKE '%.part'"
+    )
+
+def downgrade():
+    op.drop_index('ix_files_status', table_name='files')
+    op.drop_column('files', 'status')
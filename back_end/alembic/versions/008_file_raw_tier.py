@@ -0,0 +1,25 @@
+"""Track whether a file's stored uploads are compressed
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing files start as "raw"; the next tiering pass compresses what is
+    # left and marks them "compressed"
+    op.add_column('files', sa.Column('raw_tier', sa.String(length=20), nullable=False, server_default='raw'))
+    op.create_index('ix_files_raw_tier', 'files', ['raw_tier'])
+
+def downgrade():
+    op.drop_index('ix_files_raw_tier', table_name='files')
+    op.drop_column('files', 'raw_tier')
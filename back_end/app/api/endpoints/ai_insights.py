@@ -2,15 +2,14 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_async_db
 from app.services.openrouter_service import OpenRouterService
-from app.services.file_service import FileService
-from app.config import settings
+from app.services.file_service import file_service
+from app.utils.admission import admit
 
 router = APIRouter(prefix="/ai", tags=["ai-insights"])
 
 openrouter_service = OpenRouterService()
-file_service = FileService(settings.UPLOAD_DIR)
 
-@router.post("/analyze-custom")
+@router.post("/analyze-custom", dependencies=[Depends(admit("ai"))])
 async def analyze_custom_data(
     data: list,
     query: str,
@@ -31,7 +30,7 @@ async def analyze_custom_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/summarize")
+@router.post("/summarize", dependencies=[Depends(admit("ai"))])
 async def summarize_data(
     file_id: str,
     db: AsyncSession = Depends(get_async_db)
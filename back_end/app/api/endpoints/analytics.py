@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_read_db, primary_session
+from app.services.analytics_service import AnalyticsService
+from app.services.file_service import file_service
+from app.services.reconciliation_service import ReconciliationService
+from app.services.timeseries_service import ROWS_COLUMN
+from app.schemas.analytics_schema import (
+    AggregateRequest, AggregateResponse, TimeSeriesResponse, ReconcileRequest, ReconcileResponse
+)
+from app.utils.admission import admit
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+analytics_service = AnalyticsService(file_service.computed_column_service)
+reconciliation_service = ReconciliationService(file_service)
+
+@router.post("/aggregate", response_model=AggregateResponse, dependencies=[Depends(admit("reads"))])
+async def aggregate_files(
+    request: AggregateRequest,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Totals, distinct counts and percentiles across many files, from stored
+    sketches. Computed columns not materialized yet are listed in
+    `unavailable_columns` instead of being computed on this read path."""
+    if any(q < 0 or q > 1 for q in request.quantiles):
+        raise HTTPException(status_code=400, detail="Quantiles must be between 0 and 1")
+
+    result = await analytics_service.aggregate(
+        db, request.file_ids, request.columns, request.quantiles
+    )
+    if not result["file_ids"]:
+        raise HTTPException(status_code=404, detail="None of the requested files exist")
+
+    return AggregateResponse(**result)
+
+@router.get("/{file_id}/timeseries", response_model=TimeSeriesResponse, dependencies=[Depends(admit("reads"))])
+async def get_timeseries(
+    file_id: UUID,
+    column: Optional[str] = Query(None, description="Numeric column; omit to count rows"),
+    freq: str = Query("M", description="D, W, M, Q or Y, optionally with a multiple (7D, 2W, 3M)"),
+    agg: str = Query("sum", description="count, sum, mean, min, max, open or close"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    window: Optional[int] = Query(None, ge=1, le=1000, description="Rolling window in output periods"),
+    window_agg: str = Query("mean"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Resample a date-indexed file from its materialized rollups"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if "time_column" not in (file.file_metadata or {}):
+        # One-off backfill for files stored before rollups existed; it writes,
+        # so it runs on the primary, and so does the query that needs it
+        async with primary_session(db) as primary_db:
+            file = await file_service.get_file_by_id(primary_db, file_id)
+            await file_service.ensure_time_index(primary_db, file)
+            await primary_db.commit()
+            return await _query_timeseries(primary_db, file, column, freq, agg, start, end, window, window_agg)
+
+    return await _query_timeseries(db, file, column, freq, agg, start, end, window, window_agg)
+
+async def _query_timeseries(db: AsyncSession, file, column, freq, agg, start, end, window, window_agg) -> TimeSeriesResponse:
+    """Read and resample the rollups of `file` through `db`"""
+    time_column = (file.file_metadata or {}).get("time_column")
+    if not time_column:
+        raise HTTPException(status_code=400, detail="File has no date or timestamp column")
+    if column and column not in (file.columns or []):
+        raise HTTPException(status_code=400, detail=f"Unknown column '{column}'")
+
+    try:
+        result = await file_service.timeseries_service.query(
+            db, file.id, column or ROWS_COLUMN, freq, agg, start, end, window, window_agg
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return TimeSeriesResponse(file_id=file.id, time_column=time_column, **result)
+
+@router.post("/reconcile", response_model=ReconcileResponse, dependencies=[Depends(admit("ingest"))])
+async def reconcile_files(
+    request: ReconcileRequest,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Match the rows of two files on key columns, within amount/date tolerances.
+
+    Runs under the ingest admission class since it reads both files in full.
+    """
+    files = {}
+    for name, side in (("left", request.left), ("right", request.right)):
+        file = await file_service.get_file_by_id(db, side.file_id)
+        if not file:
+            raise HTTPException(status_code=404, detail=f"{name.capitalize()} file not found")
+        wanted = side.key_columns + [column for column in (side.amount_column, side.date_column) if column]
+        unknown = [column for column in wanted if column not in (file.columns or [])]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown {name} column(s): {', '.join(unknown)}")
+        files[name] = file
+
+    if len(request.left.key_columns) != len(request.right.key_columns):
+        raise HTTPException(status_code=400, detail="Both sides need the same number of key columns")
+    if bool(request.left.amount_column) != bool(request.right.amount_column):
+        raise HTTPException(status_code=400, detail="Give an amount column for both sides or neither")
+    if bool(request.left.date_column) != bool(request.right.date_column):
+        raise HTTPException(status_code=400, detail="Give a date column for both sides or neither")
+
+    # Cold files are rehydrated on the primary; join them there rather than
+    # wait for the replica to catch up
+    cold = any(file.storage_tier == "cold" for file in files.values())
+    async with primary_session(db, needed=cold) as join_db:
+        if join_db is not db:
+            files = {name: await file_service.get_file_by_id(join_db, file.id) for name, file in files.items()}
+        result = await reconciliation_service.reconcile(
+            join_db,
+            files["left"],
+            files["right"],
+            request.left.model_dump(exclude={"file_id"}),
+            request.right.model_dump(exclude={"file_id"}),
+            request.amount_tolerance,
+            request.date_tolerance_days,
+            request.limit
+        )
+    return ReconcileResponse(**result)
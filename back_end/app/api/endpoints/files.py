@@ -1,89 +1,429 @@
+import asyncio
+import csv
+import io
 import os
+import logging
+import zipfile
 from uuid import UUID
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File as FastAPIFile, Query
-from fastapi.responses import JSONResponse
+from typing import List, Optional, Set, Tuple
+from fastapi import (
+    APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, Response,
+    UploadFile, File as FastAPIFile, Query
+)
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_async_db
-from app.services.file_service import FileService
+from app.database import get_async_db, get_async_read_db, primary_session, AsyncSessionLocal
+from app.services.file_service import file_service
+from app.services.chunked_upload_service import (
+    ChunkedUploadService, UploadConflict, UploadNotFound
+)
 from app.services.openrouter_service import OpenRouterService
-# Add this import in app/api/endpoints/files.py
-from app.services.csv_parser import CSVParser
+from app.services.anomaly_service import AnomalyService
+from app.services.expressions import ExpressionError
 from app.schemas.file_schema import (
     FileResponse, FileListResponse, UploadResponse,
-    PaginatedResponse, PaginationParams
+    PaginatedResponse, PaginationParams,
+    BatchUploadItem, BatchUploadResponse,
+    ChunkedUploadCreate, ChunkedUploadFinalize, ChunkedUploadStatus,
+    ComputedColumn, ComputedColumnCreate
 )
 from app.config import settings
+from app.utils.admission import admit, admitted, governors, spare_slots
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/files", tags=["files"])
 
 # Initialize services
-file_service = FileService(settings.UPLOAD_DIR)
+chunked_upload_service = ChunkedUploadService(settings.UPLOAD_DIR, file_service)
 openrouter_service = OpenRouterService()
+anomaly_service = AnomalyService(file_service)
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload_file(
-    file: UploadFile = FastAPIFile(...),
-    db: AsyncSession = Depends(get_async_db)
-):
-    """Upload and process a CSV/Excel file"""
+def _allowed_extensions() -> List[str]:
+    return [ext.strip().lower().lstrip(".") for ext in settings.ALLOWED_FILE_TYPES]
 
-    print("DEBUG: Starting upload")
-    
-    if not file.filename.lower().endswith('.csv'):
+def _validate_upload_name(filename: str) -> None:
+    """Reject anything that is not an allowed CSV file"""
+    if not filename or not filename.lower().endswith('.csv'):
         raise HTTPException(
             status_code=400,
             detail="Only CSV files are allowed"
         )
 
-    # Validate file type
-    allowed_extensions = settings.ALLOWED_FILE_TYPES
-    file_ext = os.path.splitext(file.filename)[1].lower().lstrip(".")
-
-    print(f"File extension: {file_ext}")
-    print(f"Allowed extensions: {allowed_extensions}")
-    
+    allowed_extensions = _allowed_extensions()
+    file_ext = os.path.splitext(filename)[1].lower().lstrip(".")
     if file_ext not in allowed_extensions:
         raise HTTPException(
             status_code=400,
             detail=f"File type not allowed. Allowed types: {', '.join(allowed_extensions)}"
         )
-    
-    # Validate file size
-    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    content = await file.read()
+
+async def _read_upload(upload: UploadFile, max_size: int) -> bytes:
+    """Read an upload, refusing it as soon as it exceeds `max_size` bytes"""
+    too_large = HTTPException(
+        status_code=400,
+        detail=f"{upload.filename} is too large. Maximum size is {settings.MAX_FILE_SIZE_MB}MB"
+    )
+    if upload.size is not None and upload.size > max_size:
+        raise too_large
+    content = await upload.read(max_size + 1)
     if len(content) > max_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE_MB}MB"
-        )
-    
-    # Reset file pointer
-    await file.seek(0)
+        raise too_large
+    return content
 
-    data, columns = await CSVParser.parse_csv_content(content, file.filename)
+@router.post("/upload", response_model=UploadResponse, dependencies=[Depends(admit("ingest"))])
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = FastAPIFile(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Upload and process a CSV/Excel file"""
+
+    _validate_upload_name(file.filename)
+    
+    # Validate file size
+    content = await _read_upload(file, settings.MAX_FILE_SIZE_MB * 1024 * 1024)
     
     try:
         # Process and save file
-        file_record = await file_service.process_and_save_file(db, file)
-        print(f"DEBUG: File processed successfully")  # ← ADD THIS
+        file_record = await file_service.ingest_content(
+            db, file.filename, content, file.content_type
+        )
+        background_tasks.add_task(_scan_anomalies, [file_record.id])
 
         return UploadResponse(
             message="File uploaded successfully",
             file=FileResponse.from_orm(file_record)
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"DEBUG: ERROR in upload endpoint: {e}")  # ← ADD THIS
-        import traceback
-        traceback.print_exc()  # ← ADD THIS
+        logger.exception("Upload failed for %s", file.filename)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/", response_model=FileListResponse)
+def _expand_zip(
+    archive_name: str,
+    content: bytes,
+    max_member_bytes: int,
+    max_members: int,
+    max_total_bytes: int
+) -> List[Tuple[str, bytes, str]]:
+    """Return the CSV members of a zip archive as (name, bytes, content type).
+
+    Sizes and counts come from the archive's directory and are checked
+    before anything is decompressed; zipfile never reads past a member's
+    declared size, so a forged header can't get around the limits.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{archive_name} is not a valid zip archive")
+
+    with archive:
+        infos = []
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if not name.lower().endswith(".csv"):
+                continue
+            if info.file_size > max_member_bytes:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{name} in {archive_name} is too large. Maximum size is {settings.MAX_FILE_SIZE_MB}MB"
+                )
+            infos.append(info)
+
+        if len(infos) > max_members:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many files in {archive_name}. Maximum is {settings.BATCH_UPLOAD_MAX_FILES} per batch"
+            )
+        if sum(info.file_size for info in infos) > max_total_bytes:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{archive_name} is too large uncompressed. Maximum is {settings.BATCH_UPLOAD_MAX_TOTAL_MB}MB per batch"
+            )
+        try:
+            return [(os.path.basename(info.filename), archive.read(info), "text/csv") for info in infos]
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError) as e:
+            raise HTTPException(status_code=400, detail=f"Could not extract {archive_name}: {e}")
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, dependencies=[Depends(admit("ingest"))])
+async def upload_files_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = FastAPIFile(...)
+):
+    """Upload many CSV files (or zip archives of CSVs) and ingest them in parallel"""
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    remaining_bytes = settings.BATCH_UPLOAD_MAX_TOTAL_MB * 1024 * 1024
+    items: List[Tuple[str, bytes, str]] = []
+
+    for upload in files:
+        if upload.filename and upload.filename.lower().endswith(".zip"):
+            content = await _read_upload(upload, max_size)
+            members = _expand_zip(
+                upload.filename, content, max_size,
+                settings.BATCH_UPLOAD_MAX_FILES - len(items), remaining_bytes
+            )
+        else:
+            _validate_upload_name(upload.filename)
+            members = [(upload.filename, await _read_upload(upload, max_size), upload.content_type)]
+
+        for name, member_content, content_type in members:
+            remaining_bytes -= len(member_content)
+            items.append((name, member_content, content_type))
+        if remaining_bytes < 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Batch is too large. Maximum is {settings.BATCH_UPLOAD_MAX_TOTAL_MB}MB per batch"
+            )
+        if len(items) > settings.BATCH_UPLOAD_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many files. Maximum is {settings.BATCH_UPLOAD_MAX_FILES} per batch"
+            )
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No CSV files found in upload")
+
+    # Each in-flight file holds one pooled connection, so never run more
+    # files at once than the pool can serve without overflow. Every file in
+    # flight also counts against ingest admission: the request's own slot
+    # covers one, and the batch only widens as far as spare slots allow.
+    wanted = max(1, min(settings.BATCH_UPLOAD_CONCURRENCY, settings.DB_POOL_SIZE, len(items)))
+    async with spare_slots("ingest", wanted - 1) as extra:
+        results = await file_service.process_batch(AsyncSessionLocal, items, 1 + extra)
+    background_tasks.add_task(_scan_anomalies, [result["file"].id for result in results if result["file"]])
+
+    succeeded = sum(1 for result in results if result["status"] == "uploaded")
+    return BatchUploadResponse(
+        message=f"Processed {len(results)} files",
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=[
+            BatchUploadItem(
+                filename=result["filename"],
+                status=result["status"],
+                file=FileResponse.from_orm(result["file"]) if result["file"] else None,
+                error=result["error"],
+                duration_ms=result["duration_ms"]
+            )
+            for result in results
+        ]
+    )
+
+def _upload_status(state: dict, rows_ingested: int = 0) -> ChunkedUploadStatus:
+    return ChunkedUploadStatus(
+        upload_id=state["upload_id"],
+        file_id=state["file_id"],
+        filename=state["filename"],
+        length=state["length"],
+        offset=state["offset"],
+        complete=state["offset"] == state["length"],
+        rows_ingested=rows_ingested
+    )
+
+async def _ingest_uploaded_prefix(upload_id: str):
+    """Background task: parse whatever complete records have arrived.
+
+    Runs after the PATCH response, so it takes its own ingest slot. When
+    ingest is saturated the work is skipped; the next chunk or finalize
+    picks up the same records."""
+    try:
+        async with admitted("ingest"):
+            await chunked_upload_service.ingest_available(AsyncSessionLocal, upload_id)
+    except UploadNotFound:
+        pass
+    except HTTPException:
+        logger.info("Ingest busy, deferring prefix ingest for upload %s", upload_id)
+    except Exception:
+        logger.exception("Prefix ingest failed for upload %s", upload_id)
+
+_scan_retries: Set[asyncio.Task] = set()
+
+async def _scan_anomalies(file_ids: List[UUID], attempt: int = 0):
+    """Background task: bring the anomaly scan of freshly ingested files up
+    to date, so reads rarely have to scan.
+
+    Files turned away by ingest admission are marked "scan pending" and
+    retried once the class has had time to drain, backing off from its
+    Retry-After. If every retry is turned away the next read scans."""
+    if not settings.ANOMALY_SCAN_ON_INGEST:
+        return
+    deferred = []
+    for file_id in file_ids:
+        try:
+            async with admitted("ingest"):
+                await anomaly_service.rescan(AsyncSessionLocal, file_id)
+        except HTTPException:
+            deferred.append(file_id)
+        except Exception:
+            logger.exception("Anomaly scan failed for file %s", file_id)
+    if not deferred:
+        return
+
+    try:
+        await anomaly_service.mark_pending(AsyncSessionLocal, deferred)
+    except Exception:
+        logger.exception("Could not mark anomaly scans pending")
+    if attempt >= settings.ANOMALY_SCAN_RETRIES:
+        logger.warning("Ingest busy, leaving anomaly scan of %d file(s) pending", len(deferred))
+        return
+
+    delay = governors["ingest"].retry_after() * 2 ** attempt
+    logger.info("Ingest busy, retrying anomaly scan of %d file(s) in %ss", len(deferred), delay)
+
+    async def retry():
+        await asyncio.sleep(delay)
+        await _scan_anomalies(deferred, attempt + 1)
+
+    # Keep a reference so the retry isn't garbage collected mid-sleep
+    task = asyncio.create_task(retry())
+    _scan_retries.add(task)
+    task.add_done_callback(_scan_retries.discard)
+
+@router.post("/uploads", response_model=ChunkedUploadStatus, status_code=201, dependencies=[Depends(admit("ingest"))])
+async def create_chunked_upload(
+    payload: ChunkedUploadCreate,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Start a resumable upload; send chunks with PATCH, then finalize"""
+    _validate_upload_name(payload.filename)
+
+    max_size = settings.CHUNKED_UPLOAD_MAX_SIZE_MB * 1024 * 1024
+    if payload.length > max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large. Maximum size is {settings.CHUNKED_UPLOAD_MAX_SIZE_MB}MB"
+        )
+
+    state = await chunked_upload_service.create_upload(
+        db, payload.filename, payload.length, payload.checksum, payload.content_type
+    )
+    response.headers["Location"] = str(request.url_for("get_chunked_upload", upload_id=state["upload_id"]))
+    response.headers["Upload-Offset"] = "0"
+    return _upload_status(state)
+
+@router.head("/uploads/{upload_id}", dependencies=[Depends(admit("reads"))])
+async def get_chunked_upload_offset(upload_id: str):
+    """Return the current offset in the Upload-Offset header (tus-style resume)"""
+    try:
+        state = chunked_upload_service.load_state(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return Response(
+        status_code=200,
+        headers={
+            "Upload-Offset": str(state["offset"]),
+            "Upload-Length": str(state["length"]),
+            "Cache-Control": "no-store"
+        }
+    )
+
+@router.get("/uploads/{upload_id}", response_model=ChunkedUploadStatus, dependencies=[Depends(admit("reads"))])
+async def get_chunked_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get progress of a resumable upload"""
+    try:
+        state = chunked_upload_service.load_state(upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    file = await file_service.get_file_by_id(db, UUID(state["file_id"]), include_uploading=True)
+    return _upload_status(state, file.row_count if file else 0)
+
+@router.patch("/uploads/{upload_id}", response_model=ChunkedUploadStatus, dependencies=[Depends(admit("ingest"))])
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0)
+):
+    """Write the request body at Upload-Offset and ingest completed records"""
+    max_chunk = settings.UPLOAD_CHUNK_MAX_MB * 1024 * 1024
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_chunk:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Chunk too large. Maximum chunk size is {settings.UPLOAD_CHUNK_MAX_MB}MB"
+        )
+
+    async def limited_stream():
+        received = 0
+        async for piece in request.stream():
+            received += len(piece)
+            if received > max_chunk:
+                raise ValueError(f"Chunk too large. Maximum chunk size is {settings.UPLOAD_CHUNK_MAX_MB}MB")
+            yield piece
+
+    try:
+        state = await chunked_upload_service.write_chunk(upload_id, upload_offset, limited_stream())
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    background_tasks.add_task(_ingest_uploaded_prefix, upload_id)
+    return JSONResponse(
+        content=_upload_status(state).model_dump(mode="json"),
+        headers={"Upload-Offset": str(state["offset"])},
+        background=background_tasks
+    )
+
+@router.post("/uploads/{upload_id}/finalize", response_model=UploadResponse, dependencies=[Depends(admit("ingest"))])
+async def finalize_chunked_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    payload: Optional[ChunkedUploadFinalize] = None
+):
+    """Verify the checksum, ingest the remaining rows and publish the file"""
+    try:
+        file_record = await chunked_upload_service.finalize(
+            AsyncSessionLocal, upload_id, payload.checksum if payload else None
+        )
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    background_tasks.add_task(_scan_anomalies, [file_record.id])
+    return UploadResponse(
+        message="File uploaded successfully",
+        file=FileResponse.from_orm(file_record)
+    )
+
+@router.delete("/uploads/{upload_id}", dependencies=[Depends(admit("ingest"))])
+async def abort_chunked_upload(upload_id: str):
+    """Abort a resumable upload and discard everything received so far"""
+    try:
+        await chunked_upload_service.abort(AsyncSessionLocal, upload_id)
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return {"message": "Upload aborted"}
+
+@router.post("/tiering/run", dependencies=[Depends(admit("ingest"))])
+async def run_storage_tiering():
+    """Run a storage tiering pass now instead of waiting for the background loop"""
+    return await file_service.tiering_service.run_pass()
+
+@router.get("/", response_model=FileListResponse, dependencies=[Depends(admit("reads"))])
 async def get_files(
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get all uploaded files with pagination"""
     try:
@@ -102,10 +442,10 @@ async def get_files(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{file_id}", response_model=FileResponse)
+@router.get("/{file_id}", response_model=FileResponse, dependencies=[Depends(admit("reads"))])
 async def get_file(
     file_id: UUID,
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get file details by ID"""
     file = await file_service.get_file_by_id(db, file_id)
@@ -114,17 +454,24 @@ async def get_file(
     
     return FileResponse.from_orm(file)
 
-@router.get("/{file_id}/data", response_model=PaginatedResponse)
+@router.get("/{file_id}/data", response_model=PaginatedResponse, dependencies=[Depends(admit("reads"))])
 async def get_file_data(
     file_id: UUID,
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=100),
-    db: AsyncSession = Depends(get_async_db)
+    sort_by: Optional[str] = Query(None, description="Stored or computed column to sort by"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_computed: bool = Query(
+        False, description="Add computed column values to each row (materializes them over the whole file)"
+    ),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get paginated data from a file"""
     try:
         skip = (page - 1) * limit
-        result = await file_service.get_file_data(db, file_id, skip, limit)
+        result = await file_service.get_file_data(
+            db, file_id, skip, limit, sort_by, order == "desc", include_computed
+        )
         
         return PaginatedResponse(
             file=FileResponse.from_orm(result["file"]),
@@ -132,12 +479,249 @@ async def get_file_data(
             pagination=result["pagination"]
         )
         
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/{file_id}")
+@router.post("/{file_id}/append", response_model=UploadResponse, dependencies=[Depends(admit("ingest"))])
+async def append_file_rows(
+    file_id: UUID,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = FastAPIFile(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Append rows from a CSV with the same columns to an existing file"""
+    _validate_upload_name(file.filename)
+
+    content = await _read_upload(file, settings.MAX_FILE_SIZE_MB * 1024 * 1024)
+
+    try:
+        file_record = await file_service.append_content(
+            db, file_id, file.filename, content, file.content_type
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    background_tasks.add_task(_scan_anomalies, [file_record.id])
+    return UploadResponse(
+        message="Rows appended successfully",
+        file=FileResponse.from_orm(file_record)
+    )
+
+@router.get("/{file_id}/stats", dependencies=[Depends(admit("reads"))])
+async def get_file_stats(
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get stored per-column statistics for a file, and those of its
+    computed columns that are already materialized"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    stats = await file_service.get_column_stats(db, file_id)
+    computed, unavailable = await file_service.computed_column_service.cached_column_stats(file)
+    return {
+        "file_id": file_id,
+        "row_count": file.row_count,
+        "columns": {
+            column: stats[column].summary()
+            for column in (file.columns or [])
+            if column in stats
+        },
+        "computed_columns": {
+            column: column_stats.summary() for column, column_stats in computed.items()
+        },
+        # Not materialized for the current rows; see POST /computed-columns/materialize
+        "unavailable_computed_columns": unavailable
+    }
+
+@router.get("/{file_id}/computed-columns", response_model=List[ComputedColumn], dependencies=[Depends(admit("reads"))])
+async def list_computed_columns(
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """List the computed columns defined on a file"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return [
+        ComputedColumn(name=name, **definition)
+        for name, definition in file_service.computed_column_service.definitions(file).items()
+    ]
+
+@router.post("/{file_id}/computed-columns", response_model=ComputedColumn, status_code=201, dependencies=[Depends(admit("ingest"))])
+async def create_computed_column(
+    file_id: UUID,
+    payload: ComputedColumnCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Define (or redefine) a computed column, e.g. `credit - debit`,
+    `case_when(contains(memo, "(?i)uber|lyft"), "Transport", "Other")` or
+    `cumsum(credit - debit)`. Values are computed on first use."""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        column = await file_service.computed_column_service.define(db, file, payload.name, payload.expression)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ComputedColumn(**column)
+
+@router.post("/{file_id}/computed-columns/materialize", dependencies=[Depends(admit("ingest"))])
+async def materialize_computed_columns(
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Compute and cache every computed column of the file, returning their
+    stats. It reads the whole file, so it is ingest work; reads and
+    aggregates only ever use what this (or an earlier use) cached."""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        computed = await file_service.computed_column_service.column_stats(db, file)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "file_id": file_id,
+        "computed_columns": {
+            column: column_stats.summary() for column, column_stats in computed.items()
+        }
+    }
+
+@router.delete("/{file_id}/computed-columns/{name}", dependencies=[Depends(admit("ingest"))])
+async def delete_computed_column(
+    file_id: UUID,
+    name: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Remove a computed column and its cached values"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if not await file_service.computed_column_service.remove(db, file, name):
+        raise HTTPException(status_code=404, detail="Computed column not found")
+    return {"message": "Computed column deleted successfully"}
+
+@router.get("/{file_id}/export", dependencies=[Depends(admit("reads"))])
+async def export_file(
+    file_id: UUID,
+    columns: Optional[str] = Query(None, description="Comma-separated stored or computed columns, default all"),
+    sort_by: Optional[str] = Query(None, description="Stored or computed column to sort by"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Stream the file as CSV, computed columns included"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    computed = file_service.computed_column_service.definitions(file)
+    selected = (
+        [column.strip() for column in columns.split(",") if column.strip()]
+        if columns else (file.columns or []) + list(computed)
+    )
+    unknown = [column for column in selected if column not in computed and column not in (file.columns or [])]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown column '{unknown[0]}'")
+
+    # Rehydrate and materialize before the response starts, so errors
+    # still come back as a status code. Cold rows are rehydrated on the
+    # primary; export from there rather than wait for the replica
+    async with primary_session(db, needed=file.storage_tier == "cold") as export_db:
+        if export_db is not db:
+            file = await file_service.get_file_by_id(export_db, file_id)
+        async with file_service.tiering_service.hot(export_db, file):
+            try:
+                await file_service.computed_column_service.vectors(
+                    export_db, file, [column for column in selected if column in computed] + ([sort_by] if sort_by else [])
+                )
+            except ExpressionError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        bind = export_db.bind
+
+    async def stream_csv():
+        # The request session may be closed once the response starts; keep
+        # reading from the same database it used
+        async with AsyncSession(bind, expire_on_commit=False) as export_db:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(selected)
+            # Keep the file hot until the last row is out
+            stream_file = await file_service.get_file_by_id(export_db, file.id)
+            if not stream_file:
+                yield buffer.getvalue()
+                return
+            async with file_service.tiering_service.hot(export_db, stream_file):
+                async for rows in file_service.iter_export_rows(export_db, stream_file, selected, sort_by, order == "desc"):
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+
+    filename = f"{os.path.splitext(os.path.basename(file.original_name))[0]}.csv".replace('"', "")
+    return StreamingResponse(
+        stream_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/{file_id}/search", dependencies=[Depends(admit("reads"))])
+async def search_file_rows(
+    file_id: UUID,
+    q: str = Query(..., min_length=1, description="Words to find; every word must match"),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    prefix: bool = Query(True, description="Match words starting with each query word"),
+    fuzzy: bool = Query(False, description="Also match words within a small edit distance"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Full-text search over the file's text columns, best matches first"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if not await file_service.search_index_current(db, file):
+        raise HTTPException(
+            status_code=409,
+            detail="Search index is missing or out of date; run POST /files/{file_id}/search/reindex"
+        )
+    skip = (page - 1) * limit
+    async with file_service.tiering_service.hot(db, file):
+        try:
+            result = await file_service.search_service.search(db, file_id, q, skip, limit, prefix, fuzzy)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return {"file_id": file_id, **result}
+
+@router.post("/{file_id}/search/reindex", dependencies=[Depends(admit("ingest"))])
+async def reindex_file_search(
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rebuild the file's search index from its stored rows"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    await file_service.rebuild_search_index(db, file)
+    await db.commit()
+    return {"file_id": file_id, "indexed_rows": file.row_count or 0}
+
+@router.delete("/{file_id}", dependencies=[Depends(admit("ingest"))])
 async def delete_file(
     file_id: UUID,
     db: AsyncSession = Depends(get_async_db)
@@ -149,7 +733,58 @@ async def delete_file(
     
     return {"message": "File deleted successfully"}
 
-@router.post("/{file_id}/analyze")
+async def _current_scan(db: AsyncSession, file) -> dict:
+    """The file's anomaly scan, scanning now if the post-ingest scan hasn't
+    covered its rows yet. That scan is ingest work, so it takes an ingest
+    slot; when ingest is saturated the caller gets a 429/503 with
+    Retry-After and can simply try again."""
+    scan = anomaly_service.current_scan(file)
+    if scan is None:
+        async with admitted("ingest"):
+            scan = await anomaly_service.ensure_scan(db, file)
+    return scan
+
+@router.get("/{file_id}/anomalies", dependencies=[Depends(admit("reads"))])
+async def get_file_anomalies(
+    file_id: UUID,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=100),
+    kind: Optional[str] = Query(None, description="robust_zscore, iqr, duplicate or level_shift"),
+    column: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get rows flagged by the local anomaly scan. Scans run after ingest
+    or on POST /anomalies/scan; if neither has covered every row yet, this
+    scans first."""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    scan = await _current_scan(db, file)
+    skip = (page - 1) * limit
+    async with file_service.tiering_service.hot(db, file):
+        result = await anomaly_service.get_anomalies(db, file_id, skip, limit, kind, column)
+
+    return {
+        "file_id": file_id,
+        "summary": scan,
+        **result
+    }
+
+@router.post("/{file_id}/anomalies/scan", dependencies=[Depends(admit("ingest"))])
+async def scan_file_anomalies(
+    file_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rescan the full file for anomalies"""
+    file = await file_service.get_file_by_id(db, file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    scan = await anomaly_service.scan(db, file)
+    return {"file_id": file_id, "summary": scan}
+
+@router.post("/{file_id}/analyze", dependencies=[Depends(admit("ai"))])
 async def analyze_file_data(
     file_id: UUID,
     query: str = Query(None, description="Optional custom analysis query"),
@@ -157,28 +792,44 @@ async def analyze_file_data(
 ):
     """Analyze file data using AI"""
     try:
-        # Get file data (first 100 rows for analysis)
-        result = await file_service.get_file_data(db, file_id, skip=0, limit=100)
-        data = result["data"]
+        file = await file_service.get_file_by_id(db, file_id)
+        if not file:
+            raise ValueError("File not found")
         
-        if not data:
+        if not file.row_count:
             raise HTTPException(status_code=400, detail="No data available for analysis")
         
+        # Send the AI a profile of the whole file (stats + pre-computed
+        # anomalies) instead of the first rows
+        scan = await _current_scan(db, file)
+        async with file_service.tiering_service.hot(db, file):
+            stats = await file_service.get_column_stats(db, file_id)
+            top = await anomaly_service.get_anomalies(db, file_id, limit=settings.ANOMALY_PROMPT_LIMIT)
+        profile = {
+            "row_count": file.row_count,
+            "columns": {column: column_stats.summary() for column, column_stats in stats.items()},
+            "anomaly_summary": scan,
+            "anomalies": top["anomalies"]
+        }
+        
         # Analyze with OpenRouter
-        analysis = await openrouter_service.analyze_data(data, query)
+        analysis = await openrouter_service.analyze_profile(profile, query)
         
         return {
             "file_id": file_id,
             "analysis": analysis,
-            "rows_analyzed": len(data)
+            "rows_analyzed": file.row_count,
+            "anomalies_found": scan.get("found", 0)
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{file_id}/chart-suggestions")
+@router.get("/{file_id}/chart-suggestions", dependencies=[Depends(admit("ai"))])
 async def get_chart_suggestions(
     file_id: UUID,
     db: AsyncSession = Depends(get_async_db)
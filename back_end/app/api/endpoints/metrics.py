@@ -0,0 +1,39 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db, database_metrics
+from app.services.file_service import file_service
+from app.services.tiering_service import tiering_metrics
+from app.utils.admission import admission_metrics
+from app.utils.profiling import profile_store
+from app.utils.security import require_admin
+from app.utils.shared_state import shared_state
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("/")
+async def get_metrics(db: AsyncSession = Depends(get_async_db)):
+    """Runtime metrics for this worker"""
+    return {
+        "worker": {"pid": os.getpid(), "shared_backend": shared_state.name},
+        "admission": admission_metrics(),
+        "database": database_metrics(),
+        "tiering": {
+            **tiering_metrics(),
+            "last_pass_any_worker": await shared_state.get("tiering:last_pass"),
+            "storage": await file_service.tiering_service.storage_summary(db)
+        }
+    }
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Stored request profiles, newest first"""
+    return {"profiles": profile_store.list()}
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str):
+    """One request profile: call tree/stats and SQL timings"""
+    report = profile_store.get(profile_id)
+    if not report:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
@@ -12,14 +12,33 @@ class Settings(BaseSettings):
     APP_HOST: str = os.getenv("APP_HOST", "0.0.0.0")
     APP_PORT: int = int(os.getenv("APP_PORT", 8000))
     
+    # Serving (python -m app.serve): 0 workers = one per available CPU,
+    # capped by WORKERS_MAX and by DB_MAX_CONNECTIONS when that is set
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", 0))
+    WORKERS_MAX: int = int(os.getenv("WORKERS_MAX", 16))
+    # Connections the database accepts from this deployment (0 = don't
+    # size pools); split across workers so they can't exhaust the server
+    DB_MAX_CONNECTIONS: int = int(os.getenv("DB_MAX_CONNECTIONS", 0))
+    
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL")
     DATABASE_URL_ASYNC: str = os.getenv("DATABASE_URL_ASYNC")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 20))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 30))
+    
+    # Read Replicas (comma-separated async URLs; empty = primary only)
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    DB_REPLICA_POOL_SIZE: int = int(os.getenv("DB_REPLICA_POOL_SIZE", 20))
+    DB_REPLICA_MAX_OVERFLOW: int = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", 30))
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+    REPLICA_HEALTH_CHECK_SECONDS: float = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", 10))
+    REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS: float = float(os.getenv("REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS", 2))
     
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "change-this-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")  # operator endpoints; unset disables them
     
     # CORS
     CORS_ORIGINS: List[str] = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
@@ -28,6 +47,74 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", 50))
     ALLOWED_FILE_TYPES: List[str] = os.getenv("ALLOWED_FILE_TYPES", ".csv,.xlsx").split(",")
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
+    INGEST_INSERT_BATCH_ROWS: int = int(os.getenv("INGEST_INSERT_BATCH_ROWS", 5000))
+    
+    # Chunked (resumable) Upload
+    CHUNKED_UPLOAD_MAX_SIZE_MB: int = int(os.getenv("CHUNKED_UPLOAD_MAX_SIZE_MB", 10240))
+    UPLOAD_CHUNK_MAX_MB: int = int(os.getenv("UPLOAD_CHUNK_MAX_MB", 64))
+    
+    # Batch Upload
+    BATCH_UPLOAD_MAX_FILES: int = int(os.getenv("BATCH_UPLOAD_MAX_FILES", 100))
+    BATCH_UPLOAD_CONCURRENCY: int = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 8))
+    # Uncompressed bytes of one batch (zip members included)
+    BATCH_UPLOAD_MAX_TOTAL_MB: int = int(os.getenv("BATCH_UPLOAD_MAX_TOTAL_MB", 500))
+    
+    # Anomaly Detection
+    ANOMALY_MAX_PER_FILE: int = int(os.getenv("ANOMALY_MAX_PER_FILE", 5000))
+    ANOMALY_PROMPT_LIMIT: int = int(os.getenv("ANOMALY_PROMPT_LIMIT", 50))
+    # Rescan a file in the background after uploads and appends
+    ANOMALY_SCAN_ON_INGEST: bool = os.getenv("ANOMALY_SCAN_ON_INGEST", "true").lower() == "true"
+    # When ingest is too busy for that scan, retry this many times, backing off from Retry-After
+    ANOMALY_SCAN_RETRIES: int = int(os.getenv("ANOMALY_SCAN_RETRIES", 5))
+    
+    # Full-text Search: "auto" uses PostgreSQL tsvector when available,
+    # otherwise an inverted index file per upload
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "auto")
+    SEARCH_INDEX_CACHE_SIZE: int = int(os.getenv("SEARCH_INDEX_CACHE_SIZE", 8))
+    
+    # Computed Columns: materialized vectors kept in memory per worker, and
+    # rows fetched per step when exporting
+    COMPUTED_CACHE_SIZE: int = int(os.getenv("COMPUTED_CACHE_SIZE", 32))
+    EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", 5000))
+    
+    # Reconciliation: build-side rows held in memory before spilling to disk
+    RECONCILE_MEMORY_ROWS: int = int(os.getenv("RECONCILE_MEMORY_ROWS", 500000))
+    RECONCILE_SPILL_DIR: str = os.getenv("RECONCILE_SPILL_DIR", "")
+    
+    # Storage Tiering: compress settled raw uploads, archive rows of files
+    # nobody has read for a while (rehydrated on next read). Off by default:
+    # archiving deletes rows from file_data, so opt in per deployment
+    TIERING_ENABLED: bool = os.getenv("TIERING_ENABLED", "false").lower() == "true"
+    TIERING_INTERVAL_SECONDS: int = int(os.getenv("TIERING_INTERVAL_SECONDS", 3600))
+    TIERING_ACCESS_FLUSH_SECONDS: int = int(os.getenv("TIERING_ACCESS_FLUSH_SECONDS", 60))
+    TIERING_RAW_COMPRESS_AFTER_HOURS: float = float(os.getenv("TIERING_RAW_COMPRESS_AFTER_HOURS", 24))
+    TIERING_COLD_AFTER_DAYS: float = float(os.getenv("TIERING_COLD_AFTER_DAYS", 30))
+    TIERING_BATCH_FILES: int = int(os.getenv("TIERING_BATCH_FILES", 20))
+    TIERING_COMPRESSION_LEVEL: int = int(os.getenv("TIERING_COMPRESSION_LEVEL", 3))
+    
+    # Request Profiling: requests sending ADMIN_TOKEN in an X-Profile header
+    # or _profile query parameter, plus a random sample, are profiled
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))
+    PROFILING_MAX_REPORTS: int = int(os.getenv("PROFILING_MAX_REPORTS", 100))
+    PROFILING_TOP_FUNCTIONS: int = int(os.getenv("PROFILING_TOP_FUNCTIONS", 40))
+    PROFILING_TOP_QUERIES: int = int(os.getenv("PROFILING_TOP_QUERIES", 10))
+    PROFILING_MAX_QUERIES: int = int(os.getenv("PROFILING_MAX_QUERIES", 500))
+    PROFILING_SQL_MAX_LENGTH: int = int(os.getenv("PROFILING_SQL_MAX_LENGTH", 2000))
+    
+    # Admission Control (per endpoint class). Limits are per worker process:
+    # with N workers (WEB_CONCURRENCY, see app.serve) the deployment admits
+    # N times these numbers. Every file a batch upload ingests at once holds
+    # its own ingest slot, so one worker's ingest + reads + ai stays within
+    # its 20+30 pool.
+    ADMISSION_CONTROL_ENABLED: bool = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", 10))
+    ADMISSION_INGEST_CONCURRENCY: int = int(os.getenv("ADMISSION_INGEST_CONCURRENCY", 4))
+    ADMISSION_INGEST_QUEUE: int = int(os.getenv("ADMISSION_INGEST_QUEUE", 16))
+    ADMISSION_READS_CONCURRENCY: int = int(os.getenv("ADMISSION_READS_CONCURRENCY", 12))
+    ADMISSION_READS_QUEUE: int = int(os.getenv("ADMISSION_READS_QUEUE", 200))
+    ADMISSION_AI_CONCURRENCY: int = int(os.getenv("ADMISSION_AI_CONCURRENCY", 4))
+    ADMISSION_AI_QUEUE: int = int(os.getenv("ADMISSION_AI_QUEUE", 8))
     
     # OpenRouter AI
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY", "")
@@ -37,6 +124,12 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
     
+    # Cross-worker locks and cache: "redis", "file" (one host only) or
+    # "auto" (Redis when REDIS_URL answers, otherwise file)
+    SHARED_BACKEND: str = os.getenv("SHARED_BACKEND", "auto")
+    SHARED_KEY_PREFIX: str = os.getenv("SHARED_KEY_PREFIX", "finance:")
+    SHARED_LOCK_LEASE_SECONDS: float = float(os.getenv("SHARED_LOCK_LEASE_SECONDS", 30))
+    
     class Config:
         env_file = ".env"
 
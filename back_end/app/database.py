@@ -1,27 +1,50 @@
- 
-from sqlalchemy import create_engine
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from app.config import settings
 
-# Synchronous engine for Alembic migrations
+# Synchronous engine for Alembic migrations and startup table creation.
+# It is barely used at runtime, so don't let it hold a second full pool.
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=20,
-    max_overflow=30
+    poolclass=NullPool
 )
 
-# Asynchronous engine for FastAPI
+def _async_engine_kwargs(url: str, pool_size: int, max_overflow: int) -> Dict[str, Any]:
+    kwargs = {
+        "echo": True if settings.APP_ENV == "development" else False,
+        "pool_pre_ping": True,
+    }
+    # In-memory SQLite uses a single static connection, which takes no pool sizing
+    if not (url.startswith("sqlite") and ":memory:" in url):
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow)
+    return kwargs
+
+# Asynchronous engine for FastAPI (the primary; all writes go here)
 async_engine = create_async_engine(
     settings.DATABASE_URL_ASYNC,
-    echo=True if settings.APP_ENV == "development" else False,
-    pool_pre_ping=True,
-    pool_size=20,
-    max_overflow=30
+    **_async_engine_kwargs(settings.DATABASE_URL_ASYNC, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
 )
 
+# Read replicas for read-only endpoints, see ReplicaRouter
+replica_engines = [
+    create_async_engine(
+        url,
+        **_async_engine_kwargs(url, settings.DB_REPLICA_POOL_SIZE, settings.DB_REPLICA_MAX_OVERFLOW)
+    )
+    for url in (url.strip() for url in settings.DATABASE_REPLICA_URLS.split(","))
+    if url
+]
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 AsyncSessionLocal = sessionmaker(
     async_engine,
@@ -31,6 +54,124 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
+
+class ReplicaRouter:
+    """Picks a read replica for read-only sessions.
+
+    Replicas are health-checked every REPLICA_HEALTH_CHECK_SECONDS. One that
+    fails its check or lags more than REPLICA_MAX_LAG_SECONDS behind the
+    primary is skipped until a later check passes; with no usable replica,
+    reads go to the primary. Healthy replicas are used round-robin.
+    """
+
+    # On a PostgreSQL standby: 0 when all received WAL is replayed, otherwise
+    # the age of the last replayed transaction. Not a standby: 0.
+    PG_LAG_QUERY = text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+        "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self, engines: List[Any]):
+        self.engines = engines
+        self.state: List[Dict[str, Any]] = [
+            {"healthy": False, "lag_seconds": None, "error": None, "checked_at": None, "sessions": 0}
+            for _ in engines
+        ]
+        self._next = 0
+        self.primary_fallbacks = 0
+
+    async def check(self, position: int) -> None:
+        engine, state = self.engines[position], self.state[position]
+        try:
+            async with engine.connect() as connection:
+                if engine.dialect.name == "postgresql":
+                    lag = float(await asyncio.wait_for(
+                        connection.scalar(self.PG_LAG_QUERY), settings.REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS
+                    ))
+                else:
+                    # No replication to measure (e.g. two local SQLite files)
+                    await asyncio.wait_for(
+                        connection.execute(text("SELECT 1")), settings.REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS
+                    )
+                    lag = 0.0
+            state.update(healthy=lag <= settings.REPLICA_MAX_LAG_SECONDS, lag_seconds=lag, error=None)
+        except Exception as e:
+            state.update(healthy=False, lag_seconds=None, error=str(e)[:200])
+        state["checked_at"] = time.time()
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(position) for position in range(len(self.engines))))
+
+    async def run(self) -> None:
+        """Background loop re-checking every replica"""
+        while True:
+            await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_SECONDS)
+            await self.check_all()
+
+    def pick(self):
+        """A usable replica engine, or the primary"""
+        for _ in range(len(self.engines)):
+            position = self._next
+            self._next = (self._next + 1) % len(self.engines)
+            if self.state[position]["healthy"]:
+                self.state[position]["sessions"] += 1
+                return self.engines[position]
+        if self.engines:
+            self.primary_fallbacks += 1
+        return async_engine
+
+
+replica_router = ReplicaRouter(replica_engines)
+
+
+def _dispose_after_fork() -> None:
+    """Drop pooled connections a forked worker inherited from its parent
+    (e.g. servers that import the app before forking). close=False leaves
+    the parent's sockets alone; the child opens its own on first use."""
+    engine.dispose(close=False)
+    for pooled_engine in [async_engine] + replica_engines:
+        pooled_engine.sync_engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+async def dispose_engines() -> None:
+    """Close this worker's connections on shutdown"""
+    for pooled_engine in [async_engine] + replica_engines:
+        await pooled_engine.dispose()
+    engine.dispose()
+
+
+def _pool_metrics(engine) -> Dict[str, Any]:
+    pool = engine.pool
+    metrics = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow()
+        )
+    return metrics
+
+
+def database_metrics() -> Dict[str, Any]:
+    """Pool usage per engine plus replica health"""
+    return {
+        "primary": _pool_metrics(async_engine),
+        "replicas": [
+            {
+                "url": make_url(str(engine.url)).render_as_string(hide_password=True),
+                **_pool_metrics(engine),
+                **state
+            }
+            for engine, state in zip(replica_router.engines, replica_router.state)
+        ],
+        "primary_fallbacks": replica_router.primary_fallbacks
+    }
+
 def get_db():
     """Dependency for synchronous database sessions"""
     db = SessionLocal()
@@ -45,4 +186,27 @@ async def get_async_db():
         try:
             yield db
         finally:
-            await db.close()
\ No newline at end of file
+            await db.close()
+
+async def get_async_read_db():
+    """Dependency for read-only endpoints: a replica session when a healthy
+    one is available, otherwise a primary session. Replica reads may be up
+    to REPLICA_MAX_LAG_SECONDS stale."""
+    async with AsyncSession(replica_router.pick(), expire_on_commit=False) as db:
+        try:
+            yield db
+        finally:
+            await db.close()
+
+def is_replica_session(db: AsyncSession) -> bool:
+    return db.bind is not async_engine
+
+@asynccontextmanager
+async def primary_session(db: AsyncSession, needed: bool = True):
+    """Yield `db`, or a fresh primary session when `needed` and `db` reads
+    from a replica (for requests that must write, or read their own writes)"""
+    if not needed or not is_replica_session(db):
+        yield db
+        return
+    async with AsyncSessionLocal() as primary_db:
+        yield primary_db
\ No newline at end of file
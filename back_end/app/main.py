@@ -1,11 +1,17 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
-import uvicorn
 from app.config import settings
-from app.api.endpoints import files, ai_insights
-from app.database import engine, Base
+from app.api.endpoints import files, ai_insights, analytics, metrics
+from app.database import engine, async_engine, replica_engines, replica_router, dispose_engines, Base
+from app.services.file_service import file_service
+from app.services.openrouter_service import open_client, close_client
+from app.utils.shared_state import shared_state
+from app.utils.profiling import ProfilingMiddleware, install_sql_timing
 import logging
 
 # Configure logging
@@ -15,8 +21,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Runs once per worker process: everything holding connections or
+    background tasks is created here, never at import time"""
+    logger.info(f"Starting {settings.APP_NAME} in {settings.APP_ENV} mode (pid {os.getpid()})")
+    
+    # Cross-worker locks/cache (Redis, or file locks on a single host)
+    await shared_state.start()
+    logger.info(f"Shared state backend: {shared_state.name}")
+    
+    # Create database tables; workers start together, so one at a time
+    async with shared_state.lock("startup-create-tables"):
+        await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+    logger.info("Database tables created/verified")
+    
+    # Create uploads directory
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    logger.info(f"Upload directory ready: {settings.UPLOAD_DIR}")
+    
+    await open_client()
+    
+    if settings.PROFILING_ENABLED:
+        # Replicas too, or profiles of replica-served reads show no SQL
+        install_sql_timing(async_engine.sync_engine, engine, *(replica.sync_engine for replica in replica_engines))
+        logger.info("Request profiling enabled")
+    
+    tasks = []
+    # Read replicas: check before serving, then keep checking
+    if replica_router.engines:
+        await replica_router.check_all()
+        tasks.append(asyncio.create_task(replica_router.run()))
+        logger.info(f"Read replicas: {sum(state['healthy'] for state in replica_router.state)}/{len(replica_router.engines)} healthy")
+    
+    # Background storage tiering (compression + cold row archives); each
+    # worker runs the loop, passes are claimed through shared_state
+    if settings.TIERING_ENABLED:
+        tasks.append(asyncio.create_task(file_service.tiering_service.run()))
+        logger.info("Storage tiering enabled")
+    
+    yield
+    
+    logger.info("Shutting down application")
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_client()
+    await shared_state.close()
+    await dispose_engines()
+
 # Create FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.APP_NAME,
     description="Financial Data Analysis Backend with AI Insights",
     version="1.0.0",
@@ -36,6 +92,9 @@ app.add_middleware(
 # Add GZip compression
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+# Opt-in request profiling (outermost, so it times the whole stack)
+app.add_middleware(ProfilingMiddleware)
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -57,31 +116,9 @@ async def health_check():
 # Include routers
 app.include_router(files.router, prefix="/api")
 app.include_router(ai_insights.router, prefix="/api")
-
-# Startup event - create tables
-@app.on_event("startup")
-async def startup_event():
-    logger.info(f"Starting {settings.APP_NAME} in {settings.APP_ENV} mode")
-    
-    # Create database tables
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created/verified")
-    
-    # Create uploads directory
-    import os
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-    logger.info(f"Upload directory ready: {settings.UPLOAD_DIR}")
-
-# Shutdown event
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Shutting down application")
+app.include_router(analytics.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.APP_HOST,
-        port=settings.APP_PORT,
-        reload=settings.APP_ENV == "development",
-        log_level="info"
-    )
+    from app.serve import main
+    main()
@@ -1,9 +1,21 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, JSON, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Column, String, Integer, Float, DateTime, JSON, Text, UniqueConstraint, Index, cast, func, literal_column
+)
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from app.database import Base
 
+# Full-text search vector over every string value of a row (PostgreSQL).
+# Queries must use the same expression for the GIN index below to apply.
+SEARCH_TS_CONFIG = literal_column("'simple'::regconfig")
+SEARCH_STRING_FILTER = literal_column("'[\"string\"]'::jsonb")
+
+
+def search_vector(data):
+    return func.jsonb_to_tsvector(SEARCH_TS_CONFIG, cast(data, JSONB), SEARCH_STRING_FILTER)
+
+
 class File(Base):
     __tablename__ = "files"
     
@@ -17,6 +29,10 @@ class File(Base):
     column_count = Column(Integer, default=0)
     columns = Column(JSON, default=list)
     file_metadata = Column("metadata", JSON, default=dict)  # ✅ Column named "metadata" in DB
+    status = Column(String(20), nullable=False, default="ready", server_default="ready", index=True)  # uploading / ready
+    storage_tier = Column(String(20), nullable=False, default="hot", server_default="hot", index=True)  # hot / cold
+    raw_tier = Column(String(20), nullable=False, default="raw", server_default="raw", index=True)  # raw / compressed
+    last_accessed_at = Column(DateTime)  # last time rows were read, see TieringService
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -32,5 +48,70 @@ class FileData(Base):
     data = Column(JSON, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Same as migration 005, so create_all builds it too. SQLite has no
+    # tsvector, so it is PostgreSQL only.
+    __table_args__ = (
+        Index("ix_file_data_search", search_vector(data), postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    
+    def __repr__(self):
+        return f"<FileData {self.file_id} row {self.row_index}>"
+
+class FileColumnStats(Base):
+    __tablename__ = "file_column_stats"
+    __table_args__ = (
+        UniqueConstraint("file_id", "column_name", name="uq_file_column_stats_file_column"),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    column_name = Column(String(255), nullable=False)
+    stats = Column(JSON, nullable=False)  # ColumnStats.to_dict()
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<FileColumnStats {self.file_id} {self.column_name}>"
+
+
+class FileRollup(Base):
+    __tablename__ = "file_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "file_id", "value_column", "granularity", "period_start",
+            name="uq_file_rollups_period"
+        ),
+    )
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    value_column = Column(String(255), nullable=False)
+    granularity = Column(String(10), nullable=False)  # day / week / month
+    period_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    sum = Column(Float, nullable=False, default=0.0)
+    min = Column(Float)
+    max = Column(Float)
+    open = Column(Float)
+    close = Column(Float)
+    first_at = Column(DateTime)  # timestamp of the row `open` came from
+    last_at = Column(DateTime)   # timestamp of the row `close` came from
+    
+    def __repr__(self):
+        return f"<FileRollup {self.file_id} {self.value_column} {self.granularity} {self.period_start}>"
+
+
+class FileAnomaly(Base):
+    __tablename__ = "file_anomalies"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    row_index = Column(Integer, nullable=False)
+    column_name = Column(String(255))  # None for whole-row checks (duplicates)
+    kind = Column(String(50), nullable=False)  # robust_zscore / iqr / duplicate / level_shift
+    score = Column(Float, nullable=False)
+    value = Column(JSON)
+    detail = Column(JSON, default=dict)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
     def __repr__(self):
-        return f"<FileData {self.file_id} row {self.row_index}>"
\ No newline at end of file
+        return f"<FileAnomaly {self.file_id} row {self.row_index} {self.kind}>"
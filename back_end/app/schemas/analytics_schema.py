@@ -0,0 +1,52 @@
+from typing import List, Optional, Any, Dict
+from pydantic import BaseModel, Field
+from uuid import UUID
+
+# Cross-file Aggregate Schemas
+class AggregateRequest(BaseModel):
+    file_ids: List[UUID] = Field(..., min_length=1, max_length=5000)
+    columns: Optional[List[str]] = None
+    quantiles: List[float] = Field(default_factory=lambda: [0.5, 0.9, 0.99])
+
+class AggregateResponse(BaseModel):
+    file_ids: List[UUID]
+    missing_file_ids: List[UUID] = []
+    row_count: int
+    columns: Dict[str, Dict[str, Any]]
+    # Computed column -> files whose values aren't materialized (left out of `columns`)
+    unavailable_columns: Dict[str, List[UUID]] = {}
+    elapsed_ms: float
+
+# Time Series Schemas
+class TimeSeriesResponse(BaseModel):
+    file_id: UUID
+    time_column: str
+    column: str
+    freq: str
+    agg: str
+    source_granularity: str
+    periods_read: int
+    points: List[Dict[str, Any]]
+
+# Reconciliation Schemas
+class ReconcileSide(BaseModel):
+    file_id: UUID
+    key_columns: List[str] = Field(..., min_length=1)
+    amount_column: Optional[str] = None
+    date_column: Optional[str] = None
+
+class ReconcileRequest(BaseModel):
+    left: ReconcileSide
+    right: ReconcileSide
+    amount_tolerance: float = Field(0.0, ge=0)
+    date_tolerance_days: float = Field(0.0, ge=0)
+    limit: int = Field(100, ge=0, le=1000)
+
+class ReconcileResponse(BaseModel):
+    left_file_id: UUID
+    right_file_id: UUID
+    summary: Dict[str, Any]
+    matched: List[Dict[str, Any]]
+    mismatched: List[Dict[str, Any]]
+    unmatched_left: List[Dict[str, Any]]
+    unmatched_right: List[Dict[str, Any]]
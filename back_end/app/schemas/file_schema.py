@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import List, Optional, Any, Dict
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 from uuid import UUID
 
 class FileBase(BaseModel):
@@ -24,7 +24,17 @@ class FileInDB(FileBase):
     filename: str
     file_path: str
     mime_type: str
-    file_metadata: Dict[str, Any] = Field(default_factory=dict, alias="metadata")
+    # ORM objects expose `file_metadata` (`metadata` is SQLAlchemy's MetaData),
+    # so validate from that attribute first and serialize as "metadata"
+    file_metadata: Dict[str, Any] = Field(
+        default_factory=dict,
+        validation_alias=AliasChoices("file_metadata", "metadata"),
+        serialization_alias="metadata"
+    )
+    status: str = "ready"
+    storage_tier: str = "hot"
+    raw_tier: str = "raw"
+    last_accessed_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     
@@ -74,3 +84,49 @@ class FileListResponse(BaseModel):
     page: int
     limit: int
     total_pages: int
+
+# Batch Upload Response
+class BatchUploadItem(BaseModel):
+    filename: str
+    status: str
+    file: Optional[FileResponse] = None
+    error: Optional[str] = None
+    duration_ms: float = 0
+
+class BatchUploadResponse(BaseModel):
+    message: str
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BatchUploadItem]
+
+# Chunked Upload Schemas
+class ChunkedUploadCreate(BaseModel):
+    filename: str
+    length: int = Field(..., gt=0)
+    checksum: Optional[str] = None
+    content_type: Optional[str] = None
+
+class ChunkedUploadFinalize(BaseModel):
+    checksum: Optional[str] = None
+
+class ChunkedUploadStatus(BaseModel):
+    upload_id: str
+    file_id: UUID
+    filename: str
+    length: int
+    offset: int
+    complete: bool
+    rows_ingested: int = 0
+
+# Computed Column Schemas
+class ComputedColumnCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    expression: str = Field(..., min_length=1, max_length=2000)
+
+class ComputedColumn(BaseModel):
+    name: str
+    expression: str
+    columns: List[str]
+    created_at: str
+    preview: Optional[List[Any]] = None
@@ -0,0 +1,107 @@
+"""Production entry point: `python -m app.serve`.
+
+Runs uvicorn with one worker process per available CPU (see
+`worker_count`). Each worker builds its own engines, HTTP client and
+shared-state connection in the app lifespan, so nothing pooled is shared
+between processes. Uvicorn starts workers with spawn; servers that import
+the app and then fork (e.g. gunicorn --preload) are covered by the
+os.register_at_fork hooks in app.database and friends.
+"""
+import logging
+import math
+import os
+from typing import Dict, Tuple
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, narrowed by a cgroup CPU
+    quota when running in a container"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as quota_file, \
+                    open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period_file:
+                quota, period = int(quota_file.read()), int(period_file.read())
+            if quota > 0:
+                cpus = min(cpus, max(1, math.ceil(quota / period)))
+        except (OSError, ValueError):
+            pass
+    return max(1, cpus)
+
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY when set, otherwise one worker per CPU. Workers are
+    async, so more than one per core only adds contention on the CPU-bound
+    pandas work."""
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    return max(1, min(available_cpus(), settings.WORKERS_MAX))
+
+
+def pool_sizes(workers: int) -> Tuple[int, int]:
+    """Per-worker (pool_size, max_overflow) keeping all workers within
+    DB_MAX_CONNECTIONS (when set). A few connections are left for
+    migrations and admin sessions."""
+    pool_size, max_overflow = settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    if settings.DB_MAX_CONNECTIONS <= 0:
+        return pool_size, max_overflow
+    per_worker = max(2, (settings.DB_MAX_CONNECTIONS - 5) // workers)
+    pool_size = min(pool_size, max(1, per_worker // 2))
+    return pool_size, max(0, min(max_overflow, per_worker - pool_size))
+
+
+def worker_environment(workers: int) -> Dict[str, str]:
+    """Settings the spawned workers read from the environment"""
+    pool_size, max_overflow = pool_sizes(workers)
+    environment = {"DB_POOL_SIZE": str(pool_size), "DB_MAX_OVERFLOW": str(max_overflow)}
+    if settings.DATABASE_REPLICA_URLS and settings.DB_MAX_CONNECTIONS > 0:
+        # Replicas usually share the primary's connection limit
+        environment["DB_REPLICA_POOL_SIZE"] = str(min(settings.DB_REPLICA_POOL_SIZE, pool_size))
+        environment["DB_REPLICA_MAX_OVERFLOW"] = str(min(settings.DB_REPLICA_MAX_OVERFLOW, max_overflow))
+    return environment
+
+
+def main() -> None:
+    if settings.APP_ENV == "development":
+        uvicorn.run(
+            "app.main:app",
+            host=settings.APP_HOST,
+            port=settings.APP_PORT,
+            reload=True,
+            log_level="info"
+        )
+        return
+
+    workers = worker_count()
+    environment = worker_environment(workers)
+    os.environ.update(environment)
+    logging.basicConfig(level=logging.INFO)
+    logger.info(
+        f"Serving with {workers} worker(s) on {available_cpus()} CPU(s), "
+        f"pool {environment['DB_POOL_SIZE']}+{environment['DB_MAX_OVERFLOW']} per worker"
+    )
+    uvicorn.run(
+        "app.main:app",
+        host=settings.APP_HOST,
+        port=settings.APP_PORT,
+        workers=workers,
+        log_level="info",
+        proxy_headers=True
+    )
+
+
+if __name__ == "__main__":
+    main()
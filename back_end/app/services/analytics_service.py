@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import List, Dict, Any, Optional
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.models.file_model import File, FileColumnStats
+from app.services.column_stats import ColumnStats
+
+class AnalyticsService:
+    """Answers aggregate questions from stored sketches, never from file_data.
+    Computed columns are summarized from the stats cached with their values;
+    ones not materialized for a file's current rows are reported as
+    unavailable rather than computed here (POST
+    /files/{file_id}/computed-columns/materialize computes them)."""
+
+    def __init__(self, computed_column_service=None):
+        self.computed_column_service = computed_column_service
+
+    async def aggregate(
+        self,
+        db: AsyncSession,
+        file_ids: List[UUID],
+        columns: Optional[List[str]] = None,
+        quantiles: List[float] = (0.5, 0.9, 0.99)
+    ) -> Dict[str, Any]:
+        """Merge per-file column sketches into totals across `file_ids`"""
+        started = time.perf_counter()
+        file_ids = list(dict.fromkeys(file_ids))
+
+        result = await db.execute(
+            select(File).where(File.id.in_(file_ids), File.status == "ready")
+        )
+        files = result.scalars().all()
+        found = {file.id: file.row_count or 0 for file in files}
+
+        query = select(FileColumnStats.column_name, FileColumnStats.stats).where(
+            FileColumnStats.file_id.in_(list(found))
+        )
+        if columns:
+            query = query.where(FileColumnStats.column_name.in_(columns))
+        rows = (await db.execute(query)).all()
+        unavailable: Dict[str, List[UUID]] = {}
+        if self.computed_column_service is not None:
+            computed, unavailable = await self._computed_rows(files, columns)
+            rows += computed
+
+        merged = await asyncio.to_thread(self._merge, rows, list(quantiles))
+
+        return {
+            "file_ids": list(found),
+            "missing_file_ids": [file_id for file_id in file_ids if file_id not in found],
+            "row_count": sum(found.values()),
+            "columns": merged,
+            "unavailable_columns": unavailable,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+
+    async def _computed_rows(self, files: List[File], columns: Optional[List[str]]):
+        """(column_name, stats) of the files' materialized computed columns,
+        and per computed column the files it isn't materialized for"""
+        rows, unavailable = [], {}
+        for file in files:
+            stats, missing = await self.computed_column_service.cached_column_stats(file)
+            rows += [
+                (name, column_stats.to_dict()) for name, column_stats in stats.items()
+                if not columns or name in columns
+            ]
+            for name in missing:
+                if not columns or name in columns:
+                    unavailable.setdefault(name, []).append(file.id)
+        return rows, unavailable
+
+    @staticmethod
+    def _merge(rows, quantiles: List[float]) -> Dict[str, Dict[str, Any]]:
+        totals: Dict[str, ColumnStats] = {}
+        for column_name, stats in rows:
+            stats = ColumnStats.from_dict(stats)
+            totals[column_name] = totals[column_name].merge(stats) if column_name in totals else stats
+        return {column: stats.summary(quantiles) for column, stats in totals.items()}
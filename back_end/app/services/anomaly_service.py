@@ -0,0 +1,481 @@
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.file_model import File, FileAnomaly, FileData
+from app.services.column_stats import ColumnStats, QuantileSketch, build_column_stats
+from app.services.timeseries_service import parse_times
+from app.utils.shared_state import shared_state
+
+ROBUST_Z_THRESHOLD = 3.5
+IQR_MULTIPLIER = 3.0
+LEVEL_SHIFT_THRESHOLD = 5.0
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def severity(statistic: float, threshold: float) -> float:
+    """Put every kind of anomaly on one 0..1 scale: 0 at the kind's own
+    threshold, approaching 1 as the statistic grows past it. Without this a
+    duplicate group of 4 would rank next to a z-score of 4."""
+    statistic = abs(float(statistic))
+    return 1.0 - threshold / statistic if statistic > threshold else 0.0
+
+
+def _time_runs(times: np.ndarray, last_time: Optional[int]) -> List[Tuple[int, int, bool]]:
+    """Split int64 timestamps into ascending runs: (start, end, new_run).
+
+    Rows are sorted by time within each ingest batch only (see
+    TimeSeriesService), so a file is a sequence of sorted runs. The first
+    run continues the previous frame's unless time went backwards.
+    """
+    if not len(times):
+        return []
+    breaks = np.flatnonzero(np.diff(times) < 0) + 1
+    bounds = [0, *breaks.tolist(), len(times)]
+    first_is_new = last_time is None or times[0] < last_time
+    return [
+        (start, end, index > 0 or first_is_new)
+        for index, (start, end) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+
+class _TopAnomalies:
+    """The highest-scoring anomalies seen so far (bounded), plus counts of
+    everything found"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.found: Dict[str, int] = {}
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = 0
+
+    def add(self, anomaly: Dict[str, Any]) -> None:
+        self.found[anomaly["kind"]] = self.found.get(anomaly["kind"], 0) + 1
+        if self.limit <= 0:
+            return
+        # Earlier anomalies win ties, so results don't depend on frame size
+        self._sequence += 1
+        item = (anomaly["score"], -self._sequence, anomaly)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def results(self) -> List[Dict[str, Any]]:
+        return [item[2] for item in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
+class _LevelShiftScanner:
+    """Level shifts of one numeric column, fed frame by frame in stored order.
+
+    Each time-sorted run is scanned on its own. Between frames only the last
+    few windows of the current run are kept: a position is decided once the
+    2 * window values after it have arrived, and deciding it needs the
+    2 * window values before it.
+    """
+
+    def __init__(self, column: str, window: int, noise: float, sink: _TopAnomalies):
+        self.column = column
+        self.window = window
+        self.noise = noise
+        self.sink = sink
+        self.last_time: Optional[int] = None
+        self._values = np.empty(0)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._decided = 0
+
+    def feed(self, times: np.ndarray, values: np.ndarray, rows: np.ndarray) -> None:
+        for start, end, new_run in _time_runs(times, self.last_time):
+            if new_run:
+                self.finish()
+            self._values = np.concatenate([self._values, values[start:end]])
+            self._rows = np.concatenate([self._rows, rows[start:end]])
+            self._scan(final=False)
+        if len(times):
+            self.last_time = int(times[-1])
+
+    def finish(self) -> None:
+        """Decide the rest of the current run"""
+        self._scan(final=True)
+        self._values = np.empty(0)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._decided = 0
+
+    def _scan(self, final: bool) -> None:
+        window, count = self.window, len(self._values)
+        limit = count if final else count - 2 * window
+        if limit > self._decided:
+            rolling = pd.Series(self._values).rolling(window).median()
+            before = rolling.shift(1)
+            after = rolling.shift(-(window - 1))
+            shift = ((after - before) / self.noise).abs()
+            peaks = (shift > LEVEL_SHIFT_THRESHOLD) & (
+                shift == shift.rolling(2 * window + 1, center=True, min_periods=1).max()
+            )
+            for position in np.flatnonzero(peaks.to_numpy()[self._decided:limit]) + self._decided:
+                self.sink.add({
+                    "row_index": int(self._rows[position]),
+                    "column_name": self.column,
+                    "kind": "level_shift",
+                    "score": severity(shift.iloc[position], LEVEL_SHIFT_THRESHOLD),
+                    "value": _json_value(self._values[position]),
+                    "detail": {
+                        "shift": float(shift.iloc[position]),
+                        "median_before": float(before.iloc[position]),
+                        "median_after": float(after.iloc[position]),
+                        "window": window
+                    }
+                })
+            self._decided = limit
+        if not final:
+            keep_from = max(0, self._decided - 2 * window)
+            self._values = self._values[keep_from:]
+            self._rows = self._rows[keep_from:]
+            self._decided -= keep_from
+
+
+class AnomalyScan:
+    """Streaming anomaly detection over a file, one frame at a time.
+
+    Checks:
+    - robust z-score: |0.6745 * (x - median) / MAD| above 3.5
+    - IQR fences: outside Q1 - 3*IQR .. Q3 + 3*IQR
+    - duplicate transactions: rows identical in every column
+    - level shifts (time series only): the median of the next window differs
+      from the median of the previous window by more than 5x the noise
+      level (estimated from successive differences, so the shift itself
+      doesn't inflate it)
+
+    Median and quartiles come from the column stats sketches. Frames are
+    read twice: `observe` builds the MAD and noise sketches and a 64-bit
+    hash per row for duplicates, `detect` flags rows. Memory is the
+    sketches, 16 bytes per row for the hashes and the top `limit` anomalies;
+    no frame is kept. Scores are normalized per kind (see `severity`).
+    """
+
+    def __init__(
+        self,
+        stats: Dict[str, ColumnStats],
+        columns: List[str],
+        time_column: Optional[str] = None,
+        limit: int = 5000
+    ):
+        self.columns = columns
+        self.time_column = time_column if time_column in columns else None
+        self.top = _TopAnomalies(limit)
+        self.baselines: Dict[str, Dict[str, float]] = {}
+        for column in columns:
+            column_stats = stats.get(column)
+            if column == self.time_column or column_stats is None or not column_stats.is_numeric:
+                continue
+            if column_stats.numeric_count < 8:
+                continue
+            q1, median, q3 = column_stats.quantiles.quantiles([0.25, 0.5, 0.75])
+            self.baselines[column] = {"median": median, "q1": q1, "q3": q3, "count": column_stats.numeric_count}
+
+        self._deviations = {column: QuantileSketch() for column in self.baselines}
+        self._steps = {column: QuantileSketch() for column in self.baselines} if self.time_column else {}
+        self._last = {column: (None, None) for column in self._steps}
+        self._hashes: List[np.ndarray] = []
+        self._rows: List[np.ndarray] = []
+        self._shifts: Dict[str, _LevelShiftScanner] = {}
+
+    def _numeric(self, frame: pd.DataFrame) -> Dict[str, pd.Series]:
+        return {
+            column: pd.to_numeric(frame[column], errors="coerce").astype(float)
+            for column in self.baselines if column in frame
+        }
+
+    def _times(self, frame: pd.DataFrame) -> pd.Series:
+        return parse_times(frame[self.time_column]) if self.time_column in frame else pd.Series(pd.NaT, index=frame.index)
+
+    def observe(self, frame: pd.DataFrame) -> None:
+        """First pass over a frame"""
+        frame = frame.reindex(columns=self.columns)
+        self._hashes.append(pd.util.hash_pandas_object(frame.astype(str), index=False).to_numpy())
+        self._rows.append(frame.index.to_numpy(dtype=np.int64))
+
+        numeric = self._numeric(frame)
+        for column, values in numeric.items():
+            self._deviations[column].update((values - self.baselines[column]["median"]).abs().to_numpy())
+
+        if self._steps:
+            times = self._times(frame)
+            for column in self._steps:
+                present = numeric[column].notna() & times.notna()
+                stamps = times[present].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+                values = numeric[column][present].to_numpy()
+                last_time, last_value = self._last[column]
+                for start, end, new_run in _time_runs(stamps, last_time):
+                    run = values[start:end]
+                    if not new_run and last_value is not None:
+                        run = np.concatenate([[last_value], run])
+                    self._steps[column].update(np.abs(np.diff(run)))
+                if len(stamps):
+                    self._last[column] = (int(stamps[-1]), float(values[-1]))
+
+    def prepare(self) -> None:
+        """Finish the statistics of the first pass and flag duplicates"""
+        for column, baseline in self.baselines.items():
+            baseline["mad"] = self._deviations[column].quantiles([0.5])[0] or 0.0
+            baseline["iqr"] = baseline["q3"] - baseline["q1"]
+
+        for column, steps in self._steps.items():
+            count = self.baselines[column]["count"]
+            window = max(5, min(50, count // 20))
+            noise = (steps.quantiles([0.5])[0] or 0.0) / (0.6745 * np.sqrt(2))
+            if count >= window * 4 and noise > 0:
+                self._shifts[column] = _LevelShiftScanner(column, window, noise, self.top)
+
+        if not self._hashes:
+            return
+        hashes, rows = np.concatenate(self._hashes), np.concatenate(self._rows)
+        self._hashes, self._rows = [], []
+        keys, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        first_rows = np.full(len(keys), np.iinfo(np.int64).max)
+        np.minimum.at(first_rows, inverse, rows)
+        for position in np.flatnonzero(counts[inverse] > 1):
+            group = inverse[position]
+            self.top.add({
+                "row_index": int(rows[position]),
+                "column_name": None,
+                "kind": "duplicate",
+                "score": severity(counts[group], 1),
+                "value": None,
+                "detail": {"group_size": int(counts[group]), "first_row_index": int(first_rows[group])}
+            })
+
+    def detect(self, frame: pd.DataFrame) -> None:
+        """Second pass over a frame"""
+        frame = frame.reindex(columns=self.columns)
+        numeric = self._numeric(frame)
+        for column, values in numeric.items():
+            baseline = self.baselines[column]
+            median, mad, iqr = baseline["median"], baseline["mad"], baseline["iqr"]
+            if mad > 0:
+                z = 0.6745 * (values - median) / mad
+                for row_index, score in z[z.abs() > ROBUST_Z_THRESHOLD].items():
+                    self.top.add({
+                        "row_index": int(row_index),
+                        "column_name": column,
+                        "kind": "robust_zscore",
+                        "score": severity(score, ROBUST_Z_THRESHOLD),
+                        "value": _json_value(values[row_index]),
+                        "detail": {"median": float(median), "mad": float(mad), "z": float(score)}
+                    })
+
+            if iqr > 0:
+                low, high = baseline["q1"] - IQR_MULTIPLIER * iqr, baseline["q3"] + IQR_MULTIPLIER * iqr
+                outside = (values < low) | (values > high)
+                distance = np.maximum(low - values, values - high) / iqr
+                for row_index, score in distance[outside].items():
+                    self.top.add({
+                        "row_index": int(row_index),
+                        "column_name": column,
+                        "kind": "iqr",
+                        # Distance from the nearer quartile, in IQRs
+                        "score": severity(IQR_MULTIPLIER + score, IQR_MULTIPLIER),
+                        "value": _json_value(values[row_index]),
+                        "detail": {
+                            "q1": float(baseline["q1"]), "q3": float(baseline["q3"]),
+                            "low": float(low), "high": float(high), "iqr_distance": float(score)
+                        }
+                    })
+
+        if self._shifts:
+            times = self._times(frame)
+            for column, scanner in self._shifts.items():
+                present = numeric[column].notna() & times.notna()
+                scanner.feed(
+                    times[present].to_numpy(dtype="datetime64[ns]").astype(np.int64),
+                    numeric[column][present].to_numpy(),
+                    frame.index[present.to_numpy()].to_numpy(dtype=np.int64)
+                )
+
+    def finish(self) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        """Counts found per kind, and the top anomalies, highest score first"""
+        for scanner in self._shifts.values():
+            scanner.finish()
+        return dict(self.top.found), self.top.results()
+
+
+def detect_anomalies(
+    df: pd.DataFrame,
+    time_column: Optional[str] = None,
+    limit: int = 5000
+) -> List[Dict[str, Any]]:
+    """Anomalies of a single in-memory frame indexed by row_index, highest
+    score first (see AnomalyScan)"""
+    scan = AnomalyScan(build_column_stats(df), [str(column) for column in df.columns], time_column, limit)
+    scan.observe(df)
+    scan.prepare()
+    scan.detect(df)
+    return scan.finish()[1]
+
+
+class AnomalyService:
+    """Runs local anomaly detection over a file's stored rows and keeps the
+    flagged rows in `file_anomalies`.
+
+    Scans run after ingest and on POST /anomalies/scan; a read only scans
+    when neither has covered the file's current rows yet. A scan's summary
+    records the row_count it covered, so readers can tell when it is
+    missing or out of date.
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+
+    @staticmethod
+    def current_scan(file: File) -> Optional[Dict[str, Any]]:
+        """The stored scan summary if it covers every row of the file"""
+        scan = (file.file_metadata or {}).get("anomaly_scan")
+        if scan and scan.get("row_count") == file.row_count:
+            return scan
+        return None
+
+    async def scan(self, db: AsyncSession, file: File) -> Dict[str, Any]:
+        """Scan the full file and replace its stored anomalies (commits)"""
+        stats = await self.file_service.get_column_stats(db, file.id)
+        if file.row_count and not stats:
+            await self.file_service.rebuild_column_stats(db, file.id)
+            stats = await self.file_service.get_column_stats(db, file.id)
+
+        time_column = (file.file_metadata or {}).get("time_column")
+        detector = AnomalyScan(stats, list(file.columns or []), time_column, settings.ANOMALY_MAX_PER_FILE)
+        async for frame in self.file_service.iter_file_frames(db, file.id):
+            await asyncio.to_thread(detector.observe, frame)
+        await asyncio.to_thread(detector.prepare)
+        async for frame in self.file_service.iter_file_frames(db, file.id):
+            await asyncio.to_thread(detector.detect, frame)
+        found, anomalies = await asyncio.to_thread(detector.finish)
+
+        await db.execute(delete(FileAnomaly).where(FileAnomaly.file_id == file.id))
+        for offset in range(0, len(anomalies), settings.INGEST_INSERT_BATCH_ROWS):
+            db.add_all([
+                FileAnomaly(file_id=file.id, **anomaly)
+                for anomaly in anomalies[offset:offset + settings.INGEST_INSERT_BATCH_ROWS]
+            ])
+
+        stored = {}
+        for anomaly in anomalies:
+            stored[anomaly["kind"]] = stored.get(anomaly["kind"], 0) + 1
+
+        metadata = dict(file.file_metadata or {})
+        metadata.pop("anomaly_scan_pending", None)
+        metadata["anomaly_scan"] = {
+            "row_count": file.row_count,
+            "found": sum(found.values()),
+            "stored": len(anomalies),
+            "by_kind": stored,
+            "found_by_kind": found,
+            "scanned_at": datetime.utcnow().isoformat()
+        }
+        file.file_metadata = metadata
+        await db.commit()
+        return metadata["anomaly_scan"]
+
+    async def ensure_scan(self, db: AsyncSession, file: File) -> Dict[str, Any]:
+        """The file's current scan, scanning first if there is none. One
+        scan per file at a time across workers; whoever waited reuses it."""
+        scan = self.current_scan(file)
+        if scan is not None:
+            return scan
+        async with shared_state.lock(f"anomaly-scan:{file.id}"):
+            await db.refresh(file)
+            return self.current_scan(file) or await self.scan(db, file)
+
+    async def rescan(self, session_factory, file_id: UUID) -> None:
+        """Scan a file in its own session unless its scan is already current
+        (for background tasks after ingest)"""
+        async with session_factory() as db:
+            file = await self.file_service.get_file_by_id(db, file_id)
+            if file and file.row_count:
+                await self.ensure_scan(db, file)
+
+    async def mark_pending(self, session_factory, file_ids: List[UUID]) -> None:
+        """Record that these files' scans were deferred (ingest was busy), so
+        the API can say a scan is on its way rather than missing"""
+        async with session_factory() as db:
+            for file_id in file_ids:
+                # Same row lock as appends, so neither overwrites the other's metadata
+                result = await db.execute(select(File).where(File.id == file_id).with_for_update())
+                file = result.scalar_one_or_none()
+                if file and self.current_scan(file) is None:
+                    metadata = dict(file.file_metadata or {})
+                    metadata["anomaly_scan_pending"] = datetime.utcnow().isoformat()
+                    file.file_metadata = metadata
+            await db.commit()
+
+    async def get_anomalies(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        skip: int = 0,
+        limit: int = 50,
+        kind: Optional[str] = None,
+        column: Optional[str] = None,
+        include_rows: bool = True
+    ) -> Dict[str, Any]:
+        """Stored anomalies, highest score first, with the flagged rows' data"""
+        filters = [FileAnomaly.file_id == file_id]
+        if kind:
+            filters.append(FileAnomaly.kind == kind)
+        if column:
+            filters.append(FileAnomaly.column_name == column)
+
+        total = await db.scalar(select(func.count(FileAnomaly.id)).where(*filters)) or 0
+        result = await db.execute(
+            select(FileAnomaly)
+            .where(*filters)
+            .order_by(FileAnomaly.score.desc(), FileAnomaly.row_index)
+            .offset(skip)
+            .limit(limit)
+        )
+        anomalies = result.scalars().all()
+
+        rows = {}
+        if include_rows and anomalies:
+            row_result = await db.execute(
+                select(FileData.row_index, FileData.data).where(
+                    FileData.file_id == file_id,
+                    FileData.row_index.in_({anomaly.row_index for anomaly in anomalies})
+                )
+            )
+            rows = {row.row_index: row.data for row in row_result.all()}
+
+        return {
+            "anomalies": [
+                {
+                    "row_index": anomaly.row_index,
+                    "column": anomaly.column_name,
+                    "kind": anomaly.kind,
+                    "score": anomaly.score,
+                    "value": anomaly.value,
+                    "detail": anomaly.detail,
+                    "row": rows.get(anomaly.row_index)
+                }
+                for anomaly in anomalies
+            ],
+            "pagination": {
+                "page": skip // limit + 1,
+                "limit": limit,
+                "total": total,
+                "pages": (total + limit - 1) // limit
+            }
+        }
@@ -0,0 +1,452 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+from uuid import UUID, uuid4
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.file_model import File, FileData, FileColumnStats
+from app.services.csv_parser import CSVParser
+from app.services.file_service import FileService
+from app.utils.shared_state import shared_state
+
+# Bytes parsed per step when ingesting a received prefix
+INGEST_WINDOW_BYTES = 16 * 1024 * 1024
+
+
+class UploadNotFound(Exception):
+    pass
+
+
+class UploadConflict(Exception):
+    """Raised when a chunk does not line up with the current upload offset"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def find_record_boundary(segment: bytes, first: bool = False) -> int:
+    """Return the end of the last (or first) complete CSV record in `segment`.
+
+    A record ends at a newline that is not inside a quoted field. Doubled
+    quotes ("") toggle the state twice, so quote-count parity is enough:
+    a newline is a record end when an even number of quotes precede it.
+    Returns 0 if the segment holds no complete record yet. Vectorized, but
+    still O(len(segment)); call it from a worker thread.
+    """
+    if b'"' not in segment:
+        return (segment.find(b"\n") if first else segment.rfind(b"\n")) + 1
+
+    data = np.frombuffer(segment, dtype=np.uint8)
+    open_quotes = np.cumsum(data == 0x22, dtype=np.int64) & 1
+    ends = np.flatnonzero((data == 0x0A) & (open_quotes == 0))
+    if not len(ends):
+        return 0
+    return int(ends[0] if first else ends[-1]) + 1
+
+
+class ChunkedUploadService:
+    """Resumable (tus-style) uploads written chunk by chunk into the upload dir.
+
+    Protocol: create an upload with its total length, PATCH chunks at the
+    current offset, then finalize to verify the sha256 checksum. Complete
+    CSV records are ingested as soon as they arrive, so by the time the last
+    chunk lands most of the file is already in `file_data`.
+
+    Upload state lives in a small JSON file next to the `.part` file so
+    uploads survive restarts. Parse progress is stored in the File record's
+    metadata and committed together with the rows it describes. The record
+    keeps status "uploading", which hides it from listings and reads, until
+    the upload is finalized.
+    """
+
+    def __init__(self, upload_dir: str, file_service: FileService):
+        self.upload_dir = upload_dir
+        self.file_service = file_service
+        # Chunk writes and prefix ingest take separate locks so parsing one
+        # part of the file never blocks the next chunk from being written.
+        # These are per worker; `_locked` adds the cross-worker lock
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        self._ingest_locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(upload_dir, exist_ok=True)
+
+    # State helpers
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{upload_id}.part")
+
+    def _state_path(self, upload_id: str) -> str:
+        return os.path.join(self.upload_dir, f"{upload_id}.upload.json")
+
+    @staticmethod
+    def _lock(locks: Dict[str, asyncio.Lock], upload_id: str) -> asyncio.Lock:
+        if upload_id not in locks:
+            locks[upload_id] = asyncio.Lock()
+        return locks[upload_id]
+
+    @asynccontextmanager
+    async def _locked(self, kind: str, upload_id: str):
+        """Hold the "write" or "ingest" lock of an upload in this worker and
+        across workers. Take "write" before "ingest" when holding both."""
+        locks = self._write_locks if kind == "write" else self._ingest_locks
+        # In-worker lock first, so waiting requests don't all poll the shared one
+        async with self._lock(locks, upload_id), shared_state.lock(f"upload:{upload_id}:{kind}"):
+            yield
+
+    def _forget_locks(self, upload_id: str) -> None:
+        self._write_locks.pop(upload_id, None)
+        self._ingest_locks.pop(upload_id, None)
+
+    def load_state(self, upload_id: str) -> Dict[str, Any]:
+        """Read upload state from disk"""
+        try:
+            UUID(upload_id)
+        except ValueError:
+            raise UploadNotFound("Upload not found")
+
+        state_path = self._state_path(upload_id)
+        if not os.path.exists(state_path):
+            raise UploadNotFound("Upload not found")
+
+        with open(state_path) as state_file:
+            return json.load(state_file)
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        state_path = self._state_path(state["upload_id"])
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, state_path)
+
+    # Protocol
+
+    async def create_upload(
+        self,
+        db: AsyncSession,
+        filename: str,
+        length: int,
+        checksum: Optional[str] = None,
+        content_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Register a new upload and reserve its File record"""
+        upload_id = str(uuid4())
+        part_path = self._part_path(upload_id)
+        open(part_path, "wb").close()
+
+        file_record = File(
+            filename=os.path.basename(part_path),
+            original_name=filename,
+            file_path=part_path,
+            file_size=length,
+            mime_type=content_type or "text/csv",
+            row_count=0,
+            column_count=0,
+            columns=[],
+            status="uploading",
+            file_metadata={
+                "field_name": filename,
+                "content_type": content_type,
+                "upload": {
+                    "upload_id": upload_id,
+                    "status": "uploading",
+                    "parsed_offset": 0
+                }
+            }
+        )
+        db.add(file_record)
+        await db.commit()
+        await db.refresh(file_record)
+
+        state = {
+            "upload_id": upload_id,
+            "file_id": str(file_record.id),
+            "filename": filename,
+            "content_type": content_type,
+            "length": length,
+            "offset": 0,
+            "checksum": self._normalize_checksum(checksum),
+            "created_at": time.time()
+        }
+        self._save_state(state)
+        return state
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks) -> Dict[str, Any]:
+        """Append a chunk streamed from `chunks` (async iterator of bytes) at `offset`"""
+        async with self._locked("write", upload_id):
+            state = self.load_state(upload_id)
+            if offset != state["offset"]:
+                raise UploadConflict(
+                    f"Offset mismatch: expected {state['offset']}, got {offset}",
+                    state["offset"]
+                )
+
+            part_file = await asyncio.to_thread(open, self._part_path(upload_id), "r+b")
+            try:
+                await asyncio.to_thread(part_file.seek, offset)
+                written = 0
+                async for piece in chunks:
+                    if offset + written + len(piece) > state["length"]:
+                        await asyncio.to_thread(part_file.truncate, offset)
+                        raise ValueError("Chunk exceeds declared upload length")
+                    await asyncio.to_thread(part_file.write, piece)
+                    written += len(piece)
+                await asyncio.to_thread(part_file.truncate, offset + written)
+            finally:
+                await asyncio.to_thread(part_file.close)
+
+            state["offset"] = offset + written
+            await asyncio.to_thread(self._save_state, state)
+            return state
+
+    async def ingest_available(self, session_factory, upload_id: str, final: bool = False) -> None:
+        """Parse and store every complete CSV record received so far.
+
+        With `final=True` the trailing record is ingested even without a
+        closing newline. Safe to call repeatedly; progress is tracked in the
+        File metadata and committed with the rows.
+        """
+        async with self._locked("ingest", upload_id):
+            state = self.load_state(upload_id)
+            async with session_factory() as db:
+                await self._ingest_prefix(db, state, final)
+
+    async def _ingest_prefix(self, db: AsyncSession, state: Dict[str, Any], final: bool) -> None:
+        file_record = await self.file_service.get_file_by_id(db, UUID(state["file_id"]), include_uploading=True)
+        if not file_record:
+            raise UploadNotFound("Upload file record not found")
+
+        part_path = self._part_path(state["upload_id"])
+        window = INGEST_WINDOW_BYTES
+
+        while True:
+            metadata = dict(file_record.file_metadata or {})
+            progress = dict(metadata.get("upload", {}))
+            parsed_offset = progress.get("parsed_offset", 0)
+            if parsed_offset >= state["offset"]:
+                return
+
+            end = min(state["offset"], parsed_offset + window)
+            segment = await asyncio.to_thread(self._read_range, part_path, parsed_offset, end)
+            is_tail = final and end == state["length"]
+            boundary = len(segment) if is_tail else await asyncio.to_thread(find_record_boundary, segment)
+            if boundary == 0:
+                if end == state["offset"]:
+                    return
+                # A single record is larger than the window, widen it
+                window *= 2
+                continue
+            segment = segment[:boundary]
+
+            columns = list(file_record.columns or [])
+            if not columns:
+                header_end = await asyncio.to_thread(find_record_boundary, segment, True) or len(segment)
+                columns = self._parse_header(segment[:header_end])
+                segment = segment[header_end:]
+                file_record.columns = columns
+                file_record.column_count = len(columns)
+
+            # Types inferred from the first rows are pinned for the rest of the
+            # upload, so a column can't turn from numbers into text mid-file
+            dtypes = dict(progress.get("dtypes", {}))
+            df = await asyncio.to_thread(self._parse_records, segment, columns, dtypes)
+            for column, kind in self._dtype_kinds(df).items():
+                dtypes.setdefault(column, kind)
+            progress["dtypes"] = dtypes
+            data = []
+            segment = None
+            if not df.empty:
+                # Rows are sorted by time within each segment; reads fall back
+                # to a time-ordered permutation if segments overlap in time
+                df = await self.file_service.prepare_frame(file_record, df)
+                data = await asyncio.to_thread(CSVParser.frame_to_records, df)
+                start_index = file_record.row_count or 0
+                await self.file_service.insert_rows(db, file_record.id, data, start_index=start_index)
+                segment = await self.file_service.index_rows(db, file_record, df, start_index=start_index)
+
+            progress["parsed_offset"] = parsed_offset + boundary
+            metadata = dict(file_record.file_metadata or {})
+            metadata["upload"] = progress
+            file_record.row_count = (file_record.row_count or 0) + len(data)
+            file_record.file_metadata = metadata
+            await db.commit()
+            # Only rows that made it into the database are searchable
+            if segment is not None:
+                await self.file_service.search_service.add_segment(file_record.id, segment)
+
+    async def finalize(
+        self,
+        session_factory,
+        upload_id: str,
+        checksum: Optional[str] = None
+    ) -> File:
+        """Verify the checksum, ingest the tail and publish the file"""
+        state = self.load_state(upload_id)
+        if state["offset"] != state["length"]:
+            raise UploadConflict(
+                f"Upload incomplete: {state['offset']} of {state['length']} bytes received",
+                state["offset"]
+            )
+
+        expected = self._normalize_checksum(checksum) or state.get("checksum")
+        part_path = self._part_path(upload_id)
+        actual = await asyncio.to_thread(self._sha256, part_path)
+        if expected and expected != actual:
+            await self.abort(session_factory, upload_id)
+            raise ValueError(f"Checksum mismatch: expected {expected}, got {actual}")
+
+        await self.ingest_available(session_factory, upload_id, final=True)
+
+        async with self._locked("ingest", upload_id):
+            # Another worker may have finalized or aborted it meanwhile
+            state = self.load_state(upload_id)
+            async with session_factory() as db:
+                file_record = await self.file_service.get_file_by_id(
+                    db, UUID(state["file_id"]), include_uploading=True
+                )
+                if not file_record:
+                    raise UploadNotFound("Upload file record not found")
+                if not file_record.row_count:
+                    await self._discard(db, state)
+                    raise ValueError("CSV file contains no data rows")
+
+                final_name = f"{int(time.time() * 1000)}_{upload_id[:8]}_{os.path.basename(state['filename'])}"
+                final_path = os.path.join(self.upload_dir, final_name)
+                os.replace(part_path, final_path)
+
+                metadata = dict(file_record.file_metadata or {})
+                metadata["upload"] = {**metadata.get("upload", {}), "status": "completed", "sha256": actual}
+                file_record.filename = final_name
+                file_record.file_path = final_path
+                file_record.file_size = state["length"]
+                file_record.file_metadata = metadata
+                file_record.status = "ready"
+                await db.commit()
+                await db.refresh(file_record)
+
+            os.remove(self._state_path(upload_id))
+        self._forget_locks(upload_id)
+
+        return file_record
+
+    async def abort(self, session_factory, upload_id: str) -> None:
+        """Drop an upload, its partial data and any rows ingested so far"""
+        async with self._locked("write", upload_id), self._locked("ingest", upload_id):
+            state = self.load_state(upload_id)
+            async with session_factory() as db:
+                await self._discard(db, state)
+        self._forget_locks(upload_id)
+
+    async def _discard(self, db: AsyncSession, state: Dict[str, Any]) -> None:
+        file_id = UUID(state["file_id"])
+        await db.execute(delete(FileData).where(FileData.file_id == file_id))
+        await db.execute(delete(FileColumnStats).where(FileColumnStats.file_id == file_id))
+        await self.file_service.timeseries_service.delete_rollups(db, file_id)
+        await db.execute(delete(File).where(File.id == file_id))
+        await db.commit()
+        self.file_service.search_service.delete_index(file_id)
+
+        for path in (self._part_path(state["upload_id"]), self._state_path(state["upload_id"])):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Blocking helpers (run in worker threads)
+
+    @staticmethod
+    def _normalize_checksum(checksum: Optional[str]) -> Optional[str]:
+        if not checksum:
+            return None
+        checksum = checksum.strip().lower()
+        if checksum.startswith("sha256:"):
+            checksum = checksum[len("sha256:"):]
+        return checksum
+
+    @staticmethod
+    def _read_range(path: str, start: int, end: int) -> bytes:
+        with open(path, "rb") as part_file:
+            part_file.seek(start)
+            return part_file.read(end - start)
+
+    @staticmethod
+    def _sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as part_file:
+            for block in iter(lambda: part_file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _parse_header(segment: bytes) -> List[str]:
+        text = segment.decode("utf-8-sig")
+        header = next(csv.reader(io.StringIO(text)), [])
+        if not header:
+            raise ValueError("No columns found in CSV file")
+        return [str(column) for column in header]
+
+    @staticmethod
+    def _dtype_kinds(df: pd.DataFrame) -> Dict[str, str]:
+        """bool / int / float / str per column; all-empty columns are left
+        out so a later segment can decide them"""
+        kinds = {}
+        for column in df.columns:
+            values = df[column]
+            if not values.notna().any():
+                continue
+            if pd.api.types.is_bool_dtype(values):
+                kinds[column] = "bool"
+            elif pd.api.types.is_integer_dtype(values):
+                kinds[column] = "int"
+            elif pd.api.types.is_float_dtype(values):
+                kinds[column] = "float"
+            else:
+                kinds[column] = "str"
+        return kinds
+
+    @staticmethod
+    def _pin(values: pd.Series, kind: str) -> pd.Series:
+        """Convert a column to its pinned kind. Values that don't fit keep
+        their text rather than being dropped."""
+        if kind == "str":
+            return values
+        if kind == "bool":
+            converted = values.str.lower().map({"true": True, "false": False})
+        else:
+            converted = pd.to_numeric(values, errors="coerce")
+            present = converted.dropna()
+            if kind == "int" and (present % 1 == 0).all():
+                converted = converted.astype("Int64")
+        misfits = values.notna() & converted.isna()
+        if misfits.any():
+            return converted.astype(object).where(~misfits, values)
+        return converted
+
+    @classmethod
+    def _parse_records(
+        cls,
+        segment: bytes,
+        columns: List[str],
+        dtypes: Optional[Dict[str, str]] = None
+    ) -> pd.DataFrame:
+        if not segment.strip():
+            return pd.DataFrame(columns=columns)
+        dtypes = {column: kind for column, kind in (dtypes or {}).items() if column in columns}
+        # Pinned columns are read as text and converted afterwards, so pandas
+        # doesn't infer them again for this segment
+        df = pd.read_csv(
+            io.BytesIO(segment),
+            header=None,
+            names=columns,
+            dtype={column: str for column in dtypes}
+        )
+        for column, kind in dtypes.items():
+            df[column] = cls._pin(df[column], kind)
+        return df
@@ -0,0 +1,396 @@
+import asyncio
+import hashlib
+import json
+import os
+import weakref
+from collections import OrderedDict
+from contextlib import aclosing
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.file_model import File
+from app.services.column_stats import ColumnStats
+from app.services.expressions import ChunkState, Expression, ExpressionError
+from app.services.timeseries_service import parse_times
+from app.utils.shared_state import shared_state
+
+MAX_NAME_LENGTH = 100
+PREVIEW_ROWS = 20
+
+# One lock per file so concurrent requests materialize its vectors once;
+# the shared_state lock does the same across workers
+_file_locks: "weakref.WeakValueDictionary[UUID, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _file_lock(file_id: UUID) -> asyncio.Lock:
+    lock = _file_locks.get(file_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _file_locks[file_id] = lock
+    return lock
+
+
+def normalize_values(series: pd.Series) -> pd.Series:
+    """Make an evaluated or stored column sortable and JSON friendly:
+    floats, bools or strings, with None for missing values"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime("%Y-%m-%dT%H:%M:%S").str.replace("T00:00:00", "", regex=False)
+        return text.astype(object).where(series.notna(), None)
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype(bool)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    numbers = pd.to_numeric(series, errors="coerce")
+    if series.notna().any() and numbers.notna().sum() == series.notna().sum():
+        return numbers.astype(float)
+    values = series.astype(object)
+    return values.where(values.isna(), values.astype(str)).where(values.notna(), None)
+
+
+def vector_arrays(values: pd.Series) -> Dict[str, np.ndarray]:
+    """A normalized vector as plain arrays for np.savez. Text is stored as
+    UTF-8 bytes plus offsets, so loading never needs pickle."""
+    arrays = {"row_index": values.index.to_numpy(dtype=np.int64)}
+    if values.dtype == object:
+        missing = values.isna().to_numpy()
+        encoded = [b"" if value is None else value.encode() for value in values.tolist()]
+        arrays.update(
+            kind=np.array("text"),
+            data=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            offsets=np.concatenate([[0], np.cumsum([len(value) for value in encoded], dtype=np.int64)]),
+            missing=missing
+        )
+    else:
+        arrays.update(kind=np.array("number"), values=values.to_numpy())
+    return arrays
+
+
+def vector_from_arrays(arrays) -> pd.Series:
+    index = pd.Index(arrays["row_index"], name="row_index")
+    if str(arrays["kind"]) != "text":
+        return pd.Series(arrays["values"], index=index)
+    data, offsets = arrays["data"].tobytes(), arrays["offsets"].tolist()
+    values = [
+        None if missing else data[start:end].decode()
+        for start, end, missing in zip(offsets, offsets[1:], arrays["missing"].tolist())
+    ]
+    return pd.Series(values, index=index, dtype=object)
+
+
+def _json_value(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ComputedColumnService:
+    """Computed columns defined as expressions over a file's columns.
+
+    Definitions live in file_metadata["computed_columns"]. Values are
+    materialized lazily: the first request needing a computed column reads
+    the referenced columns once, evaluates the expression over the file
+    chunk by chunk (see app.services.expressions) and caches the resulting vector,
+    with its column stats, as an .npz file (no pickle) under
+    UPLOAD_DIR/computed/<file_id>. Paging,
+    sorting, export and aggregation all reuse that vector until the
+    expression or the file's row count changes.
+
+    Stored columns used for sorting are cached the same way, so a sorted
+    page costs one lookup by row_index instead of a full scan.
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+        self.cache_dir = os.path.join(file_service.upload_dir, "computed")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._cache: "OrderedDict[Tuple[str, float], Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def definitions(file: File) -> Dict[str, Dict[str, Any]]:
+        return (file.file_metadata or {}).get("computed_columns", {})
+
+    def _path(self, file_id: UUID, name: str, expression: Optional[str]) -> str:
+        source = f"computed\0{name}\0{expression}" if expression is not None else f"stored\0{name}"
+        key = hashlib.sha1(source.encode()).hexdigest()[:20]
+        return os.path.join(self.cache_dir, str(file_id), f"{key}.npz")
+
+    def _vector_path(self, file: File, name: str) -> str:
+        definition = self.definitions(file).get(name)
+        return self._path(file.id, name, definition["expression"] if definition else None)
+
+    def _load(self, path: str, row_count: int) -> Optional[Dict[str, Any]]:
+        """A cached vector, None when missing or built for another row count"""
+        if not os.path.exists(path):
+            return None
+        key = (path, os.path.getmtime(path))
+        entry = self._cache.get(key)
+        if entry is None:
+            with np.load(path, allow_pickle=False) as arrays:
+                meta = json.loads(arrays["meta"].tobytes())
+                entry = {**meta, "values": vector_from_arrays(arrays), "orders": {}}
+            for stale in [cached for cached in self._cache if cached[0] == path]:
+                del self._cache[stale]
+            self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > settings.COMPUTED_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return entry if entry["row_count"] == row_count else None
+
+    @staticmethod
+    def _save(path: str, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = json.dumps({"row_count": entry["row_count"], "stats": entry["stats"]}).encode()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as cache_file:
+            np.savez(cache_file, meta=np.frombuffer(meta, dtype=np.uint8), **vector_arrays(entry["values"]))
+        os.replace(tmp_path, path)
+
+    def remove_cache(self, file_id: UUID, name: Optional[str] = None, expression: Optional[str] = None) -> None:
+        """Drop one cached vector, or every one of the file"""
+        if name is not None:
+            path = self._path(file_id, name, expression)
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        directory = os.path.join(self.cache_dir, str(file_id))
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                os.remove(entry.path)
+            os.rmdir(directory)
+
+    async def define(self, db: AsyncSession, file: File, name: str, expression: str) -> Dict[str, Any]:
+        """Add or replace a computed column, returning it with a preview"""
+        name = name.strip()
+        if not name or len(name) > MAX_NAME_LENGTH:
+            raise ExpressionError(f"Column name must be 1-{MAX_NAME_LENGTH} characters")
+        if name in (file.columns or []):
+            raise ExpressionError(f"'{name}' is already a column of the file")
+        parsed = Expression(expression, file.columns or [])
+
+        preview_frame = None
+        # Close the stream right away so its hold on the file is released
+        async with aclosing(self.file_service.iter_file_frames(db, file.id, batch_size=PREVIEW_ROWS)) as frames:
+            async for frame in frames:
+                preview_frame = frame
+                break
+        preview = []
+        if preview_frame is not None:
+            values = normalize_values(await asyncio.to_thread(parsed.evaluate, preview_frame))
+            preview = [_json_value(value) for value in values.tolist()]
+
+        definitions = dict(self.definitions(file))
+        previous = definitions.get(name)
+        definitions[name] = {
+            "expression": expression,
+            "columns": sorted(parsed.columns),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        file.file_metadata = {**(file.file_metadata or {}), "computed_columns": definitions}
+        await db.commit()
+        if previous and previous["expression"] != expression:
+            await asyncio.to_thread(self.remove_cache, file.id, name, previous["expression"])
+        return {"name": name, **definitions[name], "preview": preview}
+
+    async def remove(self, db: AsyncSession, file: File, name: str) -> bool:
+        definitions = dict(self.definitions(file))
+        definition = definitions.pop(name, None)
+        if definition is None:
+            return False
+        file.file_metadata = {**(file.file_metadata or {}), "computed_columns": definitions}
+        await db.commit()
+        await asyncio.to_thread(self.remove_cache, file.id, name, definition["expression"])
+        return True
+
+    @staticmethod
+    def _evaluate_chunk(
+        frame: pd.DataFrame,
+        expressions: Dict[str, Expression],
+        states: Dict[str, ChunkState],
+        names: List[str]
+    ) -> Dict[str, pd.Series]:
+        """Raw values of `names` for one chunk of rows (blocking)"""
+        return {
+            name: expressions[name].evaluate(frame, states[name]) if name in expressions
+            else frame[name] if name in frame else pd.Series(None, index=frame.index, dtype=object)
+            for name in names
+        }
+
+    def _store_entries(self, file: File, values: Dict[str, pd.Series]) -> Dict[str, Dict[str, Any]]:
+        """Normalize whole-file values and build and store their cache entries (blocking)"""
+        entries = {}
+        for name, raw in values.items():
+            normalized = normalize_values(raw)
+            entry = {
+                "row_count": file.row_count,
+                "values": normalized,
+                "stats": ColumnStats.from_series(normalized).to_dict(),
+                "orders": {}
+            }
+            self._save(self._vector_path(file, name), entry)
+            entries[name] = entry
+        return entries
+
+    def _needed_columns(self, file: File, names: List[str]) -> List[str]:
+        """Stored columns read to compute `names`, in file order"""
+        definitions = self.definitions(file)
+        needed = set()
+        for name in names:
+            needed.update(definitions[name]["columns"] if name in definitions else [name])
+        return [column for column in (file.columns or []) if column in needed]
+
+    async def _frames(self, db: AsyncSession, file: File, columns: List[str]) -> AsyncIterator[pd.DataFrame]:
+        """The file's rows in chunks, only `columns`; one empty chunk for a file without rows"""
+        empty = True
+        async for frame in self.file_service.iter_file_frames(db, file.id):
+            empty = False
+            yield frame.reindex(columns=columns)
+        if empty:
+            yield pd.DataFrame(columns=columns, index=pd.Index([], name="row_index"))
+
+    async def _materialize(self, db: AsyncSession, file: File, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Compute `names` over the whole file and cache them.
+
+        Chunks are evaluated one at a time, so only one chunk of the
+        columns they read is in memory next to the values computed so far.
+        Expressions that can't run in chunks (see Expression.chunkable)
+        have their columns gathered and evaluated in one go.
+        """
+        definitions = self.definitions(file)
+        expressions = {
+            name: Expression(definitions[name]["expression"], file.columns or [])
+            for name in names if name in definitions
+        }
+        states = {name: ChunkState() for name in expressions}
+        values: Dict[str, pd.Series] = {}
+
+        pending = [name for name in names if name not in expressions or expressions[name].chunkable]
+        while pending:
+            parts: Dict[str, List[pd.Series]] = {name: [] for name in pending}
+            async for frame in self._frames(db, file, self._needed_columns(file, pending)):
+                chunk = await asyncio.to_thread(self._evaluate_chunk, frame, expressions, states, pending)
+                for name, part in chunk.items():
+                    parts[name].append(part)
+            # Text turned up after the first chunk: evaluate those again, as text throughout
+            stale = [name for name in pending if name in states and states[name].stale]
+            values.update({name: pd.concat(parts[name]) for name in pending if name not in stale})
+            states.update({name: states[name].restart() for name in stale})
+            pending = stale
+
+        whole = [name for name in names if name not in values]
+        if whole:
+            frames = [frame async for frame in self._frames(db, file, self._needed_columns(file, whole))]
+            values.update(await asyncio.to_thread(self._evaluate_chunk, pd.concat(frames), expressions, states, whole))
+
+        return await asyncio.to_thread(self._store_entries, file, values)
+
+    async def _entries(self, db: AsyncSession, file: File, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cache entries for stored or computed columns, materializing the
+        missing ones together"""
+        definitions = self.definitions(file)
+        unknown = [name for name in names if name not in definitions and name not in (file.columns or [])]
+        if unknown:
+            raise ExpressionError(f"Unknown column '{unknown[0]}'")
+
+        def cached():
+            return {name: self._load(self._vector_path(file, name), file.row_count) for name in names}
+
+        entries = await asyncio.to_thread(cached)
+        if all(entries.values()):
+            return entries
+        # In-worker lock first, so waiting requests don't all poll the shared one
+        async with _file_lock(file.id), shared_state.lock(f"computed:{file.id}"):
+            entries = await asyncio.to_thread(cached)
+            missing = [name for name, entry in entries.items() if entry is None]
+            if not missing:
+                return entries
+            entries.update(await self._materialize(db, file, missing))
+            return entries
+
+    async def vectors(self, db: AsyncSession, file: File, names: List[str]) -> pd.DataFrame:
+        """Whole-file values of the given columns, indexed by row_index"""
+        entries = await self._entries(db, file, names)
+        return pd.DataFrame({name: entries[name]["values"] for name in names})
+
+    async def column_stats(self, db: AsyncSession, file: File) -> Dict[str, ColumnStats]:
+        """Stats of every computed column of the file"""
+        names = list(self.definitions(file))
+        if not names:
+            return {}
+        entries = await self._entries(db, file, names)
+        return {name: ColumnStats.from_dict(entries[name]["stats"]) for name in names}
+
+    def _cached_stats(self, file: File, name: str) -> Optional[Dict[str, Any]]:
+        """Stats stored with a cached vector, without loading the vector (blocking)"""
+        path = self._vector_path(file, name)
+        if not os.path.exists(path):
+            return None
+        entry = self._cache.get((path, os.path.getmtime(path)))
+        if entry is None:
+            with np.load(path, allow_pickle=False) as arrays:
+                entry = json.loads(arrays["meta"].tobytes())
+        return entry["stats"] if entry["row_count"] == file.row_count else None
+
+    async def cached_column_stats(self, file: File) -> Tuple[Dict[str, ColumnStats], List[str]]:
+        """Stats of the computed columns already materialized for the file's
+        current rows, and the names of the rest (never computed, or stale
+        after an append or a new expression). Never reads the file's rows."""
+        def load():
+            return {name: self._cached_stats(file, name) for name in self.definitions(file)}
+
+        stats = await asyncio.to_thread(load)
+        return (
+            {name: ColumnStats.from_dict(column_stats) for name, column_stats in stats.items() if column_stats},
+            [name for name, column_stats in stats.items() if not column_stats]
+        )
+
+    async def sort_order(self, db: AsyncSession, file: File, sort_by: str, descending: bool = False) -> np.ndarray:
+        """Row indexes ordered by a stored or computed column, missing values
+        last; the order is kept in memory with the cached vector"""
+        entry = (await self._entries(db, file, [sort_by]))[sort_by]
+        order = entry["orders"].get(descending)
+        if order is None:
+            values = entry["values"]
+            if values.dtype == object:
+                # Strings sort case-insensitively, like a user would expect
+                values = values.str.lower()
+            order = values.sort_values(ascending=not descending, na_position="last", kind="stable").index.to_numpy()
+            entry["orders"][descending] = order
+        return order
+
+    async def time_order(self, db: AsyncSession, file: File, time_column: str) -> np.ndarray:
+        """Row indexes ordered by the parsed time column (stable, so rows
+        with equal times keep row_index order), unparseable times last"""
+        entry = (await self._entries(db, file, [time_column]))[time_column]
+        order = entry["orders"].get("time")
+        if order is None:
+            values = entry["values"]
+            positions = await asyncio.to_thread(lambda: parse_times(values).argsort(kind="stable").to_numpy())
+            order = values.index.to_numpy()[positions]
+            entry["orders"]["time"] = order
+        return order
+
+    async def attach(
+        self,
+        db: AsyncSession,
+        file: File,
+        rows: List[Tuple[int, Dict[str, Any]]],
+        names: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Row data with computed column values added"""
+        names = list(self.definitions(file)) if names is None else names
+        if not names or not rows:
+            return [data for _, data in rows]
+        values = (await self.vectors(db, file, names)).reindex([row_index for row_index, _ in rows])
+        records = values.astype(object).where(values.notna(), None).to_dict("records")
+        return [
+            {**data, **{name: _json_value(value) for name, value in record.items()}}
+            for (_, data), record in zip(rows, records)
+        ]
@@ -1,10 +1,37 @@
 import pandas as pd
 import json
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 import io
 from fastapi import UploadFile
 
 class CSVParser:
+    @staticmethod
+    def read_csv_frame(content: bytes) -> pd.DataFrame:
+        """Parse CSV bytes into a DataFrame (blocking, run in a worker thread)"""
+        if not content:
+            raise ValueError("CSV file is empty")
+
+        try:
+            df = pd.read_csv(io.BytesIO(content))
+        except pd.errors.EmptyDataError:
+            raise ValueError("CSV file is empty or has no valid data")
+        except pd.errors.ParserError as e:
+            raise ValueError(f"Error parsing CSV: {str(e)}")
+
+        if df.empty:
+            raise ValueError("CSV file contains no data rows")
+
+        if len(df.columns) == 0:
+            raise ValueError("No columns found in CSV file")
+
+        df.columns = [str(column) for column in df.columns]
+        return df
+
+    @staticmethod
+    def frame_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Convert a DataFrame to JSON-safe row dictionaries (NaN becomes None)"""
+        return json.loads(df.to_json(orient='records', date_format='iso'))
+
     @staticmethod
     async def parse_csv_content(content: bytes, filename: str) -> Tuple[List[Dict[str, Any]], List[str]]:
         """Parse CSV from bytes content and return data and columns"""
@@ -0,0 +1,493 @@
+import ast
+import re
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from app.services.timeseries_service import parse_times
+
+try:
+    # Private, but the only way to see a regex's structure; fall back to
+    # scanning the pattern text if a Python release drops or moves it
+    from re import _parser as sre_parse
+except ImportError:
+    sre_parse = None
+
+MAX_EXPRESSION_LENGTH = 2000
+MAX_NODES = 300
+MAX_PATTERN_LENGTH = 200
+MAX_PATTERN_REPEAT = 1000
+
+
+class ExpressionError(ValueError):
+    """The expression is not valid or can't be evaluated"""
+
+
+def _numeric(value):
+    if isinstance(value, pd.Series):
+        if pd.api.types.is_bool_dtype(value) or pd.api.types.is_numeric_dtype(value):
+            return value.astype(float)
+        return pd.to_numeric(value, errors="coerce").astype(float)
+    if isinstance(value, (bool, np.bool_)):
+        return float(value)
+    if isinstance(value, (int, float, np.number)):
+        return np.float64(value)
+    if value is None:
+        return np.nan
+    return pd.to_numeric(pd.Series([value]), errors="coerce").iloc[0]
+
+
+def _text(value):
+    if isinstance(value, pd.Series):
+        return value.astype("string")
+    return None if value is None else str(value)
+
+
+def _boolean(value):
+    if isinstance(value, pd.Series):
+        return value.fillna(False).astype(bool)
+    return bool(value)
+
+
+def _dates(value):
+    if isinstance(value, pd.Series):
+        return value if pd.api.types.is_datetime64_any_dtype(value) else parse_times(value)
+    return parse_times(pd.Series([value])).iloc[0]
+
+
+def _clean(value):
+    """Division by zero and friends give NaN rather than +-inf"""
+    if isinstance(value, pd.Series) and pd.api.types.is_float_dtype(value):
+        return value.replace([np.inf, -np.inf], np.nan)
+    return value
+
+
+def _case_when(*args):
+    if len(args) < 3 or len(args) % 2 == 0:
+        raise ExpressionError("case_when needs condition/value pairs and a default")
+    *pairs, default = args
+    series = [value for value in args if isinstance(value, pd.Series)]
+    if not series:
+        return next((value for condition, value in zip(pairs[0::2], pairs[1::2]) if condition), default)
+    conditions = [_boolean(condition) for condition in pairs[0::2]]
+    length, index = len(series[0]), series[0].index
+    broadcast = lambda value: value.to_numpy(dtype=object) if isinstance(value, pd.Series) else np.full(length, value, dtype=object)
+    result = np.select([broadcast(condition).astype(bool) for condition in conditions], [broadcast(value) for value in pairs[1::2]], default=broadcast(default))
+    return pd.Series(result, index=index).infer_objects()
+
+
+# name -> (implementation, min args, max args, positions that must be regex string literals)
+FUNCTIONS: Dict[str, tuple] = {
+    "abs": (lambda x: np.abs(_numeric(x)), 1, 1, ()),
+    "round": (lambda x, digits=0: np.round(_numeric(x), int(digits)), 1, 2, ()),
+    "sqrt": (lambda x: np.sqrt(_numeric(x)), 1, 1, ()),
+    "log": (lambda x: np.log(_numeric(x)), 1, 1, ()),
+    "exp": (lambda x: np.exp(_numeric(x)), 1, 1, ()),
+    "min": (lambda a, b: np.fmin(_numeric(a), _numeric(b)), 2, 2, ()),
+    "max": (lambda a, b: np.fmax(_numeric(a), _numeric(b)), 2, 2, ()),
+    "number": (_numeric, 1, 1, ()),
+    "text": (_text, 1, 1, ()),
+    "lower": (lambda x: _text(x).str.lower(), 1, 1, ()),
+    "upper": (lambda x: _text(x).str.upper(), 1, 1, ()),
+    "strip": (lambda x: _text(x).str.strip(), 1, 1, ()),
+    "len": (lambda x: _text(x).str.len(), 1, 1, ()),
+    "concat": (lambda *parts: _concat(parts), 2, 10, ()),
+    "contains": (lambda x, pattern: _text(x).str.contains(pattern, regex=True, na=False), 2, 2, (1,)),
+    "extract": (lambda x, pattern: _extract(_text(x), pattern), 2, 2, (1,)),
+    "replace": (lambda x, pattern, repl: _text(x).str.replace(pattern, str(repl), regex=True), 3, 3, (1,)),
+    "isnull": (lambda x: x.isna() if isinstance(x, pd.Series) else x is None, 1, 1, ()),
+    "fillna": (lambda x, value: x.fillna(value) if isinstance(x, pd.Series) else (value if x is None else x), 2, 2, ()),
+    "coalesce": (lambda *values: _coalesce(values), 2, 10, ()),
+    "where": (lambda condition, a, b: _case_when(condition, a, b), 3, 3, ()),
+    "case_when": (_case_when, 3, 41, ()),
+    "date": (_dates, 1, 1, ()),
+    "year": (lambda x: _dates(x).dt.year, 1, 1, ()),
+    "month": (lambda x: _dates(x).dt.month, 1, 1, ()),
+    "day": (lambda x: _dates(x).dt.day, 1, 1, ()),
+    "weekday": (lambda x: _dates(x).dt.weekday, 1, 1, ()),
+    "days_between": (lambda a, b: (_dates(b) - _dates(a)) / pd.Timedelta(days=1), 2, 2, ()),
+    # Window functions run in row order (files are stored sorted by time)
+    "cumsum": (lambda x: _numeric(x).fillna(0).cumsum(), 1, 1, ()),
+    "cummax": (lambda x: _numeric(x).cummax(), 1, 1, ()),
+    "cummin": (lambda x: _numeric(x).cummin(), 1, 1, ()),
+    "shift": (lambda x, periods=1: x.shift(int(periods)), 1, 2, ()),
+    "diff": (lambda x, periods=1: _numeric(x).diff(int(periods)), 1, 2, ()),
+    "rolling_mean": (lambda x, window: _numeric(x).rolling(int(window), min_periods=1).mean(), 2, 2, ()),
+    "rolling_sum": (lambda x, window: _numeric(x).rolling(int(window), min_periods=1).sum(), 2, 2, ()),
+}
+
+# Window function -> how many trailing input values the next chunk needs,
+# given the function's other arguments; None for the cumulative ones,
+# which carry their running value instead
+WINDOW_LOOKBACK: Dict[str, Any] = {
+    "cumsum": None,
+    "cummax": None,
+    "cummin": None,
+    "shift": lambda periods=1: int(periods),
+    "diff": lambda periods=1: int(periods),
+    "rolling_mean": lambda window: int(window) - 1,
+    "rolling_sum": lambda window: int(window) - 1,
+}
+
+
+def _check_pattern(pattern: str) -> None:
+    """Reject regexes that can backtrack catastrophically: an unbounded
+    repeat inside another one (e.g. `(a+)+`), back-references and huge
+    counted repeats"""
+    if sre_parse is None:
+        _scan_pattern(pattern)
+        return
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        raise ExpressionError(f"Invalid pattern: {e}")
+
+    def walk(items, inside_repeat: bool) -> None:
+        for op, value in items:
+            if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, sre_parse.POSSESSIVE_REPEAT):
+                low, high, body = value
+                unbounded = high == sre_parse.MAXREPEAT
+                if (high if not unbounded else low) > MAX_PATTERN_REPEAT:
+                    raise ExpressionError(f"Pattern repeats more than {MAX_PATTERN_REPEAT} times")
+                if unbounded and inside_repeat:
+                    raise ExpressionError("Pattern nests repeats (e.g. (a+)+), which can take forever to match")
+                walk(body, inside_repeat or unbounded)
+            elif op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+                raise ExpressionError("Back-references are not supported in patterns")
+            elif op == sre_parse.SUBPATTERN:
+                walk(value[-1], inside_repeat)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                walk(value[1], inside_repeat)
+            elif op == sre_parse.BRANCH:
+                for branch in value[1]:
+                    walk(branch, inside_repeat)
+            elif op == sre_parse.ATOMIC_GROUP:
+                walk(value, inside_repeat)
+
+    walk(parsed, False)
+
+
+_COUNTED_REPEAT = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+
+def _scan_pattern(pattern: str) -> None:
+    """`_check_pattern` from the pattern text alone, for when re's parser
+    isn't importable. Tracks groups by hand, so it is stricter than the
+    parser only where the text is ambiguous."""
+    # Per open group: does it contain an unbounded repeat?
+    groups = [False]
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        if char == "(":
+            if pattern.startswith("(?P=", position) or pattern.startswith("(?(", position):
+                raise ExpressionError("Back-references are not supported in patterns")
+            groups.append(False)
+            position += 1
+            continue
+        if char == ")" and len(groups) > 1:
+            inner_unbounded = groups.pop()
+            position += 1
+            unbounded = _repeat_at(pattern, position)
+            if unbounded and inner_unbounded:
+                raise ExpressionError("Pattern nests repeats (e.g. (a+)+), which can take forever to match")
+            groups[-1] = groups[-1] or inner_unbounded or unbounded
+            continue
+        counted = _COUNTED_REPEAT.match(pattern, position)
+        if char in "*+?" or (counted and (counted.group(1) or counted.group(3))):
+            # The repeat of the atom before it, already looked at
+            position = counted.end() if counted else position + 1
+            continue
+        if char == "\\":
+            if pattern[position + 1:position + 2].isdigit() and pattern[position + 1] != "0":
+                raise ExpressionError("Back-references are not supported in patterns")
+            position += 2
+        elif char == "[":
+            # Skip the class; a leading ] (or ^]) is a literal
+            position += 2 if pattern.startswith("[^", position) else 1
+            if pattern[position:position + 1] == "]":
+                position += 1
+            while position < len(pattern) and pattern[position] != "]":
+                position += 2 if pattern[position] == "\\" else 1
+            position += 1
+        else:
+            position += 1
+        if _repeat_at(pattern, position):
+            groups[-1] = True
+
+
+def _repeat_at(pattern: str, position: int) -> bool:
+    """Whether the repeat at `position` (if any) is unbounded; rejects huge counted ones"""
+    if pattern[position:position + 1] in ("*", "+"):
+        return True
+    counted = _COUNTED_REPEAT.match(pattern, position)
+    if not counted or not (counted.group(1) or counted.group(3)):
+        return False
+    low, comma, high = counted.groups()
+    if max(int(low or 0), int(high or 0)) > MAX_PATTERN_REPEAT:
+        raise ExpressionError(f"Pattern repeats more than {MAX_PATTERN_REPEAT} times")
+    return bool(comma) and not high
+
+
+def _concat(parts):
+    result = None
+    for part in parts:
+        part = _text(part)
+        result = part if result is None else result + part
+    return result
+
+
+def _extract(series: pd.Series, pattern: str) -> pd.Series:
+    compiled = re.compile(pattern)
+    extracted = series.str.extract(pattern if compiled.groups else f"({pattern})", expand=True)
+    return extracted.iloc[:, 0]
+
+
+def _coalesce(values):
+    result = values[0]
+    for value in values[1:]:
+        result = result.fillna(value) if isinstance(result, pd.Series) else (value if result is None else result)
+    return result
+
+
+BINARY_OPERATORS: Dict[type, Callable] = {
+    ast.Sub: lambda a, b: _numeric(a) - _numeric(b),
+    ast.Mult: lambda a, b: _numeric(a) * _numeric(b),
+    ast.Div: lambda a, b: _numeric(a) / _numeric(b),
+    ast.FloorDiv: lambda a, b: _numeric(a) // _numeric(b),
+    ast.Mod: lambda a, b: _numeric(a) % _numeric(b),
+    ast.Pow: lambda a, b: _numeric(a) ** _numeric(b),
+    ast.BitAnd: lambda a, b: _boolean(a) & _boolean(b),
+    ast.BitOr: lambda a, b: _boolean(a) | _boolean(b),
+}
+
+COMPARISONS: Dict[type, Callable] = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+}
+
+
+def _is_text(value) -> bool:
+    if isinstance(value, str):
+        return True
+    return isinstance(value, pd.Series) and (
+        pd.api.types.is_string_dtype(value) and pd.to_numeric(value.dropna(), errors="coerce").isna().any()
+    )
+
+
+class ChunkState:
+    """What evaluating an expression over one chunk of a file leaves for the
+    next: the tails window functions continue from, and which `+` and
+    comparison nodes have seen text.
+
+    A node works on text for the whole file once any chunk has text there,
+    so chunks evaluated before that are wrong; `stale` says so, and the
+    file is evaluated again from `restart()`, which keeps what was learned.
+    """
+
+    def __init__(self, text_nodes: Optional[Set[Any]] = None):
+        self.text_nodes: Set[Any] = set(text_nodes or ())
+        self.carry: Dict[ast.AST, pd.Series] = {}
+        self.chunks = 0
+        self.stale = False
+
+    def text(self, key: Any, found: bool) -> bool:
+        if found and key not in self.text_nodes:
+            self.text_nodes.add(key)
+            self.stale = self.stale or self.chunks > 0
+        return key in self.text_nodes
+
+    def restart(self) -> "ChunkState":
+        return ChunkState(self.text_nodes)
+
+
+class Expression:
+    """A safe, vectorized column expression.
+
+    The source is parsed with Python's grammar but only a small whitelist of
+    nodes is accepted: literals, column names (or `col("Any name")`),
+    arithmetic, comparisons, `and`/`or`/`not`, `a if cond else b` and the
+    functions in FUNCTIONS. Everything evaluates on whole pandas Series, so
+    cost is a handful of numpy passes regardless of row count.
+    """
+
+    def __init__(self, source: str, columns: List[str]):
+        if len(source) > MAX_EXPRESSION_LENGTH:
+            raise ExpressionError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+        try:
+            self.tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression: {e.msg}")
+        self.source = source
+        self.known_columns = set(columns)
+        self.columns: Set[str] = set()
+        # Whether chunks can be evaluated one after another; not when a
+        # window looks ahead or its size isn't a literal
+        self.chunkable = True
+        nodes = list(ast.walk(self.tree))
+        if len(nodes) > MAX_NODES:
+            raise ExpressionError("Expression is too complex")
+        self._validate(self.tree.body)
+
+    def _validate(self, node: ast.AST) -> None:
+        if isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float, str, bool, type(None))):
+                raise ExpressionError(f"Unsupported literal {node.value!r}")
+        elif isinstance(node, ast.Name):
+            if node.id in ("True", "False", "None"):
+                return
+            if node.id.startswith("__"):
+                raise ExpressionError(f"'{node.id}' is not allowed; use col(\"{node.id}\") for a column")
+            if node.id not in self.known_columns:
+                raise ExpressionError(f"Unknown column '{node.id}'")
+            self.columns.add(node.id)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise ExpressionError("Only plain calls of the built-in functions are allowed")
+            name = node.func.id
+            if name == "col":
+                if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+                    raise ExpressionError('col() takes one column name, e.g. col("Net Amount")')
+                if node.args[0].value not in self.known_columns:
+                    raise ExpressionError(f"Unknown column '{node.args[0].value}'")
+                self.columns.add(node.args[0].value)
+                return
+            if name not in FUNCTIONS:
+                raise ExpressionError(f"Unknown function '{name}'. Available: col, {', '.join(sorted(FUNCTIONS))}")
+            _, min_args, max_args, pattern_positions = FUNCTIONS[name]
+            if not min_args <= len(node.args) <= max_args:
+                raise ExpressionError(f"{name}() takes {min_args}-{max_args} arguments")
+            for position in pattern_positions:
+                pattern = node.args[position]
+                if not isinstance(pattern, ast.Constant) or not isinstance(pattern.value, str):
+                    raise ExpressionError(f"{name}() needs a string literal pattern")
+                if len(pattern.value) > MAX_PATTERN_LENGTH:
+                    raise ExpressionError("Pattern is too long")
+                try:
+                    re.compile(pattern.value)
+                except re.error as e:
+                    raise ExpressionError(f"Invalid pattern in {name}(): {e}")
+                _check_pattern(pattern.value)
+            if name in WINDOW_LOOKBACK and not all(
+                isinstance(arg, ast.Constant) and isinstance(arg.value, (int, float)) and arg.value >= 0
+                for arg in node.args[1:]
+            ):
+                self.chunkable = False
+            for arg in node.args:
+                self._validate(arg)
+        elif isinstance(node, ast.BinOp):
+            if not isinstance(node.op, (ast.Add, *BINARY_OPERATORS)):
+                raise ExpressionError(f"Unsupported operator {type(node.op).__name__}")
+            self._validate(node.left)
+            self._validate(node.right)
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd, ast.Not, ast.Invert)):
+                raise ExpressionError(f"Unsupported operator {type(node.op).__name__}")
+            self._validate(node.operand)
+        elif isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._validate(value)
+        elif isinstance(node, ast.Compare):
+            if not all(isinstance(op, tuple(COMPARISONS)) for op in node.ops):
+                raise ExpressionError("Only ==, !=, <, <=, > and >= comparisons are allowed")
+            self._validate(node.left)
+            for comparator in node.comparators:
+                self._validate(comparator)
+        elif isinstance(node, ast.IfExp):
+            self._validate(node.test)
+            self._validate(node.body)
+            self._validate(node.orelse)
+        else:
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+    def evaluate(self, df: pd.DataFrame, state: Optional["ChunkState"] = None) -> pd.Series:
+        """Evaluate over a frame holding (at least) the referenced columns.
+
+        To evaluate a file chunk by chunk in row order, pass the same
+        `state` for every chunk (only when `chunkable`); see ChunkState.
+        """
+        state = state if state is not None else ChunkState()
+        try:
+            with np.errstate(all="ignore"):
+                result = self._eval(self.tree.body, df, state)
+        except ExpressionError:
+            raise
+        except Exception as e:
+            raise ExpressionError(f"Could not evaluate expression: {e}")
+        state.chunks += 1
+        if not isinstance(result, pd.Series):
+            result = pd.Series([result] * len(df), index=df.index)
+        return _clean(result)
+
+    @staticmethod
+    def _window(node: ast.Call, function: Callable, args: List[Any], state: "ChunkState") -> pd.Series:
+        """A window function over this chunk, continuing from the chunks before"""
+        prefix = state.carry.get(node)
+        values = args[0] if prefix is None else pd.concat([prefix, args[0]])
+        result = function(values, *args[1:])
+        lookback = WINDOW_LOOKBACK[node.func.id]
+        if lookback is None:
+            # Cumulative: the running value stands in for every row before
+            running = result.dropna()
+            state.carry[node] = running.iloc[-1:] if len(running) else prefix
+        else:
+            state.carry[node] = values.iloc[max(len(values) - lookback(*args[1:]), 0):]
+        return result.iloc[len(values) - len(args[0]):]
+
+    def _eval(self, node: ast.AST, df: pd.DataFrame, state: "ChunkState") -> Any:
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name):
+            return {"True": True, "False": False, "None": None}.get(node.id) if node.id in ("True", "False", "None") else df[node.id]
+        if isinstance(node, ast.Call):
+            if node.func.id == "col":
+                return df[node.args[0].value]
+            function = FUNCTIONS[node.func.id][0]
+            args = [self._eval(arg, df, state) for arg in node.args]
+            if node.func.id in WINDOW_LOOKBACK and isinstance(args[0], pd.Series):
+                return _clean(self._window(node, function, args, state))
+            return _clean(function(*args))
+        if isinstance(node, ast.BinOp):
+            left, right = self._eval(node.left, df, state), self._eval(node.right, df, state)
+            if isinstance(node.op, ast.Add):
+                # Text + anything concatenates, otherwise add numbers
+                if state.text(node, _is_text(left) or _is_text(right)):
+                    return _concat((left, right))
+                return _numeric(left) + _numeric(right)
+            return BINARY_OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp):
+            operand = self._eval(node.operand, df, state)
+            if isinstance(node.op, ast.USub):
+                return -_numeric(operand)
+            if isinstance(node.op, ast.UAdd):
+                return _numeric(operand)
+            return ~_boolean(operand) if isinstance(operand, pd.Series) else not operand
+        if isinstance(node, ast.BoolOp):
+            values = [_boolean(self._eval(value, df, state)) for value in node.values]
+            result = values[0]
+            for value in values[1:]:
+                result = (result & value) if isinstance(node.op, ast.And) else (result | value)
+            return result
+        if isinstance(node, ast.Compare):
+            left = self._eval(node.left, df, state)
+            result = None
+            for position, (op, comparator) in enumerate(zip(node.ops, node.comparators)):
+                right = self._eval(comparator, df, state)
+                a, b = left, right
+                if not state.text((node, position), _is_text(a) or _is_text(b)):
+                    a, b = _numeric(a), _numeric(b)
+                step = COMPARISONS[type(op)](a, b)
+                result = step if result is None else (_boolean(result) & _boolean(step))
+                left = right
+            return result
+        if isinstance(node, ast.IfExp):
+            test = self._eval(node.test, df, state)
+            if not isinstance(test, pd.Series):
+                return self._eval(node.body, df, state) if test else self._eval(node.orelse, df, state)
+            return _case_when(test, self._eval(node.body, df, state), self._eval(node.orelse, df, state))
+        raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
@@ -1,18 +1,34 @@
 import os
 import shutil
-from typing import List, Dict, Any, Optional
-from uuid import UUID
+import time
+import asyncio
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Callable, AsyncIterator
+from uuid import UUID, uuid4
 from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete
-from app.models.file_model import File, FileData
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, delete, insert
+from app.config import settings
+from app.database import is_replica_session, primary_session
+from app.models.file_model import File, FileData, FileColumnStats, FileAnomaly
 from app.schemas.file_schema import FileCreate, FileDataCreate
 from app.services.csv_parser import CSVParser
+from app.services.column_stats import ColumnStats, build_column_stats
+from app.services.timeseries_service import TimeSeriesService, detect_time_column, sort_by_time
+from app.services.search_service import SearchIndex, SearchService
+from app.services.tiering_service import TieringService
+from app.services.computed_column_service import ComputedColumnService
 ##from app.models import File, FileData  # ← Correct import
 
 class FileService:
     def __init__(self, upload_dir: str):
         self.upload_dir = upload_dir
+        self.timeseries_service = TimeSeriesService()
+        self.search_service = SearchService(upload_dir)
+        self.tiering_service = TieringService(self)
+        self.computed_column_service = ComputedColumnService(self)
         os.makedirs(upload_dir, exist_ok=True)
     
     async def save_uploaded_file(self, file: UploadFile) -> str:
@@ -36,49 +52,385 @@ class FileService:
         file: UploadFile
     ) -> File:
         """Process uploaded file and save to database"""
-        
-        # 1. Save file to disk
-        file_path, filename = await self.save_uploaded_file(file)
-
-        
-        
-        # 2. Parse file content
-        data, columns = await CSVParser.parse_file(file)
-        
-        # 3. Create File record
-        file_record = File(
-            filename=filename,
+        content = await file.read()
+        return await self.ingest_content(
+            db,
             original_name=file.filename,
-            file_path=file_path,
-            file_size=os.path.getsize(file_path),
-            mime_type=file.content_type or "application/octet-stream",
-            row_count=len(data),
-            column_count=len(columns),
-            columns=columns,
-            file_metadata={  # ✅ Use file_metadata instead of metadata
-            "field_name": file.filename,
-            "content_type": file.content_type
-            }
+            content=content,
+            content_type=file.content_type
         )
-        
-        db.add(file_record)
-        await db.commit()
-        await db.refresh(file_record)
-        
-        # 4. Create FileData records
-        file_data_records = [
-            FileData(
-                file_id=file_record.id,
-                row_index=index,
-                data=row
+
+    def _write_file(self, original_name: str, content: bytes) -> Tuple[str, str]:
+        """Write raw bytes under a unique name in the upload dir (blocking)"""
+        timestamp = int(time.time() * 1000)
+        unique_filename = f"{timestamp}_{uuid4().hex[:8]}_{os.path.basename(original_name)}"
+        file_path = os.path.join(self.upload_dir, unique_filename)
+
+        with open(file_path, "wb") as buffer:
+            buffer.write(content)
+
+        return file_path, unique_filename
+
+    async def ingest_content(
+        self,
+        db: AsyncSession,
+        original_name: str,
+        content: bytes,
+        content_type: Optional[str] = None
+    ) -> File:
+        """Save raw CSV bytes to disk, parse them and store file + rows"""
+        # Disk I/O and pandas parsing are blocking, keep them off the event loop
+        file_path, filename = await asyncio.to_thread(self._write_file, original_name, content)
+
+        try:
+            df = await asyncio.to_thread(CSVParser.read_csv_frame, content)
+            columns = df.columns.tolist()
+
+            file_record = File(
+                filename=filename,
+                original_name=original_name,
+                file_path=file_path,
+                file_size=len(content),
+                mime_type=content_type or "text/csv",
+                row_count=len(df),
+                column_count=len(columns),
+                columns=columns,
+                file_metadata={
+                    "field_name": original_name,
+                    "content_type": content_type
+                }
             )
-            for index, row in enumerate(data)
-        ]
-        
-        db.add_all(file_data_records)
-        await db.commit()
-        
+
+            df = await self.prepare_frame(file_record, df)
+            data = await asyncio.to_thread(CSVParser.frame_to_records, df)
+
+            db.add(file_record)
+            await db.flush()
+
+            await self.insert_rows(db, file_record.id, data, start_index=0)
+            segment = await self.index_rows(db, file_record, df, start_index=0)
+            await db.commit()
+            await db.refresh(file_record)
+
+        except Exception:
+            await db.rollback()
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        await self.search_service.add_segment(file_record.id, segment)
         return file_record
+
+    async def insert_rows(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        data: List[Dict[str, Any]],
+        start_index: int = 0
+    ) -> None:
+        """Bulk insert FileData rows in batches (executemany instead of ORM objects)"""
+        batch_size = settings.INGEST_INSERT_BATCH_ROWS
+        for offset in range(0, len(data), batch_size):
+            batch = data[offset:offset + batch_size]
+            await db.execute(
+                insert(FileData),
+                [
+                    {
+                        "file_id": file_id,
+                        "row_index": start_index + offset + position,
+                        "data": row
+                    }
+                    for position, row in enumerate(batch)
+                ]
+            )
+
+    async def append_content(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        original_name: str,
+        content: bytes,
+        content_type: Optional[str] = None
+    ) -> File:
+        """Append CSV rows to an existing file, continuing its row_index.
+
+        The new rows must have exactly the file's columns (in any order).
+        Column stats are summarised for the new rows only and merged into the
+        stored ones, so existing rows are never rescanned.
+        """
+        file = await self.get_file_by_id(db, file_id)
+        if not file:
+            raise LookupError("File not found")
+        # Archiving the file mid-append would drop the new rows with the old
+        async with self.tiering_service.hot(db, file):
+            return await self._append_rows(db, file_id, original_name, content)
+
+    async def _append_rows(self, db: AsyncSession, file_id: UUID, original_name: str, content: bytes) -> File:
+        # Lock the file row so concurrent appends can't hand out the same row_index
+        result = await db.execute(
+            select(File).where(File.id == file_id).with_for_update()
+        )
+        file = result.scalar_one_or_none()
+        if not file:
+            raise LookupError("File not found")
+
+        df = await asyncio.to_thread(CSVParser.read_csv_frame, content)
+
+        expected = list(file.columns or [])
+        missing = [column for column in expected if column not in df.columns]
+        unexpected = [column for column in df.columns if column not in expected]
+        if missing or unexpected:
+            raise ValueError(
+                f"Columns do not match file. Missing: {missing or 'none'}; unexpected: {unexpected or 'none'}"
+            )
+        df = df[expected]
+
+        # Files ingested before stats/rollups existed get a one-off backfill first
+        if file.row_count and not await self.get_column_stats(db, file_id):
+            await self.rebuild_column_stats(db, file_id)
+        await self.ensure_time_index(db, file)
+
+        file_path, _ = await asyncio.to_thread(self._write_file, original_name, content)
+
+        try:
+            df = await self.prepare_frame(file, df)
+            data = await asyncio.to_thread(CSVParser.frame_to_records, df)
+            start_index = file.row_count or 0
+            await self.insert_rows(db, file.id, data, start_index=start_index)
+            segment = await self.index_rows(db, file, df, start_index=start_index)
+
+            metadata = dict(file.file_metadata or {})
+            metadata["appends"] = metadata.get("appends", []) + [{
+                "original_name": original_name,
+                "file_path": file_path,
+                "file_size": len(content),
+                "start_row": start_index,
+                "row_count": len(data),
+                "appended_at": datetime.utcnow().isoformat()
+            }]
+            file.file_metadata = metadata
+            file.raw_tier = "raw"
+            file.row_count = start_index + len(data)
+            file.file_size = (file.file_size or 0) + len(content)
+            await db.commit()
+            await db.refresh(file)
+
+        except Exception:
+            await db.rollback()
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        await self.search_service.add_segment(file.id, segment)
+        return file
+
+    async def prepare_frame(self, file_record: File, df: pd.DataFrame) -> pd.DataFrame:
+        """Detect the file's time column on first sight and sort rows by it.
+
+        Only `df` is sorted; rows already stored keep their row_index. The
+        file's "time_order" says whether the stored rows are still in time
+        order with `df` after them, and when they aren't, default reads
+        follow time order instead of row_index (see `default_order`).
+        """
+        metadata = dict(file_record.file_metadata or {})
+        first_batch = "time_column" not in metadata
+        if first_batch:
+            metadata["time_column"] = await asyncio.to_thread(detect_time_column, df)
+
+        time_column = metadata["time_column"]
+        if time_column and time_column in df.columns:
+            # Files whose rows predate time tracking have no known order
+            previous = None if first_batch else metadata.get("time_order", {"sorted": False})
+            df, metadata["time_order"] = await asyncio.to_thread(sort_by_time, df, time_column, previous)
+        file_record.file_metadata = metadata
+        return df
+
+    async def default_order(self, db: AsyncSession, file: File) -> Optional[np.ndarray]:
+        """Row indexes in time order when appends (or chunked-upload
+        segments) left the stored rows out of it; None when row_index
+        order already is time order, or the file has no time column"""
+        metadata = file.file_metadata or {}
+        time_column = metadata.get("time_column")
+        if not time_column or metadata.get("time_order", {}).get("sorted", False):
+            return None
+        return await self.computed_column_service.time_order(db, file, time_column)
+
+    async def index_rows(
+        self,
+        db: AsyncSession,
+        file_record: File,
+        df: pd.DataFrame,
+        start_index: int
+    ) -> SearchIndex:
+        """Merge newly stored rows (row_index from `start_index`) into the
+        file's stats and rollups (no commit). Returns their search segment:
+        pass it to `search_service.add_segment` after the commit."""
+        stats = await asyncio.to_thread(build_column_stats, df)
+        await self.merge_column_stats(db, file_record.id, stats)
+
+        time_column = (file_record.file_metadata or {}).get("time_column")
+        if time_column:
+            await self.timeseries_service.merge_rollups(db, file_record.id, df, time_column)
+
+        return await self.search_service.build_segment(db, df, start_index)
+
+    async def ensure_time_index(self, db: AsyncSession, file_record: File) -> None:
+        """Detect the time column and build rollups for files stored before
+        rollups existed (no commit). No-op once detection has run."""
+        if "time_column" in (file_record.file_metadata or {}):
+            return
+
+        metadata = dict(file_record.file_metadata or {})
+        metadata["time_column"] = None
+        async for frame in self.iter_file_frames(db, file_record.id):
+            metadata["time_column"] = await asyncio.to_thread(detect_time_column, frame)
+            break
+        file_record.file_metadata = metadata
+
+        if metadata["time_column"]:
+            await self.timeseries_service.delete_rollups(db, file_record.id)
+            async for frame in self.iter_file_frames(db, file_record.id):
+                await self.timeseries_service.merge_rollups(db, file_record.id, frame, metadata["time_column"])
+        await db.flush()
+
+    async def search_index_current(self, db: AsyncSession, file_record: File) -> bool:
+        """Whether the search index covers exactly the stored rows. It may
+        not for files stored before search existed, or after an ingest that
+        failed once its rows were indexed. PostgreSQL matches rows itself and
+        only uses the index for fuzzy alternatives, so it is always usable."""
+        if self.search_service.use_postgres(db):
+            return True
+        indexed = await asyncio.to_thread(self.search_service.indexed_rows, file_record.id)
+        return indexed == (file_record.row_count or 0)
+
+    async def rebuild_search_index(self, db: AsyncSession, file_record: File) -> None:
+        await self.search_service.rebuild(db, file_record.id, self.iter_file_frames(db, file_record.id))
+
+    async def get_column_stats(
+        self,
+        db: AsyncSession,
+        file_id: UUID
+    ) -> Dict[str, ColumnStats]:
+        """Stored per-column stats for a file"""
+        result = await db.execute(
+            select(FileColumnStats).where(FileColumnStats.file_id == file_id)
+        )
+        return {
+            row.column_name: ColumnStats.from_dict(row.stats)
+            for row in result.scalars().all()
+        }
+
+    async def merge_column_stats(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        new_stats: Dict[str, ColumnStats]
+    ) -> None:
+        """Merge stats for newly added rows into the stored ones (no commit)"""
+        result = await db.execute(
+            select(FileColumnStats).where(FileColumnStats.file_id == file_id)
+        )
+        existing = {row.column_name: row for row in result.scalars().all()}
+
+        for column, stats in new_stats.items():
+            row = existing.get(column)
+            if row is None:
+                db.add(FileColumnStats(file_id=file_id, column_name=column, stats=stats.to_dict()))
+            else:
+                row.stats = ColumnStats.from_dict(row.stats).merge(stats).to_dict()
+        await db.flush()
+
+    async def rebuild_column_stats(self, db: AsyncSession, file_id: UUID) -> None:
+        """Recompute stats from the stored rows (no commit)"""
+        totals: Dict[str, ColumnStats] = {}
+        async for frame in self.iter_file_frames(db, file_id):
+            for column, stats in (await asyncio.to_thread(build_column_stats, frame)).items():
+                totals[column] = totals[column].merge(stats) if column in totals else stats
+        await db.execute(
+            delete(FileColumnStats).where(FileColumnStats.file_id == file_id)
+        )
+        await self.merge_column_stats(db, file_id, totals)
+
+    async def iter_file_rows(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[List[Tuple[int, Dict[str, Any]]]]:
+        """Stream (row_index, data) batches in row_index order (keyset paging).
+        Reads file_data as is, so archived (cold) rows are not included."""
+        batch_size = batch_size or settings.INGEST_INSERT_BATCH_ROWS
+        last_index = -1
+        while True:
+            result = await db.execute(
+                select(FileData.row_index, FileData.data)
+                .where(FileData.file_id == file_id, FileData.row_index > last_index)
+                .order_by(FileData.row_index)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                return
+            last_index = rows[-1].row_index
+            yield [(row.row_index, row.data) for row in rows]
+
+    async def iter_file_frames(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        batch_size: Optional[int] = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """Stream a file's rows as DataFrames indexed by row_index, rehydrating
+        the file first if it is cold and keeping it hot until the last one"""
+        file = await self.get_file_by_id(db, file_id)
+        if not file:
+            return
+        async with self.tiering_service.hot(db, file):
+            async for rows in self.iter_file_rows(db, file_id, batch_size):
+                yield pd.DataFrame(
+                    [data for _, data in rows],
+                    index=pd.Index([row_index for row_index, _ in rows], name="row_index")
+                )
+
+    async def process_batch(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        items: List[Tuple[str, bytes, Optional[str]]],
+        concurrency: int
+    ) -> List[Dict[str, Any]]:
+        """Ingest many files concurrently, at most `concurrency` at a time.
+
+        Every file gets its own session so a failure only affects that file,
+        and the semaphore keeps us from checking out more connections than
+        the pool can hand out. Results come back in input order.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def ingest_one(original_name: str, content: bytes, content_type: Optional[str]):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session_factory() as db:
+                        file_record = await self.ingest_content(db, original_name, content, content_type)
+                    return {
+                        "filename": original_name,
+                        "status": "uploaded",
+                        "file": file_record,
+                        "error": None,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+                    }
+                except Exception as e:
+                    return {
+                        "filename": original_name,
+                        "status": "failed",
+                        "file": None,
+                        "error": str(e),
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+                    }
+
+        return await asyncio.gather(
+            *(ingest_one(name, content, content_type) for name, content, content_type in items)
+        )
     
     async def get_all_files(
         self, 
@@ -86,9 +438,11 @@ class FileService:
         skip: int = 0, 
         limit: int = 100
     ) -> List[File]:
-        """Get all files with pagination"""
+        """Get all files with pagination; chunked uploads in progress are
+        left out until they are finalized"""
         result = await db.execute(
             select(File)
+            .where(File.status == "ready")
             .order_by(File.created_at.desc())
             .offset(skip)
             .limit(limit)
@@ -98,12 +452,15 @@ class FileService:
     async def get_file_by_id(
         self, 
         db: AsyncSession, 
-        file_id: UUID
+        file_id: UUID,
+        include_uploading: bool = False
     ) -> Optional[File]:
-        """Get file by ID"""
-        result = await db.execute(
-            select(File).where(File.id == file_id)
-        )
+        """Get file by ID. Files of unfinished chunked uploads are only
+        returned with `include_uploading`"""
+        query = select(File).where(File.id == file_id)
+        if not include_uploading:
+            query = query.where(File.status == "ready")
+        result = await db.execute(query)
         return result.scalar_one_or_none()
     
     async def get_file_data(
@@ -111,34 +468,56 @@ class FileService:
         db: AsyncSession,
         file_id: UUID,
         skip: int = 0,
-        limit: int = 50
+        limit: int = 50,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        include_computed: bool = False
     ) -> Dict[str, Any]:
-        """Get paginated file data"""
+        """Get paginated file data, optionally sorted by a stored or computed
+        column and with computed column values added"""
         # Get file
         file = await self.get_file_by_id(db, file_id)
         if not file:
             raise ValueError("File not found")
-        
-        # Get total count
-        total_count = await db.scalar(
-            select(func.count(FileData.id))
-            .where(FileData.file_id == file_id)
-        )
-        
-        # Get paginated data
-        result = await db.execute(
-            select(FileData)
-            .where(FileData.file_id == file_id)
-            .order_by(FileData.row_index)
-            .offset(skip)
-            .limit(limit)
-        )
-        
-        file_data = result.scalars().all()
+        if file.storage_tier == "cold" and is_replica_session(db):
+            # Rows are rehydrated on the primary; read them there instead of
+            # waiting for the replica to catch up
+            async with primary_session(db) as primary_db:
+                return await self.get_file_data(
+                    primary_db, file_id, skip, limit, sort_by, descending, include_computed
+                )
+        async with self.tiering_service.hot(db, file):
+            # Get total count
+            total_count = await db.scalar(
+                select(func.count(FileData.id))
+                .where(FileData.file_id == file_id)
+            )
+
+            # Get paginated data, in time order for time-indexed files
+            if sort_by:
+                order = await self.computed_column_service.sort_order(db, file, sort_by, descending)
+            else:
+                order = await self.default_order(db, file)
+            if order is not None:
+                rows = await self.get_rows_by_index(db, file_id, order[skip:skip + limit].tolist())
+            else:
+                result = await db.execute(
+                    select(FileData.row_index, FileData.data)
+                    .where(FileData.file_id == file_id)
+                    .order_by(FileData.row_index)
+                    .offset(skip)
+                    .limit(limit)
+                )
+                rows = [(row.row_index, row.data) for row in result.all()]
+
+            if include_computed:
+                data = await self.computed_column_service.attach(db, file, rows)
+            else:
+                data = [row_data for _, row_data in rows]
         
         return {
             "file": file,
-            "data": [row.data for row in file_data],
+            "data": data,
             "pagination": {
                 "page": skip // limit + 1,
                 "limit": limit,
@@ -146,6 +525,49 @@ class FileService:
                 "pages": (total_count + limit - 1) // limit
             }
         }
+
+    async def get_rows_by_index(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        row_indexes: List[int]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """(row_index, data) of the given rows, in the order asked for"""
+        if not row_indexes:
+            return []
+        result = await db.execute(
+            select(FileData.row_index, FileData.data)
+            .where(FileData.file_id == file_id, FileData.row_index.in_(row_indexes))
+        )
+        by_index = {row.row_index: row.data for row in result.all()}
+        return [(row_index, by_index[row_index]) for row_index in row_indexes if row_index in by_index]
+
+    async def iter_export_rows(
+        self,
+        db: AsyncSession,
+        file: File,
+        columns: List[str],
+        sort_by: Optional[str] = None,
+        descending: bool = False
+    ) -> AsyncIterator[List[List[Any]]]:
+        """Stream rows for export as value lists in `columns` order. Computed
+        columns come from their cached vectors; call with a hot file."""
+        computed = [column for column in columns if column in self.computed_column_service.definitions(file)]
+        batch_size = settings.EXPORT_BATCH_ROWS
+        if sort_by:
+            order = await self.computed_column_service.sort_order(db, file, sort_by, descending)
+        else:
+            order = await self.default_order(db, file)
+        if order is not None:
+            batches = (
+                await self.get_rows_by_index(db, file.id, order[start:start + batch_size].tolist())
+                for start in range(0, len(order), batch_size)
+            )
+        else:
+            batches = self.iter_file_rows(db, file.id, batch_size)
+        async for rows in batches:
+            records = await self.computed_column_service.attach(db, file, rows, computed)
+            yield [[record.get(column) for column in columns] for record in records]
     
     async def delete_file(
         self,
@@ -162,10 +584,27 @@ class FileService:
         if os.path.exists(file.file_path):
             os.remove(file.file_path)
         
+        for append in (file.file_metadata or {}).get("appends", []):
+            if os.path.exists(append["file_path"]):
+                os.remove(append["file_path"])
+        
+        archive_path = (file.file_metadata or {}).get("storage", {}).get("archive_path")
+        if archive_path and os.path.exists(archive_path):
+            os.remove(archive_path)
+        
         # Delete FileData records
         await db.execute(
             delete(FileData).where(FileData.file_id == file_id)
         )
+        await db.execute(
+            delete(FileColumnStats).where(FileColumnStats.file_id == file_id)
+        )
+        await self.timeseries_service.delete_rollups(db, file_id)
+        self.search_service.delete_index(file_id)
+        self.computed_column_service.remove_cache(file_id)
+        await db.execute(
+            delete(FileAnomaly).where(FileAnomaly.file_id == file_id)
+        )
         
         # Delete File record
         await db.delete(file)
@@ -175,5 +614,9 @@ class FileService:
     
     async def get_file_count(self, db: AsyncSession) -> int:
         """Get total number of files"""
-        result = await db.scalar(select(func.count(File.id)))
-        return result or 0 
+        result = await db.scalar(select(func.count(File.id)).where(File.status == "ready"))
+        return result or 0
+
+
+# Shared by the routers and background tasks of this worker
+file_service = FileService(settings.UPLOAD_DIR)
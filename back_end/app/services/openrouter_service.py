@@ -1,8 +1,36 @@
 import httpx
 import json
-from typing import List, Dict, Any
+import os
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional
 from app.config import settings
 
+# One pooled client per worker, opened in the app lifespan (never at import,
+# so forked workers don't share the parent's connections)
+_client: Optional[httpx.AsyncClient] = None
+
+
+async def open_client() -> None:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_connections=settings.ADMISSION_AI_CONCURRENCY * 2))
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _forget_client() -> None:
+    global _client
+    _client = None
+
+
+os.register_at_fork(after_in_child=_forget_client)
+
+
 class OpenRouterService:
     def __init__(self):
         self.api_key = settings.OPENROUTER_API_KEY
@@ -36,8 +64,59 @@ class OpenRouterService:
         Provide your analysis in a structured format with clear sections.
         """
         
-        # Make API request
+        return await self._chat_completion(prompt)
+
+    async def analyze_profile(self, profile: Dict[str, Any], query: str = None) -> Dict[str, Any]:
+        """Analyze a whole file from its precomputed stats and anomaly list.
+
+        The profile covers every row (column stats and flagged outliers)
+        yet is far smaller than a raw row dump.
+        """
+        if not self.api_key:
+            raise ValueError("OpenRouter API key not configured")
+
+        if not query:
+            query = """
+            Analyze this financial dataset and provide insights on:
+            1. Key trends and patterns
+            2. The flagged anomalies: which look like genuine problems and why
+            3. Recommendations
+            4. Summary statistics
+            """
+
+        prompt = f"""
+        {query}
+        
+        The dataset has {profile["row_count"]} rows. All statistics and anomalies
+        below were computed locally over every row, not a sample.
+        
+        Column statistics:
+        {json.dumps(profile["columns"], indent=2, default=str)}
+        
+        Anomaly summary (counts by detector):
+        {json.dumps(profile["anomaly_summary"], indent=2, default=str)}
+        
+        Top anomalies (highest score first, with the flagged row):
+        {json.dumps(profile["anomalies"], indent=2, default=str)}
+        
+        Provide your analysis in a structured format with clear sections.
+        """
+
+        return await self._chat_completion(prompt)
+
+    @staticmethod
+    @asynccontextmanager
+    async def _http_client():
+        """The worker's shared client, or a one-off one outside the app"""
+        if _client is not None:
+            yield _client
+            return
         async with httpx.AsyncClient() as client:
+            yield client
+
+    async def _chat_completion(self, prompt: str) -> Dict[str, Any]:
+        """Send a single-prompt analysis request and return the reply text"""
+        async with self._http_client() as client:
             response = await client.post(
                 f"{self.base_url}/chat/completions",
                 headers={
@@ -89,7 +168,7 @@ class OpenRouterService:
         Respond in JSON format.
         """
         
-        async with httpx.AsyncClient() as client:
+        async with self._http_client() as client:
             response = await client.post(
                 f"{self.base_url}/chat/completions",
                 headers={
@@ -0,0 +1,357 @@
+import asyncio
+import math
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.file_model import File, FileData
+from app.services.timeseries_service import parse_times
+
+KEY_SEPARATOR = "\x1f"
+
+CATEGORIES = ("matched", "mismatched", "unmatched_left", "unmatched_right")
+
+
+def _key_series(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Composite join key; 10, 10.0 and " 10" compare equal"""
+    parts = []
+    for column in columns:
+        series = df[column]
+        keys = series.astype("string").str.strip().fillna("")
+        numeric = pd.to_numeric(series, errors="coerce")
+        is_numeric = numeric.notna()
+        if is_numeric.any():
+            keys[is_numeric] = numeric[is_numeric].map("{:.15g}".format)
+        parts.append(keys)
+    key = parts[0]
+    for part in parts[1:]:
+        key = key + KEY_SEPARATOR + part
+    return key.astype(object)
+
+
+def project(
+    frame: pd.DataFrame,
+    key_columns: List[str],
+    amount_column: Optional[str],
+    date_column: Optional[str]
+) -> pd.DataFrame:
+    """Reduce a frame indexed by row_index to what the join needs"""
+    return pd.DataFrame({
+        "key": _key_series(frame, key_columns).to_numpy(),
+        "row_index": frame.index.to_numpy(dtype=np.int64),
+        "amount": (
+            pd.to_numeric(frame[amount_column], errors="coerce").to_numpy(dtype=float)
+            if amount_column else np.nan
+        ),
+        "date": (
+            parse_times(frame[date_column]).to_numpy()
+            if date_column else np.datetime64("NaT")
+        ),
+    })
+
+
+def empty_projection() -> pd.DataFrame:
+    return pd.DataFrame({
+        "key": pd.Series(dtype=object),
+        "row_index": pd.Series(dtype=np.int64),
+        "amount": pd.Series(dtype=float),
+        "date": pd.Series(dtype="datetime64[ns]"),
+    })
+
+
+class ReconciliationResult:
+    """Counts per category plus the first `limit` pairs/rows of each"""
+
+    def __init__(self, limit: int, build_is_left: bool):
+        self.limit = limit
+        self.build_is_left = build_is_left
+        self.counts = {category: 0 for category in CATEGORIES}
+        self.samples: Dict[str, List[Dict[str, Any]]] = {category: [] for category in CATEGORIES}
+
+    def _room(self, category: str) -> int:
+        return self.limit - len(self.samples[category])
+
+    def add_pairs(self, category: str, pairs: pd.DataFrame) -> None:
+        """`pairs` has build_row, probe_row, amount_diff, date_diff (build - probe)"""
+        self.counts[category] += len(pairs)
+        room = self._room(category)
+        if room <= 0 or pairs.empty:
+            return
+        sign = 1 if self.build_is_left else -1
+        for pair in pairs.head(room).itertuples(index=False):
+            left, right = (pair.build_row, pair.probe_row) if self.build_is_left else (pair.probe_row, pair.build_row)
+            sample = {
+                "left_row_index": int(left),
+                "right_row_index": int(right),
+                "amount_difference": None if pd.isna(pair.amount_diff) else float(sign * pair.amount_diff) + 0.0,
+                "date_difference_days": None if pd.isna(pair.date_diff) else float(sign * pair.date_diff) + 0.0,
+            }
+            if category == "mismatched":
+                sample["reasons"] = pair.reasons
+            self.samples[category].append(sample)
+
+    def add_rows(self, side: str, row_indexes: np.ndarray) -> None:
+        """Unmatched rows of the "build" or "probe" side"""
+        is_left = (side == "build") == self.build_is_left
+        category = "unmatched_left" if is_left else "unmatched_right"
+        self.counts[category] += len(row_indexes)
+        for row_index in row_indexes[:max(0, self._room(category))].tolist():
+            self.samples[category].append({"row_index": int(row_index)})
+
+
+class PartitionJoin:
+    """In-memory hash join of one partition.
+
+    The build side is held as a frame with a `consumed` flag per row; probe
+    rows stream through in chunks and are paired one-to-one with unconsumed
+    build rows of the same key in a single pass:
+
+    1. Identical rows (same key, amount and date) pair off by their rank
+       within that group, so duplicate-heavy keys cost no more than unique ones.
+    2. The rest of each key pair off by rank in (amount, date) order, which
+       lines each probe row up with its nearest build row when both sides
+       hold the same transactions; pairs within the amount and date
+       tolerances match.
+
+    Probe rows whose key exists but found no partner wait until the end,
+    when they are paired in order with the build rows left over for that key
+    and reported as mismatched. Only as many wait per key as the key has
+    unconsumed build rows; later ones can never get a partner and are
+    reported unmatched right away, so waiting rows never outnumber the
+    build side of the partition.
+    """
+
+    VALUE_COLUMNS = ["key", "amount", "date"]
+
+    def __init__(
+        self,
+        build: pd.DataFrame,
+        amount_tolerance: float,
+        date_tolerance_days: float,
+        result: ReconciliationResult
+    ):
+        # Kept in rank order so the unconsumed rows of any key are already ranked
+        self.build = self._sorted(build).reset_index(drop=True).reset_index(names="build_pos")
+        self.amount_tolerance = amount_tolerance
+        self.date_tolerance_days = date_tolerance_days
+        self.result = result
+        self.consumed = np.zeros(len(self.build), dtype=bool)
+        # Per distinct build key: unconsumed build rows and waiting probe rows
+        codes, self.keys = pd.factorize(self.build["key"])
+        self.remaining = np.bincount(codes, minlength=len(self.keys))
+        self.waiting = np.zeros(len(self.keys), dtype=np.int64)
+        self.pending: List[pd.DataFrame] = []
+
+    @staticmethod
+    def _differences(pairs: pd.DataFrame) -> pd.DataFrame:
+        return pairs.assign(
+            amount_diff=pairs["amount_b"] - pairs["amount_p"],
+            date_diff=(pairs["date_b"] - pairs["date_p"]) / pd.Timedelta(days=1)
+        )
+
+    @staticmethod
+    def _sorted(frame: pd.DataFrame) -> pd.DataFrame:
+        return frame.sort_values(["key", "amount", "date", "row_index"], kind="stable", na_position="last")
+
+    @staticmethod
+    def _ranked(frame: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+        """Number the rows of a `_sorted` frame within each `by` group"""
+        return frame.assign(n=frame.groupby(by, dropna=False, sort=False).cumcount())
+
+    def probe(self, chunk: pd.DataFrame) -> None:
+        known = self.keys.get_indexer(chunk["key"]) >= 0
+        self.result.add_rows("probe", chunk.loc[~known, "row_index"].to_numpy())
+        chunk = self._sorted(chunk[known])
+
+        build = self.build[~self.consumed & self.build["key"].isin(chunk["key"]).to_numpy()]
+        exact = self._ranked(chunk, self.VALUE_COLUMNS).merge(
+            self._ranked(build, self.VALUE_COLUMNS), on=self.VALUE_COLUMNS + ["n"], suffixes=("_p", "_b")
+        )
+        exact = exact.assign(amount_p=exact["amount"], amount_b=exact["amount"], date_p=exact["date"], date_b=exact["date"])
+
+        chunk_rest = chunk[~chunk["row_index"].isin(exact["row_index_p"])]
+        build_rest = build[~build["build_pos"].isin(exact["build_pos"])]
+        ranked = self._differences(
+            self._ranked(chunk_rest, ["key"]).merge(self._ranked(build_rest, ["key"]), on=["key", "n"], suffixes=("_p", "_b"))
+        )
+        amount_diff, date_diff = ranked["amount_diff"].abs(), ranked["date_diff"].abs()
+        # Missing values only match missing values
+        within = (amount_diff <= self.amount_tolerance) | (ranked["amount_b"].isna() & ranked["amount_p"].isna())
+        within &= (date_diff <= self.date_tolerance_days) | (ranked["date_b"].isna() & ranked["date_p"].isna())
+
+        pairs = pd.concat([self._differences(exact), ranked[within]])
+        self.consumed[pairs["build_pos"].to_numpy()] = True
+        np.subtract.at(self.remaining, self.keys.get_indexer(pairs["key"]), 1)
+        self.result.add_pairs("matched", pairs.rename(columns={"row_index_b": "build_row", "row_index_p": "probe_row"}))
+
+        # finish() pairs waiting rows in arrival order with what is left of
+        # their key, which is at most what is unconsumed now
+        rest = chunk_rest[~chunk_rest["row_index"].isin(pairs["row_index_p"])]
+        codes = self.keys.get_indexer(rest["key"])
+        rank = rest.groupby("key", sort=False).cumcount().to_numpy() + self.waiting[codes]
+        waits = rank < self.remaining[codes]
+        self.result.add_rows("probe", rest.loc[~waits, "row_index"].to_numpy())
+        np.add.at(self.waiting, codes[waits], 1)
+        self.pending.append(rest[waits])
+
+    def finish(self) -> None:
+        """Pair leftover probe rows with leftover build rows of the same key"""
+        pending = pd.concat(self.pending) if self.pending else empty_projection()
+        leftover = self.build[~self.consumed]
+
+        pending = pending.assign(n=pending.groupby("key").cumcount())
+        leftover = leftover.assign(n=leftover.groupby("key").cumcount())
+        pairs = self._differences(pending.merge(leftover, on=["key", "n"], suffixes=("_p", "_b")))
+
+        reasons = pd.Series([[] for _ in range(len(pairs))], index=pairs.index, dtype=object)
+        if len(pairs):
+            amount_off = ~(pairs["amount_diff"].abs() <= self.amount_tolerance) & ~(pairs["amount_b"].isna() & pairs["amount_p"].isna())
+            date_off = ~(pairs["date_diff"].abs() <= self.date_tolerance_days) & ~(pairs["date_b"].isna() & pairs["date_p"].isna())
+            reasons = [
+                [reason for reason, off in (("amount", a), ("date", d)) if off]
+                for a, d in zip(amount_off.tolist(), date_off.tolist())
+            ]
+        pairs["reasons"] = reasons
+        self.result.add_pairs("mismatched", pairs.rename(columns={"row_index_b": "build_row", "row_index_p": "probe_row"}))
+
+        self.result.add_rows("probe", pending.loc[~pending["row_index"].isin(pairs["row_index_p"]), "row_index"].to_numpy())
+        self.result.add_rows("build", leftover.loc[~leftover["row_index"].isin(pairs["row_index_b"]), "row_index"].to_numpy())
+
+
+class ReconciliationService:
+    """Reconciles two stored files (e.g. a bank statement against a ledger)
+    with a streaming hash join.
+
+    The smaller file is the build side. When it has more rows than
+    RECONCILE_MEMORY_ROWS, both sides are hash-partitioned on the key to
+    spill files first (grace hash join), and partitions are joined one at a
+    time. Only keys, amounts, dates and row indexes are held or spilled;
+    full rows are loaded for the returned samples only.
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+
+    async def _projected_frames(self, db: AsyncSession, file_id: UUID, columns: Dict[str, Any]):
+        async for frame in self.file_service.iter_file_frames(db, file_id):
+            yield await asyncio.to_thread(project, frame, **columns)
+
+    async def reconcile(
+        self,
+        db: AsyncSession,
+        left: File,
+        right: File,
+        left_columns: Dict[str, Any],
+        right_columns: Dict[str, Any],
+        amount_tolerance: float = 0.0,
+        date_tolerance_days: float = 0.0,
+        limit: int = 100
+    ) -> Dict[str, Any]:
+        """`*_columns` hold key_columns, amount_column and date_column per side"""
+        started = time.perf_counter()
+        build_is_left = (left.row_count or 0) <= (right.row_count or 0)
+        build_file, probe_file = (left, right) if build_is_left else (right, left)
+        build_columns, probe_columns = (left_columns, right_columns) if build_is_left else (right_columns, left_columns)
+        result = ReconciliationResult(limit, build_is_left)
+
+        build_rows = build_file.row_count or 0
+        partitions = 1
+        if build_rows > settings.RECONCILE_MEMORY_ROWS:
+            # Twice the minimum, so moderately skewed keys still fit
+            partitions = 2 * math.ceil(build_rows / settings.RECONCILE_MEMORY_ROWS)
+
+        if partitions == 1:
+            build_frames = [frame async for frame in self._projected_frames(db, build_file.id, build_columns)]
+            build = pd.concat(build_frames) if build_frames else empty_projection()
+            join = PartitionJoin(build, amount_tolerance, date_tolerance_days, result)
+            async for chunk in self._projected_frames(db, probe_file.id, probe_columns):
+                await asyncio.to_thread(join.probe, chunk)
+            await asyncio.to_thread(join.finish)
+        else:
+            with tempfile.TemporaryDirectory(dir=settings.RECONCILE_SPILL_DIR or None) as spill_dir:
+                for side, file, columns in (("build", build_file, build_columns), ("probe", probe_file, probe_columns)):
+                    chunk_number = 0
+                    async for chunk in self._projected_frames(db, file.id, columns):
+                        await asyncio.to_thread(self._spill, spill_dir, side, chunk_number, chunk, partitions)
+                        chunk_number += 1
+
+                for partition in range(partitions):
+                    build = await asyncio.to_thread(self._read_spill, spill_dir, "build", partition)
+                    join = PartitionJoin(build, amount_tolerance, date_tolerance_days, result)
+                    for path in self._spill_paths(spill_dir, "probe", partition):
+                        await asyncio.to_thread(join.probe, pd.read_pickle(path))
+                    await asyncio.to_thread(join.finish)
+
+        await self._attach_rows(db, left.id, right.id, result)
+        return {
+            "left_file_id": left.id,
+            "right_file_id": right.id,
+            "summary": {
+                "left_rows": left.row_count or 0,
+                "right_rows": right.row_count or 0,
+                **result.counts,
+                "build_side": "left" if build_is_left else "right",
+                "partitions": partitions,
+                "spilled": partitions > 1,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+            },
+            **result.samples
+        }
+
+    @staticmethod
+    def _spill(spill_dir: str, side: str, chunk_number: int, chunk: pd.DataFrame, partitions: int) -> None:
+        buckets = pd.util.hash_pandas_object(chunk["key"], index=False).to_numpy() % np.uint64(partitions)
+        for partition, part in chunk.groupby(buckets):
+            part.to_pickle(os.path.join(spill_dir, f"{side}_{partition}_{chunk_number}.pkl"))
+
+    @staticmethod
+    def _spill_paths(spill_dir: str, side: str, partition: int) -> List[str]:
+        prefix = f"{side}_{partition}_"
+        names = [name for name in os.listdir(spill_dir) if name.startswith(prefix)]
+        return [
+            os.path.join(spill_dir, name)
+            for name in sorted(names, key=lambda name: int(name[len(prefix):-len(".pkl")]))
+        ]
+
+    @classmethod
+    def _read_spill(cls, spill_dir: str, side: str, partition: int) -> pd.DataFrame:
+        parts = [pd.read_pickle(path) for path in cls._spill_paths(spill_dir, side, partition)]
+        return pd.concat(parts) if parts else empty_projection()
+
+    async def _attach_rows(self, db: AsyncSession, left_id: UUID, right_id: UUID, result: ReconciliationResult) -> None:
+        """Load the full rows referenced by the returned samples"""
+        wanted: Dict[UUID, set] = {left_id: set(), right_id: set()}
+        for category in ("matched", "mismatched"):
+            for sample in result.samples[category]:
+                wanted[left_id].add(sample["left_row_index"])
+                wanted[right_id].add(sample["right_row_index"])
+        wanted[left_id].update(sample["row_index"] for sample in result.samples["unmatched_left"])
+        wanted[right_id].update(sample["row_index"] for sample in result.samples["unmatched_right"])
+
+        rows: Dict[Tuple[UUID, int], Any] = {}
+        for file_id, row_indexes in wanted.items():
+            row_indexes = sorted(row_indexes)
+            for offset in range(0, len(row_indexes), settings.INGEST_INSERT_BATCH_ROWS):
+                batch = row_indexes[offset:offset + settings.INGEST_INSERT_BATCH_ROWS]
+                query_result = await db.execute(
+                    select(FileData.row_index, FileData.data).where(
+                        FileData.file_id == file_id, FileData.row_index.in_(batch)
+                    )
+                )
+                rows.update({(file_id, row.row_index): row.data for row in query_result.all()})
+
+        for category in ("matched", "mismatched"):
+            for sample in result.samples[category]:
+                sample["left"] = rows.get((left_id, sample["left_row_index"]))
+                sample["right"] = rows.get((right_id, sample["right_row_index"]))
+        for category, file_id in (("unmatched_left", left_id), ("unmatched_right", right_id)):
+            for sample in result.samples[category]:
+                sample["row"] = rows.get((file_id, sample["row_index"]))
@@ -0,0 +1,496 @@
+import asyncio
+import bisect
+import gzip
+import json
+import math
+import os
+import re
+import shutil
+import time
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.file_model import FileData, SEARCH_TS_CONFIG, search_vector
+from app.utils.shared_state import shared_state
+
+# Tokenizer of the Python backend. PostgreSQL tokenizes with its own
+# parser ("simple" config), both rows and queries.
+TOKEN_PATTERN = r"\w+"
+
+# Score weights for how a query term matched an indexed term
+EXACT_WEIGHT, PREFIX_WEIGHT, FUZZY_WEIGHT = 1.0, 0.8, 0.6
+
+# BM25 term-frequency saturation
+BM25_K1 = 1.2
+
+# An index is written as append-only segments; past this many they are
+# merged into one
+MAX_SEGMENTS = 8
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(TOKEN_PATTERN, text.lower())
+
+
+def _text_columns(df: pd.DataFrame) -> List[str]:
+    """Columns whose values are mostly strings (numbers are not indexed)"""
+    columns = []
+    for column in df.columns:
+        series = df[column].dropna()
+        if series.empty or pd.api.types.is_numeric_dtype(series):
+            continue
+        if pd.to_numeric(series, errors="coerce").notna().mean() < 0.9:
+            columns.append(column)
+    return columns
+
+
+def build_postings(df: pd.DataFrame, start_index: int) -> pd.DataFrame:
+    """(term, row_index, tf) for every string token in `df`, vectorized"""
+    parts = []
+    for column in _text_columns(df):
+        tokens = df[column].dropna().astype(str).str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+        if not tokens.empty:
+            parts.append(pd.DataFrame({"term": tokens.to_numpy(), "row": tokens.index.to_numpy() + start_index}))
+    if not parts:
+        return pd.DataFrame({"term": [], "row": [], "tf": []})
+    postings = pd.concat(parts, ignore_index=True)
+    return postings.groupby(["term", "row"], sort=True).size().rename("tf").reset_index()
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def fuzzy_limit(term: str) -> int:
+    return 0 if len(term) <= 3 else 1 if len(term) <= 7 else 2
+
+
+def bigrams(term: str) -> Set[str]:
+    return {term[position:position + 2] for position in range(len(term) - 1)}
+
+
+def tsquery_lexeme(lexeme: str, prefix: bool = False) -> str:
+    """Quote a lexeme for to_tsquery, optionally as a prefix match"""
+    quoted = "'" + lexeme.replace("\\", "\\\\").replace("'", "''") + "'"
+    return f"{quoted}:*" if prefix else quoted
+
+
+class SearchIndex:
+    """Per-file inverted index: term -> document frequency, plus postings
+    (row indexes and term frequencies) when the Python backend is in use.
+
+    The sorted vocabulary serves prefix lookups by bisection. Fuzzy lookups
+    only compare terms that can be within the edit limit: lengths close
+    enough, and enough shared bigrams (one edit breaks at most two).
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.rows = data.get("rows", 0)
+        self.terms: Dict[str, Dict[str, Any]] = data.get("terms", {})
+        self._reset()
+
+    def _reset(self) -> None:
+        self._vocabulary: Optional[List[str]] = None
+        self._by_length: Optional[Dict[int, List[str]]] = None
+        self._by_bigram: Optional[Dict[str, List[str]]] = None
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def vocabulary(self) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.terms)
+        return self._vocabulary
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, tf) arrays for a term, converted once per loaded index"""
+        if term not in self._postings:
+            entry = self.terms[term]
+            self._postings[term] = (
+                np.asarray(entry["rows"], dtype=np.int64),
+                np.asarray(entry["tf"], dtype=float)
+            )
+        return self._postings[term]
+
+    def add(self, postings: pd.DataFrame, rows: int, with_postings: bool) -> None:
+        self.rows += rows
+        for term, group in postings.groupby("term", sort=False):
+            entry = self.terms.setdefault(term, {"df": 0})
+            entry["df"] += len(group)
+            if with_postings:
+                entry.setdefault("rows", []).extend(group["row"].astype(int).tolist())
+                entry.setdefault("tf", []).extend(group["tf"].astype(int).tolist())
+        self._reset()
+
+    def merge(self, other: "SearchIndex") -> None:
+        """Fold in the index of other rows (another segment)"""
+        self.rows += other.rows
+        for term, entry in other.terms.items():
+            mine = self.terms.get(term)
+            if mine is None:
+                self.terms[term] = {key: list(value) if isinstance(value, list) else value for key, value in entry.items()}
+                continue
+            mine["df"] += entry["df"]
+            if "rows" in entry:
+                mine.setdefault("rows", []).extend(entry["rows"])
+                mine.setdefault("tf", []).extend(entry["tf"])
+        self._reset()
+
+    def _fuzzy_candidates(self, term: str, limit: int) -> List[str]:
+        if self._by_length is None:
+            self._by_length = {}
+            for candidate in self.vocabulary:
+                self._by_length.setdefault(len(candidate), []).append(candidate)
+
+        # Every edit removes at most two of the term's distinct bigrams
+        grams = bigrams(term)
+        needed = len(grams) - 2 * limit
+        if needed <= 0:
+            return [
+                candidate
+                for length in range(len(term) - limit, len(term) + limit + 1)
+                for candidate in self._by_length.get(length, [])
+            ]
+
+        if self._by_bigram is None:
+            self._by_bigram = {}
+            for candidate in self.vocabulary:
+                for gram in bigrams(candidate):
+                    self._by_bigram.setdefault(gram, []).append(candidate)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._by_bigram.get(gram, []))
+        return [
+            candidate for candidate, count in shared.items()
+            if count >= needed and abs(len(candidate) - len(term)) <= limit
+        ]
+
+    def expand(self, term: str, prefix: bool, fuzzy: bool) -> Dict[str, float]:
+        """Indexed terms matching one query term, with their match weight.
+        Fuzzy expansion is CPU work; call it from a worker thread."""
+        matches = {}
+        if term in self.terms:
+            matches[term] = EXACT_WEIGHT
+        if prefix:
+            vocabulary = self.vocabulary
+            position = bisect.bisect_left(vocabulary, term)
+            while position < len(vocabulary) and vocabulary[position].startswith(term):
+                matches.setdefault(vocabulary[position], PREFIX_WEIGHT)
+                position += 1
+        if fuzzy and fuzzy_limit(term):
+            limit = fuzzy_limit(term)
+            for candidate in self._fuzzy_candidates(term, limit):
+                if candidate not in matches and bounded_edit_distance(term, candidate, limit) <= limit:
+                    matches[candidate] = FUZZY_WEIGHT
+        return matches
+
+    def search(self, groups: List[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25-style scores for rows matching every group. Returns (rows, scores)."""
+        all_rows, all_scores, group_ids = [], [], []
+        for group_id, group in enumerate(groups):
+            for term, weight in group.items():
+                rows, tf = self.postings(term)
+                df = self.terms[term]["df"]
+                idf = math.log(1 + (self.rows - df + 0.5) / (df + 0.5))
+                all_rows.append(rows)
+                all_scores.append(weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1))
+                group_ids.append(np.full(len(tf), group_id, dtype=np.int64))
+        if not all_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores), minlength=len(rows))
+        # A row matches when every group hit it at least once
+        hits = np.unique(inverse * len(groups) + np.concatenate(group_ids))
+        matched = np.bincount(hits // len(groups), minlength=len(rows)) == len(groups)
+
+        rows, scores = rows[matched], scores[matched]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": 2, "rows": self.rows, "terms": self.terms}
+
+
+class SearchService:
+    """Full-text search over a file's string columns.
+
+    On PostgreSQL, rows are matched by a GIN expression index over
+    jsonb_to_tsvector(data) (see app.models.file_model.search_vector) and
+    ranked with ts_rank_cd. Queries are tokenized by PostgreSQL as well and
+    prefixes use tsquery's :* syntax, so both sides agree on what a word is;
+    the Python vocabulary is only used to add fuzzy alternatives. Elsewhere
+    (SQLite, local runs) a Python inverted index with postings is used.
+
+    Indexes live in UPLOAD_DIR/search/<file_id>/ as append-only segments:
+    an ingest writes one segment for its own rows, and once there are more
+    than MAX_SEGMENTS they are merged. A merged segment names the segments
+    it replaces, so readers never count rows twice while the old ones are
+    being removed.
+    """
+
+    def __init__(self, upload_dir: str):
+        self.index_dir = os.path.join(upload_dir, "search")
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._cache: "OrderedDict[Tuple[UUID, Tuple[str, ...]], SearchIndex]" = OrderedDict()
+
+    def _segment_dir(self, file_id: UUID) -> str:
+        return os.path.join(self.index_dir, str(file_id))
+
+    @staticmethod
+    def use_postgres(db: AsyncSession) -> bool:
+        if settings.SEARCH_BACKEND != "auto":
+            return settings.SEARCH_BACKEND == "postgres"
+        return db.get_bind().dialect.name == "postgresql"
+
+    def _segment_names(self, file_id: UUID) -> List[str]:
+        directory = self._segment_dir(file_id)
+        legacy_path = os.path.join(self.index_dir, f"{file_id}.json.gz")
+        if os.path.exists(legacy_path):
+            # Single-file index from before segments
+            os.makedirs(directory, exist_ok=True)
+            os.replace(legacy_path, os.path.join(directory, "0-legacy.json.gz"))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if name.endswith(".json.gz"))
+
+    @staticmethod
+    def _read_segment(path: str) -> Dict[str, Any]:
+        with gzip.open(path, "rt") as segment_file:
+            return json.load(segment_file)
+
+    def _read_index(self, file_id: UUID, names: List[str]) -> SearchIndex:
+        """Merge the live segments among `names`"""
+        directory = self._segment_dir(file_id)
+        segments = {}
+        for name in names:
+            try:
+                segments[name] = self._read_segment(os.path.join(directory, name))
+            except FileNotFoundError:
+                # Removed by a merge that finished since the listing
+                continue
+        replaced = {name for segment in segments.values() for name in segment.get("replaces", [])}
+        index = SearchIndex()
+        for name, segment in segments.items():
+            if name not in replaced:
+                index.merge(SearchIndex(segment))
+        return index
+
+    def load_index(self, file_id: UUID) -> SearchIndex:
+        """The file's index, keeping recently used ones in memory"""
+        names = self._segment_names(file_id)
+        if not names:
+            return SearchIndex()
+        key = (file_id, tuple(names))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        index = self._read_index(file_id, names)
+        for stale in [cached for cached in self._cache if cached[0] == file_id]:
+            del self._cache[stale]
+        self._cache[key] = index
+        while len(self._cache) > settings.SEARCH_INDEX_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return index
+
+    def _write_segment(self, file_id: UUID, index: SearchIndex, replaces: Optional[List[str]] = None) -> None:
+        directory = self._segment_dir(file_id)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.time_ns()}-{uuid4().hex[:8]}.json.gz")
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", compresslevel=5) as segment_file:
+            json.dump({**index.to_dict(), "replaces": replaces or []}, segment_file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def _replace_segments(self, file_id: UUID, index: SearchIndex, names: List[str]) -> None:
+        """Write `index` as the one segment superseding `names`, then drop them"""
+        self._write_segment(file_id, index, names)
+        for name in names:
+            path = os.path.join(self._segment_dir(file_id), name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _build_segment(df: pd.DataFrame, start_index: int, with_postings: bool) -> SearchIndex:
+        index = SearchIndex()
+        index.add(build_postings(df.reset_index(drop=True), start_index), len(df), with_postings)
+        return index
+
+    def _add_segment(self, file_id: UUID, segment: SearchIndex) -> int:
+        """Write a new segment; returns the segment count"""
+        self._write_segment(file_id, segment)
+        return len(self._segment_names(file_id))
+
+    def _add_rows(self, file_id: UUID, df: pd.DataFrame, start_index: int, with_postings: bool) -> int:
+        return self._add_segment(file_id, self._build_segment(df, start_index, with_postings))
+
+    def _merge_segments(self, file_id: UUID) -> None:
+        names = self._segment_names(file_id)
+        if len(names) > 1:
+            self._replace_segments(file_id, self._read_index(file_id, names), names)
+
+    async def build_segment(self, db: AsyncSession, df: pd.DataFrame, start_index: int) -> SearchIndex:
+        """Index rows about to be stored (row_index from `start_index`) in
+        memory. Write it with `add_segment` once the rows are committed, so a
+        failed ingest never leaves rows in the index that aren't in the file."""
+        return await asyncio.to_thread(self._build_segment, df, start_index, not self.use_postgres(db))
+
+    async def add_segment(self, file_id: UUID, segment: SearchIndex) -> None:
+        """Add a segment built by `build_segment` to the file's index"""
+        segments = await asyncio.to_thread(self._add_segment, file_id, segment)
+        if segments > MAX_SEGMENTS:
+            # One merge at a time per file across workers; a busy lock just
+            # means somebody else is merging
+            async with shared_state.lock(f"search:{file_id}", blocking=False) as acquired:
+                if acquired:
+                    await asyncio.to_thread(self._merge_segments, file_id)
+
+    async def rebuild(self, db: AsyncSession, file_id: UUID, frames: AsyncIterator[pd.DataFrame]) -> None:
+        """Index a file from scratch from frames indexed by row_index"""
+        async with shared_state.lock(f"search:{file_id}"):
+            names = await asyncio.to_thread(self._segment_names, file_id)
+            index = SearchIndex()
+            with_postings = not self.use_postgres(db)
+            async for frame in frames:
+                postings = await asyncio.to_thread(build_postings, frame, 0)
+                await asyncio.to_thread(index.add, postings, len(frame), with_postings)
+            await asyncio.to_thread(self._replace_segments, file_id, index, names)
+
+    def indexed_rows(self, file_id: UUID) -> Optional[int]:
+        """Rows covered by the file's index, None when it has none"""
+        if not self._segment_names(file_id):
+            return None
+        return self.load_index(file_id).rows
+
+    def delete_index(self, file_id: UUID) -> None:
+        shutil.rmtree(self._segment_dir(file_id), ignore_errors=True)
+        legacy_path = os.path.join(self.index_dir, f"{file_id}.json.gz")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    async def _query_lexemes(self, db: AsyncSession, query: str) -> List[str]:
+        """The query as PostgreSQL's parser splits it, i.e. the lexemes the
+        indexed vectors hold"""
+        result = await db.execute(
+            select(func.unnest(func.tsvector_to_array(func.to_tsvector(SEARCH_TS_CONFIG, query))))
+        )
+        return list(result.scalars())
+
+    async def search(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        query: str,
+        skip: int = 0,
+        limit: int = 20,
+        prefix: bool = True,
+        fuzzy: bool = False
+    ) -> Dict[str, Any]:
+        """Ranked, paginated rows matching every term of `query`"""
+        use_postgres = self.use_postgres(db)
+        if use_postgres:
+            terms = await self._query_lexemes(db, query)
+        else:
+            terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            raise ValueError("Search query must contain at least one word")
+
+        def expand() -> List[Dict[str, float]]:
+            if use_postgres and not fuzzy:
+                return [{term: EXACT_WEIGHT} for term in terms]
+            index = self.load_index(file_id)
+            if use_postgres:
+                # Prefixes are matched by PostgreSQL; only add fuzzy alternatives
+                return [{**index.expand(term, False, True), term: EXACT_WEIGHT} for term in terms]
+            return [index.expand(term, prefix, fuzzy) for term in terms]
+
+        groups = await asyncio.to_thread(expand)
+
+        if use_postgres:
+            total, hits = await self._search_postgres(db, file_id, terms, groups, skip, limit, prefix)
+        elif any(not group for group in groups):
+            total, hits = 0, []
+        else:
+            index = await asyncio.to_thread(self.load_index, file_id)
+            rows, scores = await asyncio.to_thread(index.search, groups)
+            total = len(rows)
+            page_rows = rows[skip:skip + limit].tolist()
+            page_scores = dict(zip(page_rows, scores[skip:skip + limit].tolist()))
+            data = {}
+            if page_rows:
+                result = await db.execute(
+                    select(FileData.row_index, FileData.data).where(
+                        FileData.file_id == file_id,
+                        FileData.row_index.in_(page_rows)
+                    )
+                )
+                data = {row.row_index: row.data for row in result.all()}
+            hits = [
+                {"row_index": row, "score": page_scores[row], "row": data.get(row)}
+                for row in page_rows
+            ]
+
+        return {
+            "query": query,
+            "terms": {term: sorted(group) for term, group in zip(terms, groups)},
+            "hits": hits,
+            "pagination": {
+                "page": skip // limit + 1,
+                "limit": limit,
+                "total": total,
+                "pages": (total + limit - 1) // limit
+            }
+        }
+
+    async def _search_postgres(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        terms: List[str],
+        groups: List[Dict[str, float]],
+        skip: int,
+        limit: int,
+        prefix: bool
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        tsquery_text = " & ".join(
+            "(" + " | ".join(
+                tsquery_lexeme(alternative, prefix and alternative == term) for alternative in sorted(group)
+            ) + ")"
+            for term, group in zip(terms, groups)
+        )
+        vector = search_vector(FileData.data)
+        tsquery = func.to_tsquery(SEARCH_TS_CONFIG, tsquery_text)
+        matches = [FileData.file_id == file_id, vector.op("@@")(tsquery)]
+
+        total = await db.scalar(select(func.count(FileData.id)).where(*matches)) or 0
+        rank = func.ts_rank_cd(vector, tsquery).label("rank")
+        result = await db.execute(
+            select(FileData.row_index, FileData.data, rank)
+            .where(*matches)
+            .order_by(rank.desc(), FileData.row_index)
+            .offset(skip)
+            .limit(limit)
+        )
+        return total, [
+            {"row_index": row.row_index, "score": float(row.rank), "row": row.data}
+            for row in result.all()
+        ]
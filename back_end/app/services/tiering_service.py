@@ -0,0 +1,509 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import bindparam, select, update, delete, insert, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.file_model import File, FileData
+from app.utils.shared_state import shared_state
+from app.utils.compression import (
+    EXTENSIONS, codec_for_path, compress_bytes, compress_file, decompress_bytes, default_codec
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_MAGIC = b"FDARCH1\n"
+SEGMENT_HEADER = struct.Struct(">I")
+
+# Per-worker counters reported by /api/metrics
+_counters: Dict[str, Any] = {
+    "passes": 0,
+    "raw_files_compressed": 0,
+    "raw_bytes_before": 0,
+    "raw_bytes_after": 0,
+    "files_archived": 0,
+    "rows_archived": 0,
+    "archived_row_bytes": 0,
+    "archive_bytes": 0,
+    "files_rehydrated": 0,
+    "rows_rehydrated": 0,
+    "rehydrate_ms_total": 0.0,
+    "last_pass": None,
+}
+_decisions = deque(maxlen=100)
+
+# One lock per file so archiving, compression and rehydration never overlap,
+# in a worker and (through shared_state) across workers; the File row lock
+# alone does nothing on databases without SELECT ... FOR UPDATE
+_file_locks: "weakref.WeakValueDictionary[UUID, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+@asynccontextmanager
+async def _file_lock(file_id: UUID):
+    lock = _file_locks.get(file_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _file_locks[file_id] = lock
+    # In-worker lock first, so waiting requests don't all poll the shared one
+    async with lock, shared_state.lock(f"tiering:{file_id}"):
+        yield
+
+
+class _ReadHold:
+    """One hold of a file's lock, shared by the reads of it in this worker"""
+
+    def __init__(self, file_id: UUID):
+        self.readers = 0
+        self.ready = asyncio.Event()
+        self.released = asyncio.Event()
+        self.error: Optional[BaseException] = None
+        self.task = asyncio.create_task(self._hold(file_id))
+
+    async def _hold(self, file_id: UUID) -> None:
+        try:
+            async with _file_lock(file_id):
+                self.ready.set()
+                await self.released.wait()
+        except BaseException as e:
+            # Readers waiting on `ready` re-raise it; cancellation included,
+            # or they would read without the lock
+            self.error = e
+        finally:
+            self.ready.set()
+
+
+_read_holds: Dict[UUID, _ReadHold] = {}
+# Files whose lock the current task already holds through `TieringService.hot`
+_held_files: ContextVar[frozenset] = ContextVar("tiering_held_files", default=frozenset())
+
+
+@asynccontextmanager
+async def _read_hold(file_id: UUID):
+    """Keep archiving, compression and rehydration of the file off for the
+    block. Reads in this worker share one hold instead of queueing for the
+    lock one after another; the lock is released when the last one ends."""
+    hold = _read_holds.get(file_id)
+    if hold is None:
+        hold = _read_holds[file_id] = _ReadHold(file_id)
+    hold.readers += 1
+    try:
+        await hold.ready.wait()
+        if hold.error is not None:
+            raise hold.error
+        yield
+    finally:
+        hold.readers -= 1
+        if hold.readers == 0:
+            hold.released.set()
+            if _read_holds.get(file_id) is hold:
+                del _read_holds[file_id]
+
+
+def _record(action: str, file_id: UUID, **detail) -> None:
+    _decisions.append({"action": action, "file_id": str(file_id), "at": datetime.utcnow().isoformat(), **detail})
+
+
+class AccessTracker:
+    """Remembers when files' rows were last read, in memory.
+
+    Touches are cheap (a dict write per request); `flush` writes them to
+    `files.last_accessed_at` in one bulk UPDATE every few seconds instead of
+    once per request.
+    """
+
+    def __init__(self):
+        self._pending: Dict[UUID, datetime] = {}
+        self._latest: Dict[UUID, datetime] = {}
+
+    def touch(self, file_id: UUID) -> None:
+        now = datetime.utcnow()
+        self._pending[file_id] = now
+        self._latest[file_id] = now
+
+    def last_access(self, file_id: UUID) -> Optional[datetime]:
+        return self._latest.get(file_id)
+
+    async def flush(self, db: AsyncSession) -> int:
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        existing = set((await db.execute(select(File.id).where(File.id.in_(list(pending))))).scalars().all())
+        rows = [{"file_id": file_id, "at": at} for file_id, at in pending.items() if file_id in existing]
+        if rows:
+            # Reads aren't changes: keep updated_at, which raw compression waits on
+            files = File.__table__
+            await db.execute(
+                update(files)
+                .where(files.c.id == bindparam("file_id"))
+                .values(last_accessed_at=bindparam("at"), updated_at=files.c.updated_at),
+                rows
+            )
+        await db.commit()
+        # Recent touches only need to be remembered until they are stored
+        for file_id in pending:
+            if self._latest.get(file_id) == pending[file_id]:
+                del self._latest[file_id]
+        return len(rows)
+
+
+access_tracker = AccessTracker()
+
+
+def _write_segment(handle, rows: List[Tuple[int, Dict[str, Any]]], codec: str) -> Tuple[int, int]:
+    """Append one columnar, compressed batch of rows. Returns (raw, stored) bytes."""
+    columns: List[str] = []
+    for _, data in rows:
+        for column in data:
+            if column not in columns:
+                columns.append(column)
+    payload = json.dumps({
+        "row_index": [row_index for row_index, _ in rows],
+        "columns": columns,
+        "values": [[data.get(column) for _, data in rows] for column in columns],
+    }, separators=(",", ":")).encode()
+    compressed = compress_bytes(payload, codec, settings.TIERING_COMPRESSION_LEVEL)
+    handle.write(SEGMENT_HEADER.pack(len(compressed)))
+    handle.write(compressed)
+    return len(payload), SEGMENT_HEADER.size + len(compressed)
+
+
+def _open_archive(path: str, codec: str):
+    handle = open(path, "wb")
+    handle.write(ARCHIVE_MAGIC + codec.encode() + b"\n")
+    return handle
+
+
+def _finish_archive(handle, tmp_path: str, archive_path: str) -> None:
+    with handle:
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp_path, archive_path)
+
+
+def _discard_archive(handle, tmp_path: str) -> None:
+    handle.close()
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+
+def read_archive(path: str) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """Yield the archived rows one segment at a time"""
+    with open(path, "rb") as handle:
+        if handle.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a row archive")
+        codec = handle.readline().decode().strip()
+        while True:
+            header = handle.read(SEGMENT_HEADER.size)
+            if not header:
+                return
+            (length,) = SEGMENT_HEADER.unpack(header)
+            segment = json.loads(decompress_bytes(handle.read(length), codec))
+            yield [
+                (row_index, {column: values[position] for column, values in zip(segment["columns"], segment["values"])})
+                for position, row_index in enumerate(segment["row_index"])
+            ]
+
+
+class TieringService:
+    """Moves data that nobody reads to cheaper storage.
+
+    - Raw uploads untouched for TIERING_RAW_COMPRESS_AFTER_HOURS are
+      compressed in place (zstd, or gzip when zstandard isn't installed).
+      `files.raw_tier` says whether any stored upload is still raw, so a
+      pass selects at most TIERING_BATCH_FILES candidates in SQL; appends
+      set it back to "raw".
+    - Files whose rows weren't read for TIERING_COLD_AFTER_DAYS become
+      "cold": their rows are written to a columnar, compressed archive in
+      UPLOAD_DIR/archive and deleted from file_data. Stats, rollups and the
+      search index stay, so those endpoints keep working.
+    - Reading a file's rows happens inside `hot`, which rehydrates a cold
+      file first (in its own session, so the caller's transaction isn't
+      committed early) and keeps it from being archived until the read
+      is done.
+    """
+
+    def __init__(self, file_service):
+        self.file_service = file_service
+        self.archive_dir = os.path.join(file_service.upload_dir, "archive")
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+    @asynccontextmanager
+    async def hot(self, db: AsyncSession, file: File):
+        """Record a read of the file's rows and keep them in file_data for
+        the block: rehydrated first if archived, and not archived until the
+        block ends. Wrap both the tier check and the reads (or writes) of
+        file_data in it."""
+        access_tracker.touch(file.id)
+        held = _held_files.get()
+        if file.id in held:
+            yield
+            return
+        for attempt in range(2):
+            async with _read_hold(file.id):
+                await db.refresh(file, ["storage_tier"])
+                # After one rehydrate, a replica still saying "cold" is just lagging
+                if file.storage_tier != "cold" or attempt:
+                    token = _held_files.set(held | {file.id})
+                    try:
+                        yield
+                    finally:
+                        _held_files.reset(token)
+                    return
+            # Rehydrating takes the file lock itself, so it runs between holds
+            await self.rehydrate(file.id)
+            await db.refresh(file)
+
+    @staticmethod
+    async def _lock_file(db: AsyncSession, file_id: UUID) -> Optional[File]:
+        result = await db.execute(select(File).where(File.id == file_id).with_for_update())
+        return result.scalar_one_or_none()
+
+    async def rehydrate(self, file_id: UUID) -> int:
+        """Load archived rows back into file_data. Returns rows restored."""
+        started = time.perf_counter()
+        async with _file_lock(file_id):
+            async with AsyncSessionLocal() as db:
+                file = await self._lock_file(db, file_id)
+                if not file or file.storage_tier != "cold":
+                    return 0
+
+                storage = dict((file.file_metadata or {}).get("storage", {}))
+                segments = read_archive(storage["archive_path"])
+                restored = 0
+                while True:
+                    rows = await asyncio.to_thread(next, segments, None)
+                    if rows is None:
+                        break
+                    for offset in range(0, len(rows), settings.INGEST_INSERT_BATCH_ROWS):
+                        await db.execute(
+                            insert(FileData),
+                            [
+                                {"file_id": file_id, "row_index": row_index, "data": data}
+                                for row_index, data in rows[offset:offset + settings.INGEST_INSERT_BATCH_ROWS]
+                            ]
+                        )
+                    restored += len(rows)
+
+                archive_path = storage.pop("archive_path")
+                storage.update({"tier": "hot", "rehydrated_at": datetime.utcnow().isoformat()})
+                file.file_metadata = {**(file.file_metadata or {}), "storage": storage}
+                file.storage_tier = "hot"
+                await db.commit()
+
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _counters["files_rehydrated"] += 1
+        _counters["rows_rehydrated"] += restored
+        _counters["rehydrate_ms_total"] += elapsed_ms
+        _record("rehydrate", file_id, rows=restored, elapsed_ms=round(elapsed_ms, 2))
+        return restored
+
+    async def archive(self, file_id: UUID) -> Optional[Dict[str, Any]]:
+        """Move a file's rows to a compressed archive and out of file_data"""
+        async with _file_lock(file_id):
+            async with AsyncSessionLocal() as db:
+                file = await self._lock_file(db, file_id)
+                if not file or file.storage_tier == "cold" or file.file_path.endswith(".part"):
+                    return None
+
+                codec = default_codec()
+                archive_path = os.path.join(self.archive_dir, f"{file_id}.rows")
+                tmp_path = f"{archive_path}.tmp"
+                row_count = row_bytes = archive_bytes = 0
+                # File I/O runs in threads; only the row reads stay on the loop
+                handle = await asyncio.to_thread(_open_archive, tmp_path, codec)
+                try:
+                    async for rows in self.file_service.iter_file_rows(db, file_id):
+                        raw, stored = await asyncio.to_thread(_write_segment, handle, rows, codec)
+                        row_count += len(rows)
+                        row_bytes += raw
+                        archive_bytes += stored
+                    await asyncio.to_thread(_finish_archive, handle, tmp_path, archive_path)
+                finally:
+                    await asyncio.to_thread(_discard_archive, handle, tmp_path)
+
+                await db.execute(delete(FileData).where(FileData.file_id == file_id))
+                storage = {
+                    **(file.file_metadata or {}).get("storage", {}),
+                    "tier": "cold",
+                    "archive_path": archive_path,
+                    "archive_codec": codec,
+                    "archived_rows": row_count,
+                    "archived_row_bytes": row_bytes,
+                    "archive_bytes": archive_bytes,
+                    "archived_at": datetime.utcnow().isoformat()
+                }
+                file.file_metadata = {**(file.file_metadata or {}), "storage": storage}
+                file.storage_tier = "cold"
+                await db.commit()
+
+        _counters["files_archived"] += 1
+        _counters["rows_archived"] += row_count
+        _counters["archived_row_bytes"] += row_bytes
+        _counters["archive_bytes"] += archive_bytes
+        _record("archive", file_id, rows=row_count, bytes_before=row_bytes, bytes_after=archive_bytes)
+        return storage
+
+    async def compress_raw(self, file_id: UUID) -> int:
+        """Compress the file's stored upload(s). Returns bytes saved."""
+        removed: List[str] = []
+        before = after = 0
+        async with _file_lock(file_id):
+            async with AsyncSessionLocal() as db:
+                file = await self._lock_file(db, file_id)
+                if not file or file.file_path.endswith(".part"):
+                    return 0
+
+                codec = default_codec()
+                metadata = dict(file.file_metadata or {})
+                file.raw_tier = "compressed"
+
+                async def compressed(path: str) -> str:
+                    nonlocal before, after
+                    if codec_for_path(path) or not os.path.exists(path):
+                        return path
+                    target = path + EXTENSIONS[codec]
+                    await asyncio.to_thread(compress_file, path, target, codec, settings.TIERING_COMPRESSION_LEVEL)
+                    before += os.path.getsize(path)
+                    after += os.path.getsize(target)
+                    removed.append(path)
+                    return target
+
+                file.file_path = await compressed(file.file_path)
+                if metadata.get("appends"):
+                    metadata["appends"] = [
+                        {**append, "file_path": await compressed(append["file_path"])}
+                        for append in metadata["appends"]
+                    ]
+                if not removed:
+                    await db.commit()
+                    return 0
+
+                storage = dict(metadata.get("storage", {}))
+                storage["raw_codec"] = codec
+                storage["raw_bytes_before"] = storage.get("raw_bytes_before", 0) + before
+                storage["raw_bytes_after"] = storage.get("raw_bytes_after", 0) + after
+                metadata["storage"] = storage
+                file.file_metadata = metadata
+                await db.commit()
+
+        for path in removed:
+            os.remove(path)
+        _counters["raw_files_compressed"] += len(removed)
+        _counters["raw_bytes_before"] += before
+        _counters["raw_bytes_after"] += after
+        _record("compress_raw", file_id, files=len(removed), bytes_before=before, bytes_after=after)
+        return before - after
+
+    async def run_pass(self) -> Dict[str, Any]:
+        """One tiering pass: compress settled uploads, archive cold files"""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        raw_cutoff = now - timedelta(hours=settings.TIERING_RAW_COMPRESS_AFTER_HOURS)
+        cold_cutoff = now - timedelta(days=settings.TIERING_COLD_AFTER_DAYS)
+
+        async with AsyncSessionLocal() as db:
+            await access_tracker.flush(db)
+
+            result = await db.execute(
+                select(File.id)
+                .where(File.status == "ready", File.raw_tier == "raw", File.updated_at < raw_cutoff)
+                .order_by(File.updated_at)
+                .limit(settings.TIERING_BATCH_FILES)
+            )
+            raw_candidates = result.scalars().all()
+
+            last_access = func.coalesce(File.last_accessed_at, File.created_at)
+            result = await db.execute(
+                select(File.id)
+                .where(File.status == "ready", File.storage_tier == "hot", File.row_count > 0, last_access < cold_cutoff)
+                .order_by(last_access)
+                .limit(settings.TIERING_BATCH_FILES)
+            )
+            cold_candidates = result.scalars().all()
+
+        saved = 0
+        for file_id in raw_candidates:
+            saved += await self.compress_raw(file_id)
+
+        archived = 0
+        for file_id in cold_candidates:
+            touched = access_tracker.last_access(file_id)
+            if touched and touched >= cold_cutoff:
+                _record("skip_archive", file_id, reason="accessed recently")
+                continue
+            if await self.archive(file_id):
+                archived += 1
+
+        summary = {
+            "at": now.isoformat(),
+            "raw_candidates": len(raw_candidates),
+            "raw_bytes_saved": saved,
+            "cold_candidates": len(cold_candidates),
+            "files_archived": archived,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        _counters["passes"] += 1
+        _counters["last_pass"] = summary
+        await shared_state.set("tiering:last_pass", summary)
+        return summary
+
+    async def run(self) -> None:
+        """Background loop: flush access times often, tier every interval"""
+        last_pass = None
+        while True:
+            await asyncio.sleep(settings.TIERING_ACCESS_FLUSH_SECONDS)
+            try:
+                if last_pass is None or time.monotonic() - last_pass >= settings.TIERING_INTERVAL_SECONDS:
+                    last_pass = time.monotonic()
+                    if await self._claim_pass():
+                        await self.run_pass()
+                        continue
+                async with AsyncSessionLocal() as db:
+                    await access_tracker.flush(db)
+            except Exception:
+                logger.exception("Tiering pass failed")
+
+    async def _claim_pass(self) -> bool:
+        """Every worker runs the loop; only one pass per interval is needed
+        across all of them"""
+        async with shared_state.lock("tiering-pass", blocking=False) as acquired:
+            if not acquired:
+                return False
+            last_pass_at = await shared_state.get("tiering:last_pass_at")
+            if last_pass_at and time.time() - last_pass_at < settings.TIERING_INTERVAL_SECONDS:
+                return False
+            await shared_state.set("tiering:last_pass_at", time.time())
+            return True
+
+    async def storage_summary(self, db: AsyncSession) -> Dict[str, Any]:
+        """Files and rows per tier, across all workers"""
+        result = await db.execute(
+            select(File.storage_tier, func.count(File.id), func.coalesce(func.sum(File.row_count), 0))
+            .group_by(File.storage_tier)
+        )
+        return {tier: {"files": files, "rows": int(rows)} for tier, files, rows in result.all()}
+
+
+def tiering_metrics() -> Dict[str, Any]:
+    """This worker's tiering counters and recent decisions"""
+    return {
+        **_counters,
+        "raw_bytes_saved": _counters["raw_bytes_before"] - _counters["raw_bytes_after"],
+        "row_bytes_saved": _counters["archived_row_bytes"] - _counters["archive_bytes"],
+        "recent_decisions": list(_decisions)
+    }
@@ -0,0 +1,347 @@
+import asyncio
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.file_model import FileRollup
+
+# Pseudo value column holding plain row counts per period
+ROWS_COLUMN = "__rows__"
+
+# Requested frequency -> (rollup granularity to read, pandas resample rule)
+FREQUENCIES = {
+    "D": ("day", "{n}D"),
+    "W": ("week", "{n}W-MON"),
+    "M": ("month", "{n}MS"),
+    "Q": ("month", "{n}QS"),
+    "Y": ("month", "{n}YS"),
+}
+
+AGGREGATIONS = ("count", "sum", "mean", "min", "max", "open", "close")
+
+TIME_NAME_HINTS = ("date", "time", "timestamp", "day", "period", "month")
+
+
+def infer_time_format(values: pd.Series, sample_size: int = 200) -> Optional[str]:
+    """strftime format shared by most of a sample of `values`, if any"""
+    sample = values.dropna().astype(str).head(sample_size)
+    guesses = sample.head(20).map(guess_datetime_format).dropna()
+    if guesses.empty:
+        return None
+    for candidate in guesses.value_counts().index:
+        parsed = pd.to_datetime(sample, errors="coerce", utc=True, format=candidate)
+        if parsed.notna().mean() >= 0.9:
+            return candidate
+    return None
+
+
+def parse_times(series: pd.Series) -> pd.Series:
+    """Parse a column to naive UTC timestamps, unparseable values become NaT.
+
+    The format is inferred once from a sample and the column is parsed in
+    one vectorized pass; only values that don't match it fall back to
+    per-value parsing.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = pd.to_datetime(series, errors="coerce", utc=True)
+        return parsed.dt.tz_localize(None)
+
+    text = series.astype("string")
+    time_format = infer_time_format(text)
+    if time_format is None:
+        parsed = pd.to_datetime(text, errors="coerce", utc=True, format="mixed")
+    else:
+        parsed = pd.to_datetime(text, errors="coerce", utc=True, format=time_format)
+        misfits = parsed.isna() & text.notna()
+        if misfits.any():
+            parsed[misfits] = pd.to_datetime(text[misfits], errors="coerce", utc=True, format="mixed")
+    return parsed.dt.tz_localize(None)
+
+
+def naive_utc(value: datetime) -> pd.Timestamp:
+    """A query bound as a naive UTC timestamp, matching stored periods"""
+    stamp = pd.Timestamp(value)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert("UTC").tz_localize(None)
+    return stamp
+
+
+def detect_time_column(df: pd.DataFrame, sample_size: int = 500) -> Optional[str]:
+    """Pick the column that most likely holds dates/timestamps, if any.
+
+    Numeric columns are skipped (epoch ints are too ambiguous), and values
+    must contain a digit so month names or words don't qualify.
+    """
+    candidates = []
+    for column in df.columns:
+        series = df[column].dropna()
+        if series.empty or pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+        sample = series.head(sample_size)
+        if not pd.api.types.is_datetime64_any_dtype(sample):
+            if not sample.astype(str).str.contains(r"\d").all():
+                continue
+        if parse_times(sample).notna().mean() >= 0.9:
+            candidates.append(str(column))
+
+    for column in candidates:
+        if any(hint in column.lower() for hint in TIME_NAME_HINTS):
+            return column
+    return candidates[0] if candidates else None
+
+
+def sort_by_time(
+    df: pd.DataFrame,
+    time_column: str,
+    previous: Optional[Dict[str, Any]] = None
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Stable sort by the parsed time column, unparseable times last.
+
+    Also returns the file's time order once this batch is stored after the
+    rows `previous` describes (None for a file's first batch):
+    {"sorted": whether all rows are still in time order, "last": latest
+    time so far, "missing": whether any row has no parseable time}.
+    """
+    times = parse_times(df[time_column])
+    order = times.argsort(kind="stable").to_numpy()
+    valid = times.dropna()
+    first = valid.min() if len(valid) else None
+    last = valid.max() if len(valid) else None
+
+    in_order = True
+    if previous is not None:
+        previous_last = pd.Timestamp(previous["last"]) if previous.get("last") else None
+        in_order = previous.get("sorted", False) and (
+            first is None
+            or (not previous.get("missing") and (previous_last is None or first >= previous_last))
+        )
+        if previous_last is not None and (last is None or previous_last > last):
+            last = previous_last
+
+    time_order = {
+        "sorted": bool(in_order),
+        "last": last.isoformat() if last is not None else None,
+        "missing": bool(times.isna().any()) or bool(previous and previous.get("missing"))
+    }
+    return df.iloc[order].reset_index(drop=True), time_order
+
+
+def _numeric_columns(df: pd.DataFrame, time_column: str) -> List[str]:
+    columns = []
+    for column in df.columns:
+        if column == time_column:
+            continue
+        series = df[column].dropna()
+        if series.empty:
+            continue
+        if pd.to_numeric(series, errors="coerce").notna().mean() >= 0.9:
+            columns.append(str(column))
+    return columns
+
+
+def _period_starts(times: pd.Series) -> Dict[str, pd.Series]:
+    day = times.dt.floor("D")
+    return {
+        "day": day,
+        "week": day - pd.to_timedelta(day.dt.weekday, unit="D"),
+        "month": times.dt.to_period("M").dt.start_time,
+    }
+
+
+def compute_rollups(df: pd.DataFrame, time_column: str) -> List[Dict[str, Any]]:
+    """Day/week/month count, sum, min, max and open/close for every numeric column"""
+    times = parse_times(df[time_column])
+    valid = times.notna()
+    if not valid.any():
+        return []
+
+    values = {ROWS_COLUMN: pd.Series(1.0, index=df.index)}
+    for column in _numeric_columns(df, time_column):
+        values[column] = pd.to_numeric(df[column], errors="coerce")
+
+    rollups = []
+    for column, series in values.items():
+        mask = valid & series.notna()
+        if not mask.any():
+            continue
+        frame = pd.DataFrame({"ts": times[mask], "v": series[mask].astype(float)}).sort_values("ts", kind="stable")
+        for granularity, period in _period_starts(frame["ts"]).items():
+            grouped = frame.groupby(period).agg(
+                count=("v", "size"),
+                sum=("v", "sum"),
+                min=("v", "min"),
+                max=("v", "max"),
+                open=("v", "first"),
+                close=("v", "last"),
+                first_at=("ts", "min"),
+                last_at=("ts", "max"),
+            )
+            for period_start, row in grouped.iterrows():
+                rollups.append({
+                    "value_column": column,
+                    "granularity": granularity,
+                    "period_start": period_start.to_pydatetime(),
+                    "count": int(row["count"]),
+                    "sum": float(row["sum"]),
+                    "min": float(row["min"]),
+                    "max": float(row["max"]),
+                    "open": float(row["open"]),
+                    "close": float(row["close"]),
+                    "first_at": row["first_at"].to_pydatetime(),
+                    "last_at": row["last_at"].to_pydatetime(),
+                })
+    return rollups
+
+
+def merge_rollup(target: FileRollup, new: Dict[str, Any]) -> None:
+    """Fold a freshly computed period summary into a stored one"""
+    target.count += new["count"]
+    target.sum += new["sum"]
+    target.min = min(target.min, new["min"])
+    target.max = max(target.max, new["max"])
+    if new["first_at"] < target.first_at:
+        target.open, target.first_at = new["open"], new["first_at"]
+    if new["last_at"] >= target.last_at:
+        target.close, target.last_at = new["close"], new["last_at"]
+
+
+def parse_frequency(freq: str) -> Tuple[str, str]:
+    """'3M' -> ('month', '3MS'); raises ValueError for unsupported values"""
+    match = re.fullmatch(r"(\d*)([DWMQY])", freq.strip().upper())
+    if not match or match.group(1) == "0":
+        raise ValueError(f"Unsupported frequency '{freq}'. Use e.g. D, 7D, W, 2W, M, Q, Y")
+    granularity, rule = FREQUENCIES[match.group(2)]
+    return granularity, rule.format(n=match.group(1) or "1")
+
+
+class TimeSeriesService:
+    """Materialized day/week/month rollups for date-indexed files.
+
+    Rollups are mergeable (count, sum, min, max, plus open/close with the
+    timestamps they came from), so appends only summarise the new rows.
+    Queries resample the rollups instead of the raw rows, so their cost
+    depends on the number of periods, not on the number of rows.
+
+    Rollups don't depend on row order. Stored rows are sorted by time
+    within each batch (an upload, an append or a chunked-upload segment)
+    and row_index is never renumbered, so a file built from several batches
+    is a sequence of sorted runs. file_metadata["time_order"] records
+    whether those runs still line up; when they don't, reads page through
+    a time-ordered permutation instead (see FileService.default_order).
+    """
+
+    async def merge_rollups(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        df: pd.DataFrame,
+        time_column: str
+    ) -> None:
+        """Summarise `df` and merge it into the stored rollups (no commit)"""
+        rollups = await asyncio.to_thread(compute_rollups, df, time_column)
+        if not rollups:
+            return
+
+        earliest = min(rollup["period_start"] for rollup in rollups)
+        latest = max(rollup["period_start"] for rollup in rollups)
+        result = await db.execute(
+            select(FileRollup).where(
+                FileRollup.file_id == file_id,
+                FileRollup.period_start >= earliest,
+                FileRollup.period_start <= latest
+            )
+        )
+        existing = {
+            (row.value_column, row.granularity, row.period_start): row
+            for row in result.scalars().all()
+        }
+
+        for rollup in rollups:
+            key = (rollup["value_column"], rollup["granularity"], rollup["period_start"])
+            if key in existing:
+                merge_rollup(existing[key], rollup)
+            else:
+                row = FileRollup(file_id=file_id, **rollup)
+                db.add(row)
+                existing[key] = row
+        await db.flush()
+
+    async def delete_rollups(self, db: AsyncSession, file_id: UUID) -> None:
+        await db.execute(delete(FileRollup).where(FileRollup.file_id == file_id))
+
+    async def query(
+        self,
+        db: AsyncSession,
+        file_id: UUID,
+        column: str,
+        freq: str = "M",
+        agg: str = "sum",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        window: Optional[int] = None,
+        window_agg: str = "mean"
+    ) -> Dict[str, Any]:
+        """Resample stored rollups to `freq`, optionally with a rolling window"""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation '{agg}'. Use one of: {', '.join(AGGREGATIONS)}")
+        if window_agg not in ("mean", "sum", "min", "max"):
+            raise ValueError("window_agg must be one of: mean, sum, min, max")
+        granularity, rule = parse_frequency(freq)
+
+        query = select(FileRollup).where(
+            FileRollup.file_id == file_id,
+            FileRollup.value_column == column,
+            FileRollup.granularity == granularity
+        ).order_by(FileRollup.period_start)
+        if start:
+            # Include the period that contains `start`
+            start_period = _period_starts(pd.Series([naive_utc(start)]))[granularity][0]
+            query = query.where(FileRollup.period_start >= start_period.to_pydatetime())
+        if end:
+            query = query.where(FileRollup.period_start <= naive_utc(end).to_pydatetime())
+        rows = (await db.execute(query)).scalars().all()
+
+        points = await asyncio.to_thread(self._resample, rows, rule, agg, window, window_agg)
+        return {
+            "column": column,
+            "freq": freq.upper(),
+            "agg": agg,
+            "source_granularity": granularity,
+            "periods_read": len(rows),
+            "points": points
+        }
+
+    @staticmethod
+    def _resample(rows, rule: str, agg: str, window: Optional[int], window_agg: str) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        frame = pd.DataFrame(
+            [
+                {
+                    "period_start": row.period_start, "count": row.count, "sum": row.sum,
+                    "min": row.min, "max": row.max, "open": row.open, "close": row.close
+                }
+                for row in rows
+            ]
+        ).set_index("period_start").sort_index()
+
+        resampled = frame.resample(rule, label="left", closed="left").agg({
+            "count": "sum", "sum": "sum", "min": "min", "max": "max", "open": "first", "close": "last"
+        })
+        resampled["mean"] = resampled["sum"] / resampled["count"].replace(0, np.nan)
+        resampled["value"] = resampled[agg]
+        if window:
+            resampled["rolling"] = getattr(resampled["value"].rolling(window, min_periods=1), window_agg)()
+
+        resampled = resampled.astype(object).where(resampled.notna(), None)
+        return [
+            {"period": period.isoformat(), **{key: value for key, value in values.items()}}
+            for period, values in resampled.to_dict(orient="index").items()
+        ]
@@ -0,0 +1,186 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+
+class ConcurrencyGovernor:
+    """Caps how many requests of one class run at once, with a bounded queue.
+
+    Requests beyond `max_concurrency` wait in line; if the line already holds
+    `max_queue` requests they are turned away with 429, and if they wait
+    longer than `queue_timeout` they get 503. Both carry a Retry-After based
+    on recent service times so clients back off instead of piling on.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+        self._queue_times = deque(maxlen=500)
+        self._service_times = deque(maxlen=500)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up, never below 1"""
+        if not self._service_times:
+            return 1
+        avg_service = sum(self._service_times) / len(self._service_times)
+        return max(1, math.ceil(avg_service * (self.waiting + 1) / self.max_concurrency))
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of this class's slots for the duration of the block"""
+        queued_at = time.perf_counter()
+
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise self._reject(429, f"Too many concurrent {self.name} requests, retry later")
+
+            self.waiting += 1
+            try:
+                # Awaiting acquire() directly (not through wait_for) lets the
+                # semaphore hand back a permit granted just as we time out or
+                # get cancelled, instead of leaking it
+                async with asyncio.timeout(self.queue_timeout):
+                    await self._semaphore.acquire()
+            except TimeoutError:
+                self.rejected_timeout += 1
+                raise self._reject(503, f"Server busy with {self.name} requests, retry later")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        started = time.perf_counter()
+        queue_time = started - queued_at
+        self.admitted += 1
+        self.total_queue_time += queue_time
+        self.max_queue_time = max(self.max_queue_time, queue_time)
+        self._queue_times.append(queue_time)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._service_times.append(time.perf_counter() - started)
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def spare_slots(self, wanted: int):
+        """Take up to `wanted` extra slots without queueing and yield how many
+        were granted. Lets a request that already holds a slot fan out only
+        as far as the class has room, instead of running wider than admitted."""
+        granted = 0
+        started = time.perf_counter()
+        try:
+            while granted < wanted and not self._semaphore.locked():
+                await self._semaphore.acquire()
+                granted += 1
+            self.admitted += granted
+            self.active += granted
+            yield granted
+        finally:
+            self.active -= granted
+            for _ in range(granted):
+                self._service_times.append(time.perf_counter() - started)
+                self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self._queue_times)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "queue_time_avg_ms": round(self.total_queue_time / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "queue_time_p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 2) if recent else 0.0,
+            "queue_time_max_ms": round(self.max_queue_time * 1000, 2)
+        }
+
+
+governors: Dict[str, ConcurrencyGovernor] = {
+    "ingest": ConcurrencyGovernor(
+        "ingest",
+        settings.ADMISSION_INGEST_CONCURRENCY,
+        settings.ADMISSION_INGEST_QUEUE,
+        settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+    ),
+    "reads": ConcurrencyGovernor(
+        "reads",
+        settings.ADMISSION_READS_CONCURRENCY,
+        settings.ADMISSION_READS_QUEUE,
+        settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+    ),
+    "ai": ConcurrencyGovernor(
+        "ai",
+        settings.ADMISSION_AI_CONCURRENCY,
+        settings.ADMISSION_AI_QUEUE,
+        settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+    ),
+}
+
+
+@asynccontextmanager
+async def admitted(kind: str):
+    """Hold a slot of `kind` for work running outside a request, such as a
+    background task. Raises the same HTTPException as `admit` when turned away."""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        yield
+        return
+    async with governors[kind].slot():
+        yield
+
+
+@asynccontextmanager
+async def spare_slots(kind: str, wanted: int):
+    """Yield how many extra slots of `kind` the caller may use right now, on
+    top of the one it already holds. Everything is granted when admission
+    control is off."""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        yield wanted
+        return
+    async with governors[kind].spare_slots(wanted) as granted:
+        yield granted
+
+
+def admit(kind: str):
+    """Dependency factory: `Depends(admit("ingest"))` holds a slot for the request"""
+    if kind not in governors:
+        raise ValueError(f"Unknown admission class '{kind}'")
+
+    async def dependency():
+        async with admitted(kind):
+            yield
+
+    return dependency
+
+
+def admission_metrics() -> Dict[str, Any]:
+    return {name: governor.snapshot() for name, governor in governors.items()}
@@ -0,0 +1,45 @@
+import gzip
+import shutil
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def codec_for_path(path: str) -> Optional[str]:
+    """Codec implied by a file's extension, None for uncompressed files"""
+    for codec, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return codec
+    return None
+
+
+def compress_bytes(data: bytes, codec: str, level: int = 3) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=min(level * 2, 9))
+
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def compress_file(source: str, target: str, codec: str, level: int = 3) -> None:
+    """Stream-compress `source` into `target`"""
+    with open(source, "rb") as reader, open(target, "wb") as writer:
+        if codec == "zstd":
+            zstandard.ZstdCompressor(level=level).copy_stream(reader, writer)
+        else:
+            with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=min(level * 2, 9)) as gzip_writer:
+                shutil.copyfileobj(reader, gzip_writer, 1024 * 1024)
+
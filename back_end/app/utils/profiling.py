@@ -0,0 +1,207 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from sqlalchemy import event
+
+from app.config import settings
+from app.utils.security import is_admin_token
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:  # fall back to cProfile
+    PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "_profile"
+
+# SQL statements of the request being profiled, None for every other request
+_sql_log: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar("profile_sql_log", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sql_log.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _sql_log.get()
+    if log is not None and hasattr(context, "_profile_started"):
+        log.append({
+            "statement": statement[:settings.PROFILING_SQL_MAX_LENGTH],
+            "executemany": executemany,
+            "duration_ms": round((time.perf_counter() - context._profile_started) * 1000, 3)
+        })
+
+
+def install_sql_timing(*engines) -> None:
+    """Time SQL statements of profiled requests. Only installed when profiling
+    is enabled, so unprofiled deployments don't pay for the listeners."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class ProfileStore:
+    """Profile reports as JSON files, readable from any worker"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.json")
+
+    def save(self, report: Dict[str, Any]) -> None:
+        with open(self._path(report["id"]), "w") as report_file:
+            json.dump(report, report_file)
+        reports = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in reports[:-settings.PROFILING_MAX_REPORTS]:
+            os.remove(entry.path)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        # Ids are uuid hex, anything else can't be a stored report
+        if not profile_id.isalnum() or not os.path.exists(self._path(profile_id)):
+            return None
+        with open(self._path(profile_id)) as report_file:
+            return json.load(report_file)
+
+    def list(self) -> List[Dict[str, Any]]:
+        summaries = []
+        for entry in sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime, reverse=True):
+            if entry.name.endswith(".json"):
+                with open(entry.path) as report_file:
+                    report = json.load(report_file)
+                summaries.append({key: report[key] for key in ("id", "method", "path", "status", "duration_ms", "started_at", "trigger")})
+        return summaries
+
+
+profile_store = ProfileStore(os.path.join(settings.UPLOAD_DIR, "profiles"))
+
+
+class ProfilingMiddleware:
+    """Opt-in per-request profiler (pure ASGI).
+
+    A request is profiled when it carries the admin token in an `X-Profile`
+    header or `_profile` query parameter, or is picked by
+    PROFILING_SAMPLE_RATE. The report holds a wall-clock profile
+    (pyinstrument when installed, cProfile otherwise) and the timing of
+    every SQL statement the request ran, and its id is returned in the
+    `X-Profile-Id` response header.
+
+    Only one request per worker is profiled at a time, since the
+    interpreter's profiling hook is global. cProfile can't tell coroutines
+    apart, so its report also includes other requests that ran on the event
+    loop meanwhile; pyinstrument attributes await time to this request only.
+
+    Unprofiled requests pay for one settings check when profiling is
+    disabled and a header scan otherwise.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    def _trigger(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return "header" if is_admin_token(value.decode("latin-1")) else None
+        if PROFILE_QUERY_PARAM.encode() in scope.get("query_string", b""):
+            params = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+            return "query" if is_admin_token(params.get(PROFILE_QUERY_PARAM)) else None
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not settings.PROFILING_ENABLED or scope["type"] != "http" or self._busy:
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        self._busy = True
+        profile_id = uuid.uuid4().hex
+        status = {"code": None}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sql_log: List[Dict[str, Any]] = []
+        token = _sql_log.set(sql_log)
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        if PyinstrumentProfiler is not None:
+            profiler = PyinstrumentProfiler(async_mode="enabled")
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if PyinstrumentProfiler is not None:
+                profiler.stop()
+            else:
+                profiler.disable()
+            duration_ms = (time.perf_counter() - started) * 1000
+            _sql_log.reset(token)
+            self._busy = False
+            try:
+                self._store(profile_id, scope, trigger, status["code"], started_at, duration_ms, profiler, sql_log)
+            except Exception:
+                logger.exception("Could not store profile %s", profile_id)
+
+    @staticmethod
+    def _store(profile_id, scope, trigger, status, started_at, duration_ms, profiler, sql_log) -> None:
+        if isinstance(profiler, cProfile.Profile):
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(settings.PROFILING_TOP_FUNCTIONS)
+            profile_text, profiler_name = output.getvalue(), "cProfile"
+        else:
+            profile_text, profiler_name = profiler.output_text(unicode=False, color=False), "pyinstrument"
+
+        query = [
+            (name, value) for name, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"))
+            if name != PROFILE_QUERY_PARAM
+        ]
+        sql_total = sum(entry["duration_ms"] for entry in sql_log)
+        profile_store.save({
+            "id": profile_id,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": dict(query),
+            "status": status,
+            "trigger": trigger,
+            "started_at": started_at.isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            "profiler": profiler_name,
+            "sql": {
+                "count": len(sql_log),
+                "total_ms": round(sql_total, 3),
+                "share_of_request": round(sql_total / duration_ms, 4) if duration_ms else None,
+                "slowest": sorted(sql_log, key=lambda entry: entry["duration_ms"], reverse=True)[:settings.PROFILING_TOP_QUERIES],
+                "statements": sql_log[:settings.PROFILING_MAX_QUERIES]
+            },
+            "profile": profile_text
+        })
@@ -1 +1,18 @@
- 
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app.config import settings
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Constant-time check against ADMIN_TOKEN; always False when it is unset.
+    Compared as bytes, since compare_digest rejects non-ASCII str"""
+    return bool(settings.ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode())
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for operator-only endpoints"""
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
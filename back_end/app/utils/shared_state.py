@@ -0,0 +1,220 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+from app.config import settings
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # file backend only
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_POLL_SECONDS = 0.05
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+
+
+class FileBackend:
+    """Locks and cache entries shared by the workers of one host.
+
+    Locks are flock()s on files under `directory`; the kernel releases them
+    when a worker dies. Cache entries are JSON files written atomically.
+    """
+
+    name = "file"
+
+    def __init__(self, directory: str):
+        self.lock_dir = os.path.join(directory, "locks")
+        self.cache_dir = os.path.join(directory, "cache")
+        os.makedirs(self.lock_dir, exist_ok=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @asynccontextmanager
+    async def lock(self, name: str, blocking: bool = True, timeout: Optional[float] = None) -> AsyncIterator[bool]:
+        fd = os.open(os.path.join(self.lock_dir, f"{_safe_name(name)}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        acquired = False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    acquired = True
+                    break
+                except BlockingIOError:
+                    if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                        break
+                    # Poll rather than block, the event loop keeps serving
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{_safe_name(key)}.json")
+
+    async def get(self, key: str) -> Any:
+        try:
+            with open(self._cache_path(key)) as cache_file:
+                entry = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry["expires_at"] is not None and entry["expires_at"] < time.time():
+            return None
+        return entry["value"]
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        path = self._cache_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as cache_file:
+            json.dump({"expires_at": time.time() + ttl if ttl else None, "value": value}, cache_file, default=str)
+        os.replace(tmp_path, path)
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Locks and cache entries shared by workers on any host.
+
+    A lock is a key set with NX and a lease of SHARED_LOCK_LEASE_SECONDS,
+    renewed while held, so a crashed worker's lock expires on its own.
+    Release only deletes the key when it still holds our token.
+    """
+
+    name = "redis"
+
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+
+    def __init__(self, client):
+        self.client = client
+        self.prefix = settings.SHARED_KEY_PREFIX
+
+    @asynccontextmanager
+    async def lock(self, name: str, blocking: bool = True, timeout: Optional[float] = None) -> AsyncIterator[bool]:
+        key = f"{self.prefix}lock:{name}"
+        token = uuid.uuid4().hex
+        lease_ms = int(settings.SHARED_LOCK_LEASE_SECONDS * 1000)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        acquired = False
+        while True:
+            acquired = bool(await self.client.set(key, token, nx=True, px=lease_ms))
+            if acquired or not blocking or (deadline is not None and time.monotonic() >= deadline):
+                break
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+
+        async def renew():
+            while True:
+                await asyncio.sleep(settings.SHARED_LOCK_LEASE_SECONDS / 3)
+                await self.client.eval(self.RENEW, 1, key, token, lease_ms)
+
+        renewal = asyncio.create_task(renew()) if acquired else None
+        try:
+            yield acquired
+        finally:
+            if renewal:
+                renewal.cancel()
+                await self.client.eval(self.RELEASE, 1, key, token)
+
+    async def get(self, key: str) -> Any:
+        value = await self.client.get(f"{self.prefix}cache:{key}")
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.client.set(
+            f"{self.prefix}cache:{key}", json.dumps(value, default=str),
+            px=int(ttl * 1000) if ttl else None
+        )
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(f"{self.prefix}cache:{key}")
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class SharedState:
+    """The worker's cross-worker lock/cache backend.
+
+    `start()` runs in each worker's lifespan and picks Redis when
+    SHARED_BACKEND is "redis", or "auto" and REDIS_URL answers; otherwise
+    the file backend under UPLOAD_DIR/shared, which only coordinates
+    workers on the same host. Used before `start()` (scripts, one-off
+    tools) it falls back to the file backend.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = FileBackend(os.path.join(settings.UPLOAD_DIR, "shared"))
+        return self._backend
+
+    @property
+    def name(self) -> str:
+        return self.backend.name
+
+    async def start(self) -> None:
+        if settings.SHARED_BACKEND in ("redis", "auto") and redis_asyncio is not None:
+            client = redis_asyncio.from_url(settings.REDIS_URL, socket_connect_timeout=2)
+            try:
+                await client.ping()
+                self._backend = RedisBackend(client)
+                return
+            except Exception as e:
+                await client.aclose()
+                if settings.SHARED_BACKEND == "redis":
+                    raise
+                logger.warning(f"Redis unavailable ({e}), coordinating workers with file locks")
+        elif settings.SHARED_BACKEND == "redis":
+            raise RuntimeError("SHARED_BACKEND=redis but the redis package is not installed")
+        self._backend = FileBackend(os.path.join(settings.UPLOAD_DIR, "shared"))
+
+    async def close(self) -> None:
+        if self._backend is not None:
+            await self._backend.close()
+            self._backend = None
+
+    def reset_after_fork(self) -> None:
+        # A connection inherited from the parent must not be used by the child
+        self._backend = None
+
+    def lock(self, name: str, blocking: bool = True, timeout: Optional[float] = None):
+        """`async with shared_state.lock(name) as acquired:`; with
+        blocking=False or a timeout, `acquired` may be False"""
+        return self.backend.lock(name, blocking, timeout)
+
+    async def get(self, key: str) -> Any:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self.backend.set(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self.backend.delete(key)
+
+
+shared_state = SharedState()
+
+os.register_at_fork(after_in_child=shared_state.reset_after_fork)
@@ -0,0 +1,238 @@
+"""Throughput of the multi-worker serving mode as the worker count grows.
+
+For every worker count it starts `python -m app.serve` with
+WEB_CONCURRENCY set, waits for /health, drives a read-heavy mix of
+endpoints from several client processes for a fixed time, and prints
+requests/s, latency percentiles and the speedup over one worker.
+
+    python scripts/load_test.py                       # 1, 2, 4 ... CPUs workers
+    python scripts/load_test.py --workers 1,2,4 --duration 20
+    python scripts/load_test.py --url http://host:8000 --file-id <uuid>
+
+The database and upload dir come from the usual settings (.env /
+environment), so point them at a scratch database. A sample file is
+uploaded once and reused by every run. With --url, the server under test
+is used as is and only one round is run.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import multiprocessing
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+BACK_END = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACK_END)
+
+from app.serve import available_cpus  # noqa: E402
+
+MEMOS = ["UBER trip", "Tesco store 12", "Salary ACME", "Rent March", "Coffee shop", "AWS invoice", "Refund Amazon"]
+
+
+def sample_csv(rows: int) -> bytes:
+    rng = random.Random(0)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["date", "description", "category", "credit", "debit"])
+    for row in range(rows):
+        writer.writerow([
+            f"2024-{row % 12 + 1:02d}-{row % 28 + 1:02d}",
+            f"{rng.choice(MEMOS)} #{rng.randint(1, 500)}",
+            rng.choice(["travel", "food", "income", "housing", "tech"]),
+            round(rng.uniform(0, 500), 2) if rng.random() < 0.3 else 0,
+            round(rng.uniform(0, 200), 2)
+        ])
+    return output.getvalue().encode()
+
+
+def request_mix(file_id: str) -> List[Tuple[str, str, str, Optional[Dict[str, Any]]]]:
+    """(name, method, path, json body) drawn round-robin by every client"""
+    return [
+        ("page", "GET", f"/api/files/{file_id}/data?page=3&limit=100", None),
+        ("sorted_page", "GET", f"/api/files/{file_id}/data?sort_by=net&order=desc&limit=100", None),
+        ("search", "GET", f"/api/files/{file_id}/search?q=tesco+store&limit=20", None),
+        ("stats", "GET", f"/api/files/{file_id}/stats", None),
+        ("aggregate", "POST", "/api/analytics/aggregate", {"file_ids": [file_id], "columns": ["credit", "debit", "net"]}),
+    ]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_healthy(base_url: str, process: Optional[subprocess.Popen], timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not become healthy")
+
+
+def seed(base_url: str, rows: int) -> str:
+    """Upload the sample file and define the computed column the mix uses"""
+    response = httpx.post(
+        f"{base_url}/api/files/upload",
+        files={"file": ("load_test.csv", sample_csv(rows), "text/csv")},
+        timeout=300
+    )
+    response.raise_for_status()
+    file_id = response.json()["file"]["id"]
+    httpx.post(
+        f"{base_url}/api/files/{file_id}/computed-columns",
+        json={"name": "net", "expression": "credit - debit"},
+        timeout=60
+    ).raise_for_status()
+    return file_id
+
+
+async def _drive(base_url: str, mix, connections: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def connection(client: httpx.AsyncClient, offset: int):
+        nonlocal errors
+        position = offset
+        while time.monotonic() < deadline:
+            _, method, path, body = mix[position % len(mix)]
+            position += 1
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await asyncio.gather(*(connection(client, offset) for offset in range(connections)))
+    return {"latencies": latencies, "errors": errors}
+
+
+def _client_process(base_url: str, file_id: str, connections: int, duration: float, results) -> None:
+    results.put(asyncio.run(_drive(base_url, request_mix(file_id), connections, duration)))
+
+
+def run_load(base_url: str, file_id: str, clients: int, connections: int, duration: float) -> Dict[str, Any]:
+    """Drive load from `clients` processes so the client side isn't the
+    bottleneck, and merge their results"""
+    # Warm caches (computed vectors, search index) outside the measurement
+    asyncio.run(_drive(base_url, request_mix(file_id), 2, 2))
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_client_process, args=(base_url, file_id, connections, duration, results))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    merged = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = sorted(latency for result in merged for latency in result["latencies"])
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "requests": len(latencies),
+        "errors": sum(result["errors"] for result in merged),
+        "rps": len(latencies) / duration,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000
+    }
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    environment = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "APP_PORT": str(port),
+        "APP_HOST": "127.0.0.1",
+        # Production mode (no reload); measure the app, not the gates
+        "APP_ENV": os.environ.get("LOAD_TEST_APP_ENV", "production"),
+        "ADMISSION_READS_QUEUE": os.environ.get("ADMISSION_READS_QUEUE", "10000"),
+        "TIERING_ENABLED": "false",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.serve"],
+        cwd=BACK_END,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def main() -> None:
+    cpus = available_cpus()
+    default_workers = sorted({1, *(2 ** power for power in range(1, 8) if 2 ** power <= cpus), cpus})
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)), help="Worker counts to compare")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=max(1, min(4, cpus)), help="Client processes")
+    parser.add_argument("--connections", type=int, default=16, help="Concurrent connections per client process")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows in the sample file")
+    parser.add_argument("--url", help="Test a running server instead of starting one")
+    parser.add_argument("--file-id", help="Existing file to query instead of uploading a sample")
+    args = parser.parse_args()
+
+    rounds = [None] if args.url else [int(count) for count in args.workers.split(",")]
+    file_id = args.file_id
+    print(f"{cpus} CPU(s) available, {args.clients} client process(es) x {args.connections} connections, {args.duration:.0f}s per round")
+    print(f"{'workers':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+
+    baseline = None
+    for workers in rounds:
+        process = None
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_server(workers, port)
+        try:
+            wait_healthy(base_url, process)
+            if file_id is None:
+                file_id = seed(base_url, args.rows)
+            result = run_load(base_url, file_id, args.clients, args.connections, args.duration)
+        finally:
+            if process is not None:
+                stop_server(process)
+        baseline = baseline or result["rps"]
+        speedup = result["rps"] / baseline if baseline else 0.0
+        print(
+            f"{workers or '-':>8} {result['requests']:>9} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} "
+            f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7} {speedup:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
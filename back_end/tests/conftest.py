@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Settings are read at import time, so point them at a scratch database and
+# upload dir before anything from app is imported
+_scratch = tempfile.mkdtemp(prefix="finance-tests-")
+os.environ.update({
+    "APP_ENV": "test",
+    "DATABASE_URL": f"sqlite:///{_scratch}/test.db",
+    "DATABASE_URL_ASYNC": f"sqlite+aiosqlite:///{_scratch}/test.db",
+    "DATABASE_REPLICA_URLS": "",
+    "UPLOAD_DIR": os.path.join(_scratch, "uploads"),
+    "ALLOWED_FILE_TYPES": '["csv"]',
+    "SHARED_BACKEND": "file",
+    "TIERING_ENABLED": "false",
+    "PROFILING_ENABLED": "false",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def upload_csv(client):
+    """Upload CSV text as a new file and return its JSON"""
+    def upload(text: str, name: str = "test.csv"):
+        response = client.post("/api/files/upload", files={"file": (name, text.encode(), "text/csv")})
+        assert response.status_code == 200, response.text
+        return response.json()["file"]
+    return upload
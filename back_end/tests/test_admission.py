@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.admission import ConcurrencyGovernor, governors
+
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        governor = ConcurrencyGovernor("test", max_concurrency=1, max_queue=0, queue_timeout=1)
+        async with governor.slot():
+            with pytest.raises(HTTPException) as rejected:
+                async with governor.slot():
+                    pass
+        return governor, rejected.value
+
+    governor, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == "1"
+    assert governor.rejected_queue_full == 1
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        governor = ConcurrencyGovernor("test", max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        async with governor.slot():
+            with pytest.raises(HTTPException) as rejected:
+                async with governor.slot():
+                    pass
+        return governor, rejected.value
+
+    governor, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert governor.rejected_timeout == 1
+    assert governor.waiting == 0
+    assert governor._semaphore._value == 1
+
+
+def test_cancelled_waiter_does_not_leak_a_permit():
+    async def scenario():
+        governor = ConcurrencyGovernor("test", max_concurrency=1, max_queue=4, queue_timeout=5)
+
+        async def wait_for_slot():
+            async with governor.slot():
+                pass
+
+        async with governor.slot():
+            waiter = asyncio.create_task(wait_for_slot())
+            await asyncio.sleep(0)
+        # The slot was handed to the waiter on release; cancel it before it runs
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        async with governor.slot():
+            pass
+        return governor
+
+    governor = asyncio.run(scenario())
+    assert governor._semaphore._value == 1
+    assert governor.active == 0
+    assert governor.waiting == 0
+
+
+def test_prefix_ingest_task_takes_an_ingest_slot(client):
+    content = b"a,b\n1,2\n3,4\n"
+    upload = client.post("/api/files/uploads", json={"filename": "slot.csv", "length": len(content)}).json()
+    before = governors["ingest"].admitted
+
+    response = client.patch(
+        f"/api/files/uploads/{upload['upload_id']}",
+        content=content,
+        headers={"Upload-Offset": "0", "Content-Type": "application/offset+octet-stream"}
+    )
+
+    assert response.status_code == 200
+    # One slot for the PATCH itself, one for the background ingest
+    assert governors["ingest"].admitted - before == 2
+    assert client.get(f"/api/files/uploads/{upload['upload_id']}").json()["rows_ingested"] == 2
+    client.delete(f"/api/files/uploads/{upload['upload_id']}")
+
+
+def test_spare_slots_never_queue():
+    async def scenario():
+        governor = ConcurrencyGovernor("test", max_concurrency=3, max_queue=0, queue_timeout=1)
+        async with governor.slot():
+            async with governor.spare_slots(5) as granted:
+                assert governor.active == 3
+                async with governor.spare_slots(1) as none_left:
+                    assert none_left == 0
+        return governor, granted
+
+    governor, granted = asyncio.run(scenario())
+    assert granted == 2
+    assert governor.active == 0
+    assert governor._semaphore._value == 3
@@ -0,0 +1,146 @@
+import asyncio
+from uuid import UUID
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.config import settings
+from app.services.anomaly_service import AnomalyScan, _time_runs, detect_anomalies, severity
+from app.services.column_stats import build_column_stats
+
+
+def _series_frame(rows: int = 2000) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    amount = rng.normal(100, 5, rows)
+    amount[rows // 2:] += 60
+    amount[[10, 300]] = [1000, -400]
+    df = pd.DataFrame({
+        "date": pd.date_range("2024-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M"),
+        "amount": amount.round(2),
+        "memo": rng.choice(["rent", "food", "fuel"], rows)
+    })
+    df.loc[41] = df.loc[40]
+    df.index.name = "row_index"
+    return df
+
+
+def _key(anomaly):
+    return anomaly["kind"], anomaly["row_index"], anomaly["column_name"]
+
+
+def test_detects_every_kind():
+    anomalies = detect_anomalies(_series_frame(), "date")
+    kinds = {(kind, row) for kind, row, _ in map(_key, anomalies)}
+
+    assert {("robust_zscore", 10), ("iqr", 10), ("robust_zscore", 300)} <= kinds
+    assert {("duplicate", 40), ("duplicate", 41)} <= kinds
+    assert any(kind == "level_shift" and 950 <= row <= 1050 for kind, row in kinds)
+    assert all(0 < anomaly["score"] < 1 for anomaly in anomalies)
+
+
+@pytest.mark.parametrize("frame_rows", [7, 128, 2000])
+def test_streaming_matches_single_frame(frame_rows):
+    df = _series_frame()
+    expected = sorted(map(_key, detect_anomalies(df, "date")))
+
+    scan = AnomalyScan(build_column_stats(df), list(df.columns), "date")
+    frames = [df.iloc[start:start + frame_rows] for start in range(0, len(df), frame_rows)]
+    for frame in frames:
+        scan.observe(frame)
+    scan.prepare()
+    for frame in frames:
+        scan.detect(frame)
+    found, anomalies = scan.finish()
+
+    assert sorted(map(_key, anomalies)) == expected
+    assert sum(found.values()) == len(expected)
+
+
+def test_scores_are_comparable_across_kinds():
+    # A pair of identical rows must not outrank an extreme outlier
+    assert severity(2, 1) < severity(50, 3.5)
+    assert severity(3.5, 3.5) == 0.0
+    assert severity(-7, 3.5) == 0.5
+
+
+def test_limit_keeps_top_scores():
+    anomalies = detect_anomalies(_series_frame(), "date", limit=2)
+    assert [(kind, row) for kind, row, _ in map(_key, anomalies)] == [("robust_zscore", 10), ("iqr", 10)]
+
+
+def test_time_runs_split_where_time_goes_back():
+    times = np.array([1, 2, 3, 1, 2, 0])
+    assert _time_runs(times, None) == [(0, 3, True), (3, 5, True), (5, 6, True)]
+    assert _time_runs(np.array([5, 6]), 4) == [(0, 2, False)]
+    assert _time_runs(np.array([5, 6]), 9) == [(0, 2, True)]
+
+
+def test_read_scans_when_no_current_scan(client, upload_csv, monkeypatch):
+    monkeypatch.setattr(settings, "ANOMALY_SCAN_ON_INGEST", False)
+    rows = "\n".join(f"2024-01-{day:02d},{100 + day % 3}" for day in range(1, 29))
+    file = upload_csv(f"date,amount\n{rows}\n2024-01-29,5000\n", name="anomalies.csv")
+    assert "anomaly_scan" not in client.get(f"/api/files/{file['id']}").json()["metadata"]
+
+    response = client.get(f"/api/files/{file['id']}/anomalies")
+    assert response.status_code == 200
+    assert response.json()["summary"]["row_count"] == 29
+    top = response.json()["anomalies"][0]
+    assert (top["kind"], top["value"]) == ("robust_zscore", 5000)
+    scanned_at = response.json()["summary"]["scanned_at"]
+
+    # The scan is stored, so the next read reuses it
+    assert client.get(f"/api/files/{file['id']}/anomalies").json()["summary"]["scanned_at"] == scanned_at
+
+
+def test_on_demand_scan_is_retryable_when_ingest_is_busy(client, upload_csv, monkeypatch):
+    from app.utils.admission import ConcurrencyGovernor, governors
+
+    monkeypatch.setattr(settings, "ANOMALY_SCAN_ON_INGEST", False)
+    file = upload_csv("date,amount\n2024-04-01,1\n2024-04-02,2\n", name="busy-scan.csv")
+    governor = ConcurrencyGovernor("ingest", max_concurrency=1, max_queue=0, queue_timeout=1)
+    # Every slot taken and no room to queue
+    governor._semaphore = asyncio.Semaphore(0)
+    monkeypatch.setitem(governors, "ingest", governor)
+
+    for response in (
+        client.get(f"/api/files/{file['id']}/anomalies"),
+        client.post(f"/api/files/{file['id']}/analyze"),
+    ):
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+
+def test_ingest_schedules_scan(client, upload_csv):
+    rows = "\n".join(f"2024-02-{day:02d},{10 + day % 2}" for day in range(1, 20))
+    file = upload_csv(f"date,amount\n{rows}\n", name="scanned.csv")
+
+    response = client.get(f"/api/files/{file['id']}/anomalies")
+    assert response.status_code == 200
+    assert response.json()["summary"]["row_count"] == 19
+
+
+def test_busy_ingest_marks_scan_pending_and_retries(client, upload_csv, monkeypatch):
+    from app.api.endpoints import files
+    from app.utils.admission import ConcurrencyGovernor, governors
+
+    monkeypatch.setattr(settings, "ANOMALY_SCAN_ON_INGEST", False)
+    file = upload_csv("date,amount\n2024-03-01,1\n2024-03-02,2\n", name="pending.csv")
+    monkeypatch.setattr(settings, "ANOMALY_SCAN_ON_INGEST", True)
+    governor = ConcurrencyGovernor("ingest", max_concurrency=1, max_queue=0, queue_timeout=1)
+    monkeypatch.setattr(governor, "retry_after", lambda: 0.01)
+    monkeypatch.setitem(governors, "ingest", governor)
+
+    async def scenario():
+        async with governor.slot():
+            await files._scan_anomalies([UUID(file["id"])])
+        metadata = client.get(f"/api/files/{file['id']}").json()["metadata"]
+        await asyncio.gather(*files._scan_retries)
+        return metadata
+
+    pending = asyncio.run(scenario())
+    assert "anomaly_scan_pending" in pending and "anomaly_scan" not in pending
+
+    metadata = client.get(f"/api/files/{file['id']}").json()["metadata"]
+    assert "anomaly_scan_pending" not in metadata
+    assert metadata["anomaly_scan"]["row_count"] == 2
@@ -0,0 +1,95 @@
+import asyncio
+import random
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models.file_model import FileData
+from app.services.column_stats import ColumnStats, QuantileSketch
+
+
+def _append(client, file_id, text, name="more.csv"):
+    return client.post(f"/api/files/{file_id}/append", files={"file": (name, text.encode(), "text/csv")})
+
+
+def _row_indexes(file_id):
+    async def load():
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(FileData.row_index, FileData.data)
+                .where(FileData.file_id == uuid.UUID(file_id))
+                .order_by(FileData.row_index)
+            )
+            return [(row_index, data["memo"]) for row_index, data in result.all()]
+    return asyncio.run(load())
+
+
+def test_append_with_matching_columns_continues_row_index(client, upload_csv):
+    file = upload_csv("amount,memo\n1,a\n2,b\n", name="append-base.csv")
+
+    # Same columns in a different order are accepted
+    response = _append(client, file["id"], "memo,amount\nc,3\nd,4\n")
+
+    assert response.status_code == 200, response.text
+    assert response.json()["file"]["row_count"] == 4
+    assert _row_indexes(file["id"]) == [(0, "a"), (1, "b"), (2, "c"), (3, "d")]
+    rows = client.get(f"/api/files/{file['id']}/data").json()["data"]
+    assert [row["amount"] for row in rows] == [1, 2, 3, 4]
+
+
+def test_append_with_mismatched_columns_is_rejected(client, upload_csv):
+    file = upload_csv("amount,memo\n1,a\n", name="append-mismatch.csv")
+
+    for text in ("amount\n2\n", "amount,memo,extra\n2,b,x\n", "amount,note\n2,b\n"):
+        response = _append(client, file["id"], text)
+        assert response.status_code == 400, text
+
+    assert client.get(f"/api/files/{file['id']}").json()["row_count"] == 1
+    assert _row_indexes(file["id"]) == [(0, "a")]
+
+
+def test_append_to_missing_file_is_404(client):
+    assert _append(client, str(uuid.uuid4()), "amount,memo\n1,a\n").status_code == 404
+
+
+def test_merged_stats_equal_a_full_recompute(client, upload_csv):
+    rng = random.Random(7)
+    first = [round(rng.uniform(-500, 500), 2) for _ in range(300)]
+    second = [round(rng.uniform(-50, 2000), 2) for _ in range(200)]
+    file = upload_csv("amount,memo\n" + "".join(f"{value},m{n}\n" for n, value in enumerate(first)), name="append-stats.csv")
+
+    body = "amount,memo\n" + "".join(f"{value},n{n}\n" for n, value in enumerate(second))
+    assert _append(client, file["id"], body).status_code == 200
+
+    merged = client.get(f"/api/files/{file['id']}/stats").json()["columns"]["amount"]
+    full = ColumnStats.from_series(pd.Series(first + second)).summary()
+    assert merged["count"] == full["count"] == 500
+    assert merged["null_count"] == 0
+    assert merged["sum"] == pytest.approx(full["sum"])
+    assert (merged["min"], merged["max"]) == (full["min"], full["max"]) == (min(first + second), max(first + second))
+
+
+def test_merged_quantile_sketch_stays_within_rank_error():
+    rng = np.random.default_rng(11)
+    # Compaction picks odd or even items at random; pin it so the test is stable
+    random.seed(11)
+    parts = [rng.normal(0, 1, 40000), rng.exponential(3, 25000), rng.uniform(-10, 10, 35000)]
+    merged = QuantileSketch()
+    for values in parts:
+        sketch = QuantileSketch()
+        # Several updates per part, like a chunked ingest followed by appends
+        for chunk in np.array_split(values, 7):
+            sketch.update(chunk)
+        merged.merge(sketch)
+
+    everything = np.sort(np.concatenate(parts))
+    assert merged.n == len(everything)
+    qs = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+    for q, value in zip(qs, merged.quantiles(qs)):
+        rank = np.searchsorted(everything, value, side="right") / len(everything)
+        # Rank error is about 1.7/k for k=200; allow some slack for randomness
+        assert abs(rank - q) < 0.02, (q, rank)
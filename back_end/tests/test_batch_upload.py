@@ -0,0 +1,99 @@
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.endpoints.files import _expand_zip
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_expand_zip_returns_csv_members_only():
+    content = make_zip({"a.csv": "x\n1\n", "notes.txt": "hi", "__MACOSX/._a.csv": "junk", "dir/b.csv": "y\n2\n"})
+    members = _expand_zip("batch.zip", content, 1024, 10, 1024)
+    assert [(name, data) for name, data, _ in members] == [("a.csv", b"x\n1\n"), ("b.csv", b"y\n2\n")]
+
+
+def test_expand_zip_rejects_oversized_member_before_reading():
+    # 5 MB of zeros compresses to a few KB
+    content = make_zip({"bomb.csv": b"0" * (5 * 1024 * 1024)})
+    assert len(content) < 64 * 1024
+    with pytest.raises(HTTPException) as error:
+        _expand_zip("bomb.zip", content, 1024 * 1024, 10, 100 * 1024 * 1024)
+    assert error.value.status_code == 400
+    assert "too large" in error.value.detail
+
+
+def test_expand_zip_caps_member_count_and_total_size():
+    content = make_zip({f"{n}.csv": "x\n1\n" for n in range(5)})
+    with pytest.raises(HTTPException) as error:
+        _expand_zip("many.zip", content, 1024, 4, 1024)
+    assert "Too many files" in error.value.detail
+    with pytest.raises(HTTPException) as error:
+        _expand_zip("many.zip", content, 1024, 10, 10)
+    assert "uncompressed" in error.value.detail
+
+
+def test_expand_zip_rejects_invalid_archive():
+    with pytest.raises(HTTPException) as error:
+        _expand_zip("broken.zip", b"not a zip", 1024, 10, 1024)
+    assert error.value.status_code == 400
+
+
+def test_batch_upload_ingests_every_file(client):
+    archive = make_zip({"a.csv": "amount\n1\n2\n", "b.csv": "amount\n3\n"})
+    response = client.post(
+        "/api/files/upload/batch",
+        files=[
+            ("files", ("bundle.zip", archive, "application/zip")),
+            ("files", ("c.csv", b"amount\n4\n5\n6\n", "text/csv")),
+        ]
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["total"], body["succeeded"], body["failed"]) == (3, 3, 0)
+    assert sorted(result["file"]["row_count"] for result in body["results"]) == [1, 2, 3]
+
+
+def test_batch_upload_rejects_oversized_file(client, monkeypatch):
+    from app.config import settings
+    monkeypatch.setattr(settings, "MAX_FILE_SIZE_MB", 1)
+    response = client.post(
+        "/api/files/upload/batch",
+        files=[("files", ("big.csv", b"amount\n" + b"1\n" * (600 * 1024), "text/csv"))]
+    )
+    assert response.status_code == 400
+    assert "too large" in response.json()["detail"]
+
+
+def test_batch_concurrency_is_capped_by_ingest_slots(client, monkeypatch):
+    from app.api.endpoints import files
+    from app.utils.admission import ConcurrencyGovernor, governors
+
+    governor = ConcurrencyGovernor("ingest", max_concurrency=2, max_queue=4, queue_timeout=1)
+    monkeypatch.setitem(governors, "ingest", governor)
+    seen = {}
+    process_batch = files.file_service.process_batch
+
+    async def recording_batch(session_factory, items, concurrency):
+        seen.update(concurrency=concurrency, active=governor.active)
+        return await process_batch(session_factory, items, concurrency)
+
+    monkeypatch.setattr(files.file_service, "process_batch", recording_batch)
+    response = client.post(
+        "/api/files/upload/batch",
+        files=[("files", (f"slots-{n}.csv", b"amount\n1\n", "text/csv")) for n in range(3)]
+    )
+
+    assert response.status_code == 200, response.text
+    # The request's own slot plus the one spare slot, never the full pool
+    assert seen == {"concurrency": 2, "active": 2}
+    assert governor.active == 0
+    assert governor._semaphore._value == 2
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.config import settings
+from app.services.chunked_upload_service import ChunkedUploadService, find_record_boundary
+from app.services.file_service import file_service
+
+
+@pytest.mark.parametrize("segment, last, first", [
+    (b"a,b\n1,2\n3", 8, 4),
+    (b'a,"x\ny"\n1', 8, 8),
+    (b'a,"x""\n"\nz', 9, 9),
+    (b"no newline", 0, 0),
+    (b'"open\n', 0, 0),
+    (b'a\n"\n"\n', 6, 2),
+])
+def test_find_record_boundary(segment, last, first):
+    assert find_record_boundary(segment) == last
+    assert find_record_boundary(segment, first=True) == first
+
+
+def test_parse_records_pins_dtypes():
+    columns = ["amount", "flag", "code"]
+    dtypes = {"amount": "int", "flag": "bool", "code": "str"}
+    df = ChunkedUploadService._parse_records(b"5,True,7\n,false,x\nabc,TRUE,8\n", columns, dtypes)
+
+    assert df["amount"].tolist()[0] == 5
+    assert df["amount"].tolist()[2] == "abc"
+    assert df["flag"].tolist() == [True, False, True]
+    assert df["code"].tolist() == ["7", "x", "8"]
+
+
+def _create(client, content: bytes, name: str = "chunked.csv", checksum: str = None):
+    response = client.post("/api/files/uploads", json={
+        "filename": name,
+        "length": len(content),
+        "checksum": checksum
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _patch(client, upload_id: str, offset: int, chunk: bytes):
+    return client.patch(
+        f"/api/files/uploads/{upload_id}",
+        content=chunk,
+        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}
+    )
+
+
+def test_offset_conflict_reports_current_offset(client):
+    content = b"a,b\n1,2\n3,4\n"
+    upload = _create(client, content)
+
+    assert _patch(client, upload["upload_id"], 0, content[:6]).status_code == 200
+    response = _patch(client, upload["upload_id"], 3, content[3:])
+
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "6"
+    client.delete(f"/api/files/uploads/{upload['upload_id']}")
+
+
+def test_resume_from_head_offset(client):
+    content = b"a,b\n1,2\n3,4\n5,6\n"
+    upload = _create(client, content)
+    upload_id = upload["upload_id"]
+    _patch(client, upload_id, 0, content[:9])
+
+    # Client lost track of what was written: ask the server and continue
+    offset = int(client.head(f"/api/files/uploads/{upload_id}").headers["Upload-Offset"])
+    assert offset == 9
+    assert _patch(client, upload_id, offset, content[offset:]).status_code == 200
+
+    response = client.post(f"/api/files/uploads/{upload_id}/finalize")
+    assert response.status_code == 200, response.text
+    assert response.json()["file"]["row_count"] == 3
+
+
+def test_checksum_mismatch_discards_upload(client):
+    content = b"a,b\n1,2\n"
+    upload = _create(client, content, checksum="sha256:" + "0" * 64)
+    upload_id = upload["upload_id"]
+    _patch(client, upload_id, 0, content)
+
+    response = client.post(f"/api/files/uploads/{upload_id}/finalize")
+
+    assert response.status_code == 422
+    assert "Checksum mismatch" in response.json()["detail"]
+    assert client.head(f"/api/files/uploads/{upload_id}").status_code == 404
+    assert client.get(f"/api/files/{upload['file_id']}").status_code == 404
+
+
+def test_quoted_newlines_across_chunks(client):
+    content = b'id,memo,amount\n1,"rent\nmarch",10\n2,"multi\n""quoted""\nnote",20\n3,plain,30\n'
+    digest = hashlib.sha256(content).hexdigest()
+    upload = _create(client, content, name="quoted.csv", checksum=digest)
+    upload_id = upload["upload_id"]
+
+    # Cut inside each quoted field so every chunk ends mid-record
+    cuts = [0, content.index(b"march") - 2, content.index(b'""quoted') + 3, len(content)]
+    for start, end in zip(cuts, cuts[1:]):
+        assert _patch(client, upload_id, start, content[start:end]).status_code == 200
+
+    response = client.post(f"/api/files/uploads/{upload_id}/finalize", json={"checksum": digest})
+    assert response.status_code == 200, response.text
+    file_id = response.json()["file"]["id"]
+
+    rows = client.get(f"/api/files/{file_id}/data", params={"limit": 10}).json()["data"]
+    assert [row["memo"] for row in rows] == ["rent\nmarch", 'multi\n"quoted"\nnote', "plain"]
+    assert [row["amount"] for row in rows] == [10, 20, 30]
+
+
+def test_uploading_file_is_hidden_until_finalized(client):
+    content = b"a,b\n1,2\n3,4\n"
+    upload = _create(client, content)
+    upload_id, file_id = upload["upload_id"], upload["file_id"]
+    _patch(client, upload_id, 0, content[:8])
+
+    listed = [file["id"] for file in client.get("/api/files/").json()["files"]]
+    assert file_id not in listed
+    assert client.get(f"/api/files/{file_id}/stats").status_code == 404
+    assert client.get(f"/api/files/uploads/{upload_id}").json()["rows_ingested"] == 1
+
+    _patch(client, upload_id, 8, content[8:])
+    assert client.post(f"/api/files/uploads/{upload_id}/finalize").status_code == 200
+    listed = [file["id"] for file in client.get("/api/files/").json()["files"]]
+    assert file_id in listed
+
+
+def test_writes_from_two_workers_are_serialized(client):
+    from app.api.endpoints.files import chunked_upload_service
+
+    content = b"a,b\n1,2\n3,4\n"
+    upload = _create(client, content)
+    # A second service instance stands in for another worker process: it
+    # shares the upload dir but not the in-process locks
+    other_worker = ChunkedUploadService(settings.UPLOAD_DIR, file_service)
+
+    async def chunks():
+        for byte in content[:6]:
+            await asyncio.sleep(0.01)
+            yield bytes([byte])
+
+    async def scenario():
+        return await asyncio.gather(
+            chunked_upload_service.write_chunk(upload["upload_id"], 0, chunks()),
+            other_worker.write_chunk(upload["upload_id"], 0, chunks()),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    assert sorted(type(result).__name__ for result in results) == ["UploadConflict", "dict"]
+    assert client.head(f"/api/files/uploads/{upload['upload_id']}").headers["Upload-Offset"] == "6"
+    client.delete(f"/api/files/uploads/{upload['upload_id']}")
+
+
+def test_abort_drops_the_search_index(client):
+    content = b"memo,amount\nrent,1\nfuel,2\n"
+    upload = _create(client, content, name="aborted.csv")
+    assert _patch(client, upload["upload_id"], 0, content).status_code == 200
+    assert file_service.search_service.indexed_rows(upload["file_id"]) == 2
+
+    assert client.delete(f"/api/files/uploads/{upload['upload_id']}").status_code in (200, 204)
+
+    assert file_service.search_service.indexed_rows(upload["file_id"]) is None
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from app.database import async_engine
+from app.services.column_stats import DistinctSketch
+
+
+def _sketch(values):
+    sketch = DistinctSketch()
+    sketch.update(pd.Series(values))
+    return sketch
+
+
+@pytest.mark.parametrize("distinct", [50, 1000, 20000, 200000])
+def test_distinct_estimate_within_expected_error(distinct):
+    values = np.random.default_rng(distinct).permutation(np.repeat(np.arange(distinct), 2))
+    estimate = _sketch(values).estimate()
+    # p=12 has about 1.6% standard error; four of them leaves no room for flakes
+    assert abs(estimate - distinct) / distinct < 0.065
+
+
+def test_distinct_merge_equals_sketch_of_union():
+    left = [f"acct-{n}" for n in range(0, 30000)]
+    right = [f"acct-{n}" for n in range(20000, 45000)]
+
+    merged = _sketch(left)
+    merged.merge(_sketch(right))
+
+    union = _sketch(left + right)
+    assert np.array_equal(merged.registers, union.registers)
+    assert merged.estimate() == union.estimate()
+    assert abs(merged.estimate() - 45000) / 45000 < 0.065
+
+
+def test_distinct_treats_numeric_spellings_alike():
+    assert np.array_equal(_sketch([10, 2.5, 7]).registers, _sketch(["10", "2.50", "7.0"]).registers)
+
+
+def test_distinct_round_trips_through_dict():
+    sketch = _sketch(range(500))
+    assert DistinctSketch.from_dict(sketch.to_dict()).estimate() == sketch.estimate()
+
+
+def test_aggregate_across_files_reads_no_file_data(client, upload_csv):
+    files = [
+        upload_csv("amount,account\n10,a\n20,b\n", name="agg-1.csv"),
+        upload_csv("amount,account\n5,b\n-3,c\n100,d\n", name="agg-2.csv"),
+        upload_csv("amount,account\n1,a\n", name="agg-3.csv"),
+    ]
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = client.post("/api/analytics/aggregate", json={
+            "file_ids": [file["id"] for file in files],
+            "columns": ["amount", "account"],
+        })
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["row_count"] == 6
+    amount = body["columns"]["amount"]
+    assert (amount["count"], amount["sum"], amount["min"], amount["max"]) == (6, 133.0, -3.0, 100.0)
+    assert body["columns"]["account"]["distinct"] == 4
+
+    assert statements
+    assert not [statement for statement in statements if "file_data" in statement]
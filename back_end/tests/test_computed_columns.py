@@ -0,0 +1,119 @@
+import os
+
+from app.config import settings
+from app.services.file_service import file_service
+from app.utils.admission import governors
+
+
+def _define(client, file_id, name, expression):
+    response = client.post(f"/api/files/{file_id}/computed-columns", json={"name": name, "expression": expression})
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_data_pages_skip_computed_columns_unless_asked(client, upload_csv):
+    file = upload_csv("credit,debit,memo\n10,0,Uber\n0,3,rent\n", name="computed.csv")
+    _define(client, file["id"], "net", "credit - debit")
+    cache_dir = os.path.join(file_service.computed_column_service.cache_dir, file["id"])
+
+    rows = client.get(f"/api/files/{file['id']}/data").json()["data"]
+    assert "net" not in rows[0]
+    assert not os.path.isdir(cache_dir)
+
+    rows = client.get(f"/api/files/{file['id']}/data", params={"include_computed": True}).json()["data"]
+    assert [row["net"] for row in rows] == [10.0, -3.0]
+    assert [name.endswith(".npz") for name in os.listdir(cache_dir)] == [True]
+
+
+def test_sort_and_export_reuse_the_cached_vector(client, upload_csv):
+    file = upload_csv("credit,debit,memo\n10,0,Uber\n0,3,rent\n1,0,Lyft\n", name="export.csv")
+    _define(client, file["id"], "kind", 'where(contains(memo, "(?i)uber|lyft"), "Transport", "Other")')
+
+    rows = client.get(f"/api/files/{file['id']}/data", params={"sort_by": "kind", "include_computed": True}).json()["data"]
+    assert [row["kind"] for row in rows] == ["Other", "Transport", "Transport"]
+
+    # Drop the in-memory copy so the export reads the vector back from disk
+    file_service.computed_column_service._cache.clear()
+    response = client.get(f"/api/files/{file['id']}/export", params={"columns": "memo,kind", "sort_by": "kind"})
+    assert response.status_code == 200
+    assert response.text.splitlines() == ["memo,kind", "rent,Other", "Uber,Transport", "Lyft,Transport"]
+
+
+def test_delete_computed_column_is_admitted(client, upload_csv):
+    file = upload_csv("credit,debit\n1,2\n", name="delete-computed.csv")
+    _define(client, file["id"], "net", "credit - debit")
+    before = governors["ingest"].admitted
+
+    assert client.delete(f"/api/files/{file['id']}/computed-columns/net").status_code == 200
+    assert governors["ingest"].admitted - before == 1
+    assert client.delete(f"/api/files/{file['id']}/computed-columns/net").status_code == 404
+
+
+def test_invalid_expression_is_rejected(client, upload_csv):
+    file = upload_csv("credit,memo\n1,a\n", name="invalid-computed.csv")
+    response = client.post(
+        f"/api/files/{file['id']}/computed-columns",
+        json={"name": "bad", "expression": 'contains(memo, "(a+)+$")'}
+    )
+    assert response.status_code == 400
+
+
+def test_columns_are_materialized_chunk_by_chunk(client, upload_csv, monkeypatch):
+    credits = [3, -1, 4, 1, -5, 9, 2, 6, 5, -3, 5]
+    file = upload_csv("credit,ref\n" + "".join(f"{credit},{n if n != 7 else 'x7'}\n" for n, credit in enumerate(credits)), name="chunked.csv")
+    _define(client, file["id"], "running", "cumsum(credit)")
+    _define(client, file["id"], "tagged", "ref + 1")
+    _define(client, file["id"], "ahead", "shift(credit, -1)")
+
+    service = file_service.computed_column_service
+    chunks = []
+    evaluate_chunk = service._evaluate_chunk
+
+    def record(frame, expressions, states, names):
+        chunks.append((len(frame), tuple(names)))
+        return evaluate_chunk(frame, expressions, states, names)
+    monkeypatch.setattr(service, "_evaluate_chunk", record)
+    monkeypatch.setattr(settings, "INGEST_INSERT_BATCH_ROWS", 4)
+
+    rows = client.get(f"/api/files/{file['id']}/data", params={"include_computed": True}).json()["data"]
+
+    assert [row["running"] for row in rows] == [float(sum(credits[:n + 1])) for n in range(len(credits))]
+    # ref is text from row 7 on, so + concatenates for every row, as over the whole file
+    assert [row["tagged"] for row in rows] == [f"{n if n != 7 else 'x7'}1" for n in range(len(credits))]
+    assert [row["ahead"] for row in rows] == [float(credit) for credit in credits[1:]] + [None]
+    chunked = [size for size, names in chunks if "ahead" not in names]
+    # Three chunks, then those of the second pass that "tagged" needed once it met text
+    assert chunked == [4, 4, 3, 4, 4, 3]
+    assert [size for size, names in chunks if "ahead" in names] == [len(credits)]
+
+
+def test_aggregates_use_only_materialized_computed_columns(client, upload_csv):
+    file = upload_csv("credit,debit\n10,0\n0,3\n", name="aggregate-computed.csv")
+    _define(client, file["id"], "net", "credit - debit")
+
+    def aggregate():
+        response = client.post("/api/analytics/aggregate", json={"file_ids": [file["id"]]})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    body = aggregate()
+    assert "net" not in body["columns"]
+    assert body["unavailable_columns"] == {"net": [file["id"]]}
+    assert client.get(f"/api/files/{file['id']}/stats").json()["unavailable_computed_columns"] == ["net"]
+    # Neither read computed anything
+    assert not os.path.isdir(os.path.join(file_service.computed_column_service.cache_dir, file["id"]))
+
+    before = governors["ingest"].admitted
+    response = client.post(f"/api/files/{file['id']}/computed-columns/materialize")
+    assert response.status_code == 200, response.text
+    assert response.json()["computed_columns"]["net"]["sum"] == 7.0
+    assert governors["ingest"].admitted - before == 1
+
+    body = aggregate()
+    assert body["columns"]["net"]["sum"] == 7.0
+    assert body["unavailable_columns"] == {}
+
+    # Appended rows make the cached values stale until they are computed again
+    client.post(f"/api/files/{file['id']}/append", files={"file": ("more.csv", b"credit,debit\n5,1\n", "text/csv")})
+    assert aggregate()["unavailable_columns"] == {"net": [file["id"]]}
+    assert client.post(f"/api/files/{file['id']}/computed-columns/materialize").json()["computed_columns"]["net"]["sum"] == 11.0
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.computed_column_service import normalize_values, vector_arrays, vector_from_arrays
+from app.services import expressions
+from app.services.expressions import ChunkState, Expression, ExpressionError
+
+COLUMNS = ["credit", "debit", "memo", "Net Amount"]
+
+
+def _frame():
+    return pd.DataFrame({
+        "credit": [10.0, 0.0, 5.5],
+        "debit": ["0", "3", None],
+        "memo": ["Uber trip", "rent", None],
+        "Net Amount": [1, 2, 3],
+    })
+
+
+@pytest.mark.parametrize("source, expected", [
+    ("credit - debit", [10.0, -3.0, None]),
+    ('col("Net Amount") * 2', [2.0, 4.0, 6.0]),
+    ('where(contains(memo, "(?i)uber|lyft"), "Transport", "Other")', ["Transport", "Other", "Other"]),
+    ("cumsum(credit)", [10.0, 10.0, 15.5]),
+    ("credit if credit > 1 else 0", [10.0, 0.0, 5.5]),
+])
+def test_evaluates_whitelisted_expressions(source, expected):
+    values = normalize_values(Expression(source, COLUMNS).evaluate(_frame()))
+    assert values.astype(object).where(values.notna(), None).tolist() == expected
+
+
+@pytest.mark.parametrize("source", [
+    "credit.__class__",
+    "memo.upper()",
+    "__import__('os')",
+    "__builtins__",
+    "credit[0]",
+    "(lambda: 1)()",
+    "[x for x in memo]",
+    "open('/etc/passwd')",
+    "eval('1')",
+    "getattr(credit, 'real')",
+    "round(credit, digits=2)",
+    "unknown_column + 1",
+    "f'{credit}'",
+    "credit << 2",
+    "credit in memo",
+    "b'bytes'",
+])
+def test_rejects_syntax_outside_the_whitelist(source):
+    with pytest.raises(ExpressionError):
+        Expression(source, COLUMNS)
+
+
+def test_dunder_column_needs_col():
+    with pytest.raises(ExpressionError, match="col"):
+        Expression("__x__ + 1", COLUMNS + ["__x__"])
+    assert Expression('col("__x__") + 1', COLUMNS + ["__x__"]).columns == {"__x__"}
+
+
+BAD_PATTERNS = [
+    "(a+)+$",
+    r"(\w+\s?)*x",
+    "(a*)*",
+    "((a+))*b",
+    "(?=(a+)+)b",
+    "(a|b+)+",
+    "(a{1,})+",
+    "a{5000}",
+    r"(a)\\1",
+    "(?P<x>a)(?P=x)",
+    "x" * 201,
+    "(unclosed",
+]
+GOOD_PATTERNS = [
+    "(?i)uber|lyft",
+    r"[a-z]+@\w+\.com",
+    "(?:ab|cd)+",
+    r"\d{1,3}(?:,\d{3})*",
+    r"[)(+]+x",
+    r"\\(a+\\)+",
+    "(a{2,5})+",
+]
+
+
+@pytest.fixture(params=["parser", "text"])
+def pattern_check(request, monkeypatch):
+    """Run pattern tests with re's parser and with the text-only fallback"""
+    if request.param == "text":
+        monkeypatch.setattr(expressions, "sre_parse", None)
+    return request.param
+
+
+@pytest.mark.parametrize("pattern", BAD_PATTERNS)
+def test_rejects_oversized_or_pathological_patterns(pattern, pattern_check):
+    with pytest.raises(ExpressionError):
+        Expression(f'contains(memo, "{pattern}")', COLUMNS)
+
+
+@pytest.mark.parametrize("pattern", GOOD_PATTERNS)
+def test_accepts_ordinary_patterns(pattern, pattern_check):
+    Expression(f'contains(memo, "{pattern}")', COLUMNS)
+
+
+def test_pattern_must_be_a_literal():
+    with pytest.raises(ExpressionError):
+        Expression("contains(memo, memo)", COLUMNS)
+
+
+@pytest.mark.parametrize("series", [
+    pd.Series([1.5, None, 3.0]),
+    pd.Series([True, False, True]),
+    pd.Series(["Zürich", None, "", "tab\there"]),
+])
+def test_cached_vectors_round_trip_without_pickle(tmp_path, series):
+    values = normalize_values(series.set_axis(pd.Index([4, 7, 9, 12][:len(series)], name="row_index")))
+    path = tmp_path / "vector.npz"
+    with open(path, "wb") as handle:
+        np.savez(handle, **vector_arrays(values))
+
+    with np.load(path, allow_pickle=False) as arrays:
+        loaded = vector_from_arrays(arrays)
+
+    pd.testing.assert_series_equal(loaded, values, check_names=False)
+
+
+def _chunked(expression, frame, size):
+    """Evaluate `frame` `size` rows at a time, the way computed columns are materialized"""
+    state = ChunkState()
+    while True:
+        parts = [expression.evaluate(frame.iloc[start:start + size], state) for start in range(0, len(frame), size)]
+        if not state.stale:
+            return pd.concat(parts)
+        state = state.restart()
+
+
+@pytest.mark.parametrize("source", [
+    "credit - debit",
+    "cumsum(credit)",
+    "cummax(credit)",
+    "cummin(credit)",
+    "shift(memo, 2)",
+    "diff(credit)",
+    "rolling_mean(credit, 3)",
+    "rolling_sum(credit + 1, 2)",
+    "cumsum(shift(credit)) + diff(credit, 2)",
+    # ref only looks like text from the third row on
+    "ref + 1",
+    "ref < code",
+    'where(ref == "x3", 1, 0)',
+    "concat(ref, memo) + credit",
+])
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_chunked_evaluation_matches_whole_file(source, size):
+    frame = pd.DataFrame({
+        "credit": [10.0, None, 5.5, -2.0, 7.0, None, 1.0],
+        "debit": ["0", "3", None, "1", "1", "2", "0"],
+        "memo": ["Uber", "rent", None, "Lyft", "tax", "Uber", "fee"],
+        "ref": ["10", "2", "x3", "4", "5", "6", "7"],
+        "code": ["9", "3", "4", "1", "1", "2", "0"],
+    }, index=pd.Index(range(10, 17), name="row_index"))
+    expression = Expression(source, list(frame.columns))
+    assert expression.chunkable
+
+    whole = normalize_values(expression.evaluate(frame))
+    chunked = normalize_values(_chunked(expression, frame, size))
+    pd.testing.assert_series_equal(chunked, whole, check_names=False)
+
+
+@pytest.mark.parametrize("source", ["shift(credit, -1)", "diff(credit, 0 - 1)", "rolling_sum(credit, len(memo))"])
+def test_windows_that_look_ahead_are_not_chunkable(source):
+    assert not Expression(source, COLUMNS).chunkable
@@ -0,0 +1,110 @@
+import os
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.api.endpoints import metrics
+from app.config import settings
+from app.database import async_engine
+from app.utils import profiling
+from app.utils.profiling import ProfileStore, install_sql_timing
+
+TOKEN = "profile-secret"
+
+
+@pytest.fixture
+def profiled(client, monkeypatch, tmp_path):
+    """Profiling on, with its own report directory and SQL timing installed"""
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", TOKEN)
+    store = ProfileStore(str(tmp_path))
+    monkeypatch.setattr(profiling, "profile_store", store)
+    monkeypatch.setattr(metrics, "profile_store", store)
+    install_sql_timing(async_engine.sync_engine)
+    yield store
+    event.remove(async_engine.sync_engine, "before_cursor_execute", profiling._before_cursor_execute)
+    event.remove(async_engine.sync_engine, "after_cursor_execute", profiling._after_cursor_execute)
+
+
+def _admin(token=TOKEN):
+    return {"X-Admin-Token": token}
+
+
+def test_admin_token_in_header_profiles_the_request(client, upload_csv, profiled):
+    file = upload_csv("a,b\n1,2\n", name="profiled.csv")
+
+    response = client.get(f"/api/files/{file['id']}/data", headers={"X-Profile": TOKEN})
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    report = client.get(f"/api/metrics/profiles/{profile_id}", headers=_admin()).json()
+    assert (report["trigger"], report["status"], report["path"]) == ("header", 200, f"/api/files/{file['id']}/data")
+    assert report["sql"]["count"] > 0
+    assert report["sql"]["total_ms"] > 0
+    assert all(entry["duration_ms"] >= 0 for entry in report["sql"]["statements"])
+
+
+def test_admin_token_in_query_profiles_the_request(client, profiled):
+    response = client.get("/api/files/", params={"_profile": TOKEN, "limit": 5})
+    assert response.status_code == 200
+
+    report = profiled.get(response.headers["X-Profile-Id"])
+    assert report["trigger"] == "query"
+    # The token itself is not stored with the report
+    assert report["query"] == {"limit": "5"}
+
+
+def test_wrong_or_missing_token_is_not_profiled(client, profiled):
+    assert "X-Profile-Id" not in client.get("/api/files/", headers={"X-Profile": "nope"}).headers
+    assert "X-Profile-Id" not in client.get("/api/files/", params={"_profile": "nope"}).headers
+    assert "X-Profile-Id" not in client.get("/api/files/").headers
+    assert profiled.list() == []
+
+
+def test_sample_rate_profiles_without_a_token(client, profiled, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+    response = client.get("/api/files/")
+    assert profiled.get(response.headers["X-Profile-Id"])["trigger"] == "sample"
+
+
+def test_disabled_profiling_ignores_the_token(client, profiled, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", False)
+    assert "X-Profile-Id" not in client.get("/api/files/", headers={"X-Profile": TOKEN}).headers
+
+
+def test_store_keeps_the_newest_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_MAX_REPORTS", 3)
+    store = ProfileStore(str(tmp_path))
+    for n in range(5):
+        store.save({
+            "id": f"report{n}", "method": "GET", "path": "/", "status": 200,
+            "duration_ms": 1.0, "started_at": "", "trigger": "sample"
+        })
+        # mtime orders the reports; keep them apart on coarse clocks, older
+        # than whatever the next save writes
+        stamp = time.time() - 100 + n
+        os.utime(tmp_path / f"report{n}.json", (stamp, stamp))
+
+    assert [summary["id"] for summary in store.list()] == ["report4", "report3", "report2"]
+    assert store.get("report0") is None
+    assert store.get("../report4") is None
+
+
+def test_profile_endpoints_require_the_admin_token(client, profiled):
+    response = client.get("/api/files/", headers={"X-Profile": TOKEN})
+    profile_id = response.headers["X-Profile-Id"]
+
+    for path in ("/api/metrics/profiles", f"/api/metrics/profiles/{profile_id}"):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers=_admin("wrong")).status_code == 403
+        assert client.get(path, headers=_admin()).status_code == 200
+    assert client.get("/api/metrics/profiles/missing", headers=_admin()).status_code == 404
+
+
+def test_non_ascii_token_is_rejected_not_an_error(client, profiled):
+    headers = {"X-Admin-Token": "tøken".encode("utf-8"), "X-Profile": "tøken".encode("utf-8")}
+    response = client.get("/api/metrics/profiles", headers=headers)
+    assert response.status_code == 403
+    assert "X-Profile-Id" not in response.headers
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from app.services.reconciliation_service import PartitionJoin, ReconciliationResult
+
+
+def _side(keys, amounts, days=None):
+    return pd.DataFrame({
+        "key": pd.Series(keys, dtype=object),
+        "row_index": np.arange(len(keys), dtype=np.int64),
+        "amount": np.array(amounts, dtype=float),
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(days or [0] * len(keys), unit="D"),
+    })
+
+
+def _join(build, probe, amount_tolerance=0.0, date_tolerance_days=0.0, chunk_rows=None):
+    result = ReconciliationResult(limit=1000, build_is_left=True)
+    join = PartitionJoin(build, amount_tolerance, date_tolerance_days, result)
+    chunk_rows = chunk_rows or len(probe)
+    for start in range(0, len(probe), chunk_rows):
+        join.probe(probe.iloc[start:start + chunk_rows])
+    join.finish()
+    return result
+
+
+def _pairs(result, category):
+    return sorted((pair["left_row_index"], pair["right_row_index"]) for pair in result.samples[category])
+
+
+def test_duplicate_heavy_keys_pair_one_to_one():
+    rows = 20000
+    build = _side(["same"] * rows, [10.0, 20.0] * (rows // 2))
+    probe = _side(["same"] * (rows + 3), [20.0, 10.0] * (rows // 2) + [10.0, 30.0, np.nan])
+
+    result = _join(build, probe, chunk_rows=4096)
+
+    assert result.counts == {"matched": rows, "mismatched": 0, "unmatched_left": 0, "unmatched_right": 3}
+    matched = _pairs(result, "matched")
+    assert len({left for left, _ in matched}) == len({right for _, right in matched}) == len(matched)
+    assert all(build["amount"][left] == probe["amount"][right] for left, right in matched)
+
+
+def test_nearest_rows_within_tolerance_match():
+    build = _side(["a", "a", "a", "b"], [100.0, 200.0, np.nan, 5.0], [0, 0, 0, 0])
+    probe = _side(["a", "a", "a", "b", "c"], [200.4, 99.8, np.nan, 9.0, 1.0], [1, 0, 0, 0, 0])
+
+    result = _join(build, probe, amount_tolerance=0.5, date_tolerance_days=1)
+
+    assert _pairs(result, "matched") == [(0, 1), (1, 0), (2, 2)]
+    assert result.samples["mismatched"][0]["reasons"] == ["amount"]
+    assert _pairs(result, "mismatched") == [(3, 3)]
+    assert result.samples["unmatched_right"] == [{"row_index": 4}]
+
+
+def test_build_rows_are_consumed_across_chunks():
+    build = _side(["k", "k"], [1.0, 1.0])
+    probe = _side(["k", "k", "k"], [1.0, 1.0, 1.0])
+
+    result = _join(build, probe, chunk_rows=1)
+
+    assert result.counts == {"matched": 2, "mismatched": 0, "unmatched_left": 0, "unmatched_right": 1}
+
+
+def test_reconcile_endpoint(client, upload_csv):
+    left = upload_csv("ref,amount\nA,10\nA,10\nB,7\n", name="ledger.csv")
+    right = upload_csv("ref,amount\nA,10\nB,7.5\nA,10\nC,1\n", name="bank.csv")
+
+    response = client.post("/api/analytics/reconcile", json={
+        "left": {"file_id": left["id"], "key_columns": ["ref"], "amount_column": "amount"},
+        "right": {"file_id": right["id"], "key_columns": ["ref"], "amount_column": "amount"},
+    })
+
+    assert response.status_code == 200, response.text
+    summary = response.json()["summary"]
+    assert (summary["matched"], summary["mismatched"], summary["unmatched_left"], summary["unmatched_right"]) == (2, 1, 0, 1)
+
+
+def test_waiting_probe_rows_stay_bounded_by_the_build_side():
+    build = _side(["k"] * 10 + ["j"] * 5, [float(n) for n in range(15)])
+    probe = _side(["k"] * 20000 + ["j"] * 3, [1000.0] * 20000 + [12.0, 99.0, 99.0])
+    result = ReconciliationResult(limit=1000, build_is_left=True)
+    join = PartitionJoin(build, 0.0, 0.0, result)
+
+    for start in range(0, len(probe), 1000):
+        join.probe(probe.iloc[start:start + 1000])
+        assert sum(len(frame) for frame in join.pending) <= len(build)
+    join.finish()
+
+    assert result.counts == {"matched": 1, "mismatched": 12, "unmatched_left": 2, "unmatched_right": 19990}
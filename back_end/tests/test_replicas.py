@@ -0,0 +1,158 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import database
+from app.config import settings
+from app.database import ReplicaRouter, async_engine, get_async_read_db, primary_session
+from app.models.file_model import File
+from app.services.file_service import file_service
+
+
+def _engine(url):
+    # No pooling, so connections never outlive the event loop that opened them
+    return create_async_engine(url, poolclass=NullPool)
+
+
+@pytest.fixture
+def sqlite_replicas(tmp_path):
+    """Two standalone SQLite files standing in for replicas"""
+    engines = [_engine(f"sqlite+aiosqlite:///{tmp_path}/replica-{n}.db") for n in range(2)]
+    yield engines
+    for engine in engines:
+        asyncio.run(engine.dispose())
+
+
+@pytest.fixture
+def statements():
+    """SQL run per engine, keyed by the engine object"""
+    recorded = {}
+    listeners = []
+
+    def watch(engine):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            recorded.setdefault(engine, []).append(statement)
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        listeners.append((engine, record))
+    yield recorded, watch
+    for engine, record in listeners:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_pick_round_robins_healthy_replicas(sqlite_replicas):
+    router = ReplicaRouter(sqlite_replicas)
+    asyncio.run(router.check_all())
+    assert all(state["healthy"] and state["lag_seconds"] == 0 for state in router.state)
+
+    assert [router.pick() for _ in range(4)] == sqlite_replicas * 2
+    assert [state["sessions"] for state in router.state] == [2, 2]
+    assert router.primary_fallbacks == 0
+
+
+def test_pick_skips_down_replicas_and_falls_back_to_primary(sqlite_replicas, tmp_path):
+    down = _engine(f"sqlite+aiosqlite:///{tmp_path}/missing-dir/replica.db")
+    router = ReplicaRouter([down, sqlite_replicas[0]])
+    asyncio.run(router.check_all())
+    assert not router.state[0]["healthy"] and router.state[0]["error"]
+
+    assert [router.pick() for _ in range(3)] == [sqlite_replicas[0]] * 3
+
+    router.state[1]["healthy"] = False
+    assert router.pick() is async_engine
+    assert router.primary_fallbacks == 1
+
+
+def test_lagging_replica_is_skipped_until_it_catches_up(sqlite_replicas, monkeypatch):
+    router = ReplicaRouter(sqlite_replicas[:1])
+    # SQLite reports no lag; a negative limit makes any replica "too far behind"
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", -1)
+    asyncio.run(router.check_all())
+    assert router.state[0]["lag_seconds"] == 0 and not router.state[0]["healthy"]
+    assert router.pick() is async_engine
+
+    monkeypatch.setattr(settings, "REPLICA_MAX_LAG_SECONDS", 5)
+    asyncio.run(router.check_all())
+    assert router.pick() is sqlite_replicas[0]
+
+
+def test_no_replicas_reads_from_primary():
+    router = ReplicaRouter([])
+    assert router.pick() is async_engine
+    # Nothing to fall back from, so it isn't counted as a fallback
+    assert router.primary_fallbacks == 0
+
+
+def test_read_sessions_and_primary_session(sqlite_replicas, monkeypatch):
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter(sqlite_replicas[:1]))
+    asyncio.run(database.replica_router.check_all())
+
+    async def scenario():
+        sessions = get_async_read_db()
+        db = await sessions.__anext__()
+        try:
+            assert db.bind is sqlite_replicas[0]
+            assert database.is_replica_session(db)
+            async with primary_session(db) as primary_db:
+                assert primary_db.bind is async_engine
+            async with primary_session(db, needed=False) as same_db:
+                assert same_db is db
+        finally:
+            await sessions.aclose()
+
+        database.replica_router.state[0]["healthy"] = False
+        sessions = get_async_read_db()
+        db = await sessions.__anext__()
+        try:
+            assert db.bind is async_engine
+            async with primary_session(db) as primary_db:
+                # Already on the primary, so no second session
+                assert primary_db is db
+        finally:
+            await sessions.aclose()
+    asyncio.run(scenario())
+
+
+def test_reads_are_served_by_the_replica_and_cold_rows_by_the_primary(client, upload_csv, statements, monkeypatch):
+    # The test database itself, opened as a replica: same rows, separate engine
+    replica = _engine(settings.DATABASE_URL_ASYNC)
+    monkeypatch.setattr(database, "replica_router", ReplicaRouter([replica]))
+    asyncio.run(database.replica_router.check_all())
+    recorded, watch = statements
+    watch(replica)
+    watch(async_engine)
+
+    file = upload_csv("a,b\n1,2\n3,4\n", name="replica-read.csv")
+    recorded.clear()
+    assert client.get(f"/api/files/{file['id']}").status_code == 200
+    assert any("FROM files" in statement for statement in recorded.get(replica, []))
+    assert not recorded.get(async_engine)
+
+    # Down replica: the same read falls back to the primary
+    database.replica_router.state[0]["healthy"] = False
+    recorded.clear()
+    assert client.get(f"/api/files/{file['id']}").status_code == 200
+    assert not recorded.get(replica)
+    assert any("FROM files" in statement for statement in recorded[async_engine])
+    assert database.replica_router.primary_fallbacks == 1
+    database.replica_router.state[0]["healthy"] = True
+
+    # Cold file: the replica finds the file, the primary rehydrates and serves its rows
+    file_id = uuid.UUID(file["id"])
+    asyncio.run(file_service.tiering_service.archive(file_id))
+    recorded.clear()
+    response = client.get(f"/api/files/{file['id']}/data")
+    assert response.status_code == 200, response.text
+    assert [row["a"] for row in response.json()["data"]] == [1, 3]
+    assert any("FROM files" in statement for statement in recorded[replica])
+    assert not [statement for statement in recorded[replica] if "file_data" in statement]
+    assert any("file_data" in statement for statement in recorded[async_engine])
+
+    async def tier():
+        async with database.AsyncSessionLocal() as db:
+            return await db.scalar(select(File.storage_tier).where(File.id == file_id))
+    assert asyncio.run(tier()) == "hot"
+    asyncio.run(replica.dispose())
@@ -0,0 +1,128 @@
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from app.services.search_service import (
+    MAX_SEGMENTS, SearchIndex, SearchService, bounded_edit_distance, build_postings, fuzzy_limit, tsquery_lexeme
+)
+
+
+def _frame(memos):
+    return pd.DataFrame({"memo": memos, "amount": range(len(memos))})
+
+
+def test_build_postings_skips_numeric_columns():
+    postings = build_postings(_frame(["Tesco store", "tesco tesco"]), start_index=10)
+    assert sorted(map(tuple, postings.itertuples(index=False))) == [("store", 10, 1), ("tesco", 10, 1), ("tesco", 11, 2)]
+
+
+def test_segments_are_append_only_and_merged(tmp_path):
+    service = SearchService(str(tmp_path))
+    file_id = "6f1c1e0a-0000-4000-8000-000000000001"
+
+    for batch in range(MAX_SEGMENTS):
+        service._add_rows(file_id, _frame([f"coffee shop {batch}", "rent"]), batch * 2, True)
+    names = service._segment_names(file_id)
+    assert len(names) == MAX_SEGMENTS
+
+    index = service.load_index(file_id)
+    assert index.rows == 2 * MAX_SEGMENTS
+    assert index.terms["coffee"]["df"] == MAX_SEGMENTS
+    rows, _ = index.search([index.expand("rent", False, False)])
+    assert sorted(rows.tolist()) == list(range(1, 2 * MAX_SEGMENTS, 2))
+
+    service._merge_segments(file_id)
+    assert len(service._segment_names(file_id)) == 1
+    assert service.load_index(file_id).terms["coffee"]["df"] == MAX_SEGMENTS
+
+
+def test_merged_segment_hides_the_ones_it_replaces(tmp_path):
+    service = SearchService(str(tmp_path))
+    file_id = "6f1c1e0a-0000-4000-8000-000000000002"
+    service._add_rows(file_id, _frame(["alpha", "beta"]), 0, True)
+    service._add_rows(file_id, _frame(["gamma"]), 2, True)
+    names = service._segment_names(file_id)
+
+    # A reader between writing the merged segment and removing the old ones
+    service._write_segment(file_id, service._read_index(file_id, names), names)
+    index = service._read_index(file_id, service._segment_names(file_id))
+
+    assert index.rows == 3
+    assert index.terms["alpha"]["df"] == 1
+
+
+def test_legacy_single_file_index_is_adopted(tmp_path):
+    service = SearchService(str(tmp_path))
+    file_id = "6f1c1e0a-0000-4000-8000-000000000003"
+    legacy = SearchIndex()
+    legacy.add(build_postings(_frame(["salary"]), 0), 1, True)
+    service._write_segment(file_id, legacy)
+    segment = os.path.join(service._segment_dir(file_id), service._segment_names(file_id)[0])
+    os.replace(segment, os.path.join(service.index_dir, f"{file_id}.json.gz"))
+
+    assert service.indexed_rows(file_id) == 1
+    assert not os.path.exists(os.path.join(service.index_dir, f"{file_id}.json.gz"))
+
+
+def test_fuzzy_prefilter_matches_full_scan():
+    rng = random.Random(3)
+    words = {"".join(rng.choice("abcdeist") for _ in range(rng.randint(2, 11))) for _ in range(3000)}
+    index = SearchIndex()
+    index.add(build_postings(_frame(sorted(words)), 0), len(words), False)
+
+    for term in ["tesco", "abcdeis", "stateside", "aaaa", "debit"]:
+        limit = fuzzy_limit(term)
+        expected = {word for word in words if bounded_edit_distance(term, word, limit) <= limit}
+        assert set(index.expand(term, False, True)) == expected
+
+
+def test_tsquery_lexeme_quoting():
+    assert tsquery_lexeme("tesco") == "'tesco'"
+    assert tsquery_lexeme("o'neil", prefix=True) == "'o''neil':*"
+    assert tsquery_lexeme("back\\slash") == "'back\\\\slash'"
+
+
+def test_search_endpoint(client, upload_csv):
+    file = upload_csv("memo,amount\nTesco store,1\nTesco online,2\nRent,3\n", name="search.csv")
+
+    response = client.get(f"/api/files/{file['id']}/search", params={"q": "tes stor"})
+    assert response.status_code == 200
+    assert [hit["row_index"] for hit in response.json()["hits"]] == [0]
+
+    response = client.get(f"/api/files/{file['id']}/search", params={"q": "tesko", "fuzzy": True, "prefix": False})
+    assert {hit["row_index"] for hit in response.json()["hits"]} == {0, 1}
+
+
+def test_stale_index_needs_reindex(client, upload_csv):
+    from app.api.endpoints.files import file_service
+
+    file = upload_csv("memo,amount\nGroceries,1\nFuel,2\n", name="stale.csv")
+    file_service.search_service.delete_index(file["id"])
+
+    assert client.get(f"/api/files/{file['id']}/search", params={"q": "fuel"}).status_code == 409
+    assert client.post(f"/api/files/{file['id']}/search/reindex").json()["indexed_rows"] == 2
+    hits = client.get(f"/api/files/{file['id']}/search", params={"q": "fuel"}).json()["hits"]
+    assert [hit["row_index"] for hit in hits] == [1]
+
+
+def test_failed_append_leaves_no_segment(client, upload_csv, monkeypatch):
+    from app.api.endpoints.files import file_service
+
+    file = upload_csv("memo,amount\nGroceries,1\n", name="failed-append.csv")
+    index_rows = file_service.index_rows
+
+    async def failing_index_rows(*args, **kwargs):
+        await index_rows(*args, **kwargs)
+        raise RuntimeError("database went away before commit")
+
+    monkeypatch.setattr(file_service, "index_rows", failing_index_rows)
+    with pytest.raises(RuntimeError):
+        client.post(
+            f"/api/files/{file['id']}/append",
+            files={"file": ("more.csv", b"memo,amount\nFuel,2\n", "text/csv")}
+        )
+
+    assert file_service.search_service.indexed_rows(file["id"]) == 1
+    assert client.get(f"/api/files/{file['id']}/search", params={"q": "fuel"}).json()["hits"] == []
@@ -0,0 +1,56 @@
+import pytest
+
+from app import serve
+from app.config import settings
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 20)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 30)
+    monkeypatch.setattr(settings, "DATABASE_REPLICA_URLS", "")
+    return monkeypatch
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.setattr(serve, "available_cpus", lambda: 12)
+    monkeypatch.setattr(settings, "WORKERS_MAX", 8)
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 0)
+    assert serve.worker_count() == 8
+
+    monkeypatch.setattr(settings, "WORKERS_MAX", 16)
+    assert serve.worker_count() == 12
+
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 3)
+    assert serve.worker_count() == 3
+
+
+def test_pools_unchanged_without_connection_limit(pools):
+    pools.setattr(settings, "DB_MAX_CONNECTIONS", 0)
+    assert serve.pool_sizes(8) == (20, 30)
+
+
+@pytest.mark.parametrize("max_connections, workers", [(100, 1), (100, 4), (100, 16), (25, 8), (6, 4)])
+def test_pools_fit_the_connection_limit(pools, max_connections, workers):
+    pools.setattr(settings, "DB_MAX_CONNECTIONS", max_connections)
+
+    pool_size, max_overflow = serve.pool_sizes(workers)
+
+    assert pool_size >= 1 and max_overflow >= 0
+    assert pool_size <= 20 and max_overflow <= 30
+    if (max_connections - 5) // workers >= 2:
+        assert workers * (pool_size + max_overflow) <= max_connections - 5
+
+
+def test_worker_environment_caps_replica_pools(pools):
+    pools.setattr(settings, "DB_MAX_CONNECTIONS", 100)
+    pools.setattr(settings, "DATABASE_REPLICA_URLS", "postgresql+asyncpg://replica/db")
+
+    environment = serve.worker_environment(4)
+
+    assert environment == {
+        "DB_POOL_SIZE": "11",
+        "DB_MAX_OVERFLOW": "12",
+        "DB_REPLICA_POOL_SIZE": "11",
+        "DB_REPLICA_MAX_OVERFLOW": "12",
+    }
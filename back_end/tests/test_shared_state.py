@@ -0,0 +1,52 @@
+import asyncio
+
+from app.utils.shared_state import FileBackend
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    first, second = FileBackend(str(tmp_path)), FileBackend(str(tmp_path))
+
+    async def scenario():
+        async with first.lock("upload:1") as held:
+            async with second.lock("upload:1", blocking=False) as busy:
+                async with second.lock("upload:2", blocking=False) as other:
+                    return held, busy, other
+
+    assert asyncio.run(scenario()) == (True, False, True)
+
+
+def test_file_lock_waits_for_release(tmp_path):
+    backend = FileBackend(str(tmp_path))
+    order = []
+
+    async def hold(name, seconds):
+        async with backend.lock("search:1") as acquired:
+            order.append((name, acquired))
+            await asyncio.sleep(seconds)
+        order.append((name, "released"))
+
+    async def scenario():
+        holder = asyncio.create_task(hold("first", 0.2))
+        await asyncio.sleep(0.05)
+        async with backend.lock("search:1", timeout=0.05) as acquired:
+            order.append(("timed out", acquired))
+        await hold("second", 0)
+        await holder
+
+    asyncio.run(scenario())
+    assert order == [
+        ("first", True), ("timed out", False), ("first", "released"), ("second", True), ("second", "released")
+    ]
+
+
+def test_file_cache_round_trip_and_expiry(tmp_path):
+    backend = FileBackend(str(tmp_path))
+
+    async def scenario():
+        await backend.set("tiering:last_pass", {"files": 2})
+        await backend.set("expired", 1, ttl=-1)
+        values = await backend.get("tiering:last_pass"), await backend.get("expired"), await backend.get("missing")
+        await backend.delete("tiering:last_pass")
+        return values, await backend.get("tiering:last_pass")
+
+    assert asyncio.run(scenario()) == (({"files": 2}, None, None), None)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import uuid
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.services.file_service import file_service
+from app.services.tiering_service import access_tracker
+from app.utils.compression import codec_for_path
+
+
+def test_raw_candidates_are_selected_in_sql(client, upload_csv, monkeypatch):
+    monkeypatch.setattr(settings, "TIERING_RAW_COMPRESS_AFTER_HOURS", 0)
+    monkeypatch.setattr(settings, "TIERING_COLD_AFTER_DAYS", 10000)
+    upload_csv("a,b\n1,2\n", name="tier-one.csv")
+    upload_csv("a,b\n3,4\n", name="tier-two.csv")
+
+    monkeypatch.setattr(settings, "TIERING_BATCH_FILES", 1)
+    assert client.post("/api/files/tiering/run").json()["raw_candidates"] == 1
+
+    monkeypatch.setattr(settings, "TIERING_BATCH_FILES", 10000)
+    client.post("/api/files/tiering/run")
+    # Everything stored is compressed now, so the next pass finds nothing
+    assert client.post("/api/files/tiering/run").json()["raw_candidates"] == 0
+
+
+def test_append_marks_file_raw_again(client, upload_csv, monkeypatch):
+    monkeypatch.setattr(settings, "TIERING_RAW_COMPRESS_AFTER_HOURS", 0)
+    monkeypatch.setattr(settings, "TIERING_COLD_AFTER_DAYS", 10000)
+    monkeypatch.setattr(settings, "TIERING_BATCH_FILES", 10000)
+    file = upload_csv("a,b\n1,2\n", name="tier-append.csv")
+
+    client.post("/api/files/tiering/run")
+    compressed = client.get(f"/api/files/{file['id']}").json()
+    assert compressed["raw_tier"] == "compressed"
+    assert codec_for_path(compressed["file_path"])
+
+    response = client.post(
+        f"/api/files/{file['id']}/append",
+        files={"file": ("more.csv", b"a,b\n5,6\n", "text/csv")}
+    )
+    assert response.status_code == 200, response.text
+    assert client.get(f"/api/files/{file['id']}").json()["raw_tier"] == "raw"
+
+    assert client.post("/api/files/tiering/run").json()["raw_candidates"] >= 1
+    appended = client.get(f"/api/files/{file['id']}").json()
+    assert appended["raw_tier"] == "compressed"
+    assert all(os.path.exists(append["file_path"]) for append in appended["metadata"]["appends"])
+
+
+def test_metrics_use_the_shared_file_service(client):
+    from app.api.endpoints import analytics, files
+
+    assert files.file_service is analytics.file_service is file_service
+    assert "storage" in client.get("/api/metrics/").json()["tiering"]
+
+
+def test_recording_reads_keeps_updated_at(client, upload_csv):
+    file = upload_csv("a,b\n1,2\n", name="tier-read.csv")
+    before = client.get(f"/api/files/{file['id']}").json()
+    assert client.get(f"/api/files/{file['id']}/data").status_code == 200
+
+    async def flush():
+        async with AsyncSessionLocal() as db:
+            await access_tracker.flush(db)
+    asyncio.run(flush())
+
+    after = client.get(f"/api/files/{file['id']}").json()
+    assert after["last_accessed_at"] is not None
+    assert after["updated_at"] == before["updated_at"]
+
+
+def test_archive_waits_for_reads_in_progress(client, upload_csv):
+    file = upload_csv("a,b\n1,2\n3,4\n", name="tier-hold.csv")
+    tiering = file_service.tiering_service
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            record = await file_service.get_file_by_id(db, uuid.UUID(file["id"]))
+            async with tiering.hot(db, record):
+                archiving = asyncio.create_task(tiering.archive(record.id))
+                # Nested reads of the same file share the hold instead of waiting on it
+                frames = [frame async for frame in file_service.iter_file_frames(db, record.id)]
+                await asyncio.sleep(0.2)
+                assert not archiving.done()
+            assert await asyncio.wait_for(archiving, 10) is not None
+        return frames
+    frames = asyncio.run(run())
+
+    assert sum(len(frame) for frame in frames) == 2
+    assert client.get(f"/api/files/{file['id']}").json()["storage_tier"] == "cold"
+    rows = client.get(f"/api/files/{file['id']}/data").json()["data"]
+    assert [row["a"] for row in rows] == [1, 3]
+    assert client.get(f"/api/files/{file['id']}").json()["storage_tier"] == "hot"
+
+
+def test_append_to_cold_file_rehydrates_first(client, upload_csv):
+    file = upload_csv("a,b\n1,2\n", name="tier-cold-append.csv")
+    asyncio.run(file_service.tiering_service.archive(uuid.UUID(file["id"])))
+
+    response = client.post(
+        f"/api/files/{file['id']}/append",
+        files={"file": ("more.csv", b"a,b\n5,6\n", "text/csv")}
+    )
+    assert response.status_code == 200, response.text
+    rows = client.get(f"/api/files/{file['id']}/data").json()["data"]
+    assert [row["a"] for row in rows] == [1, 5]
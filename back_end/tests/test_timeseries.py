@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from app.services.timeseries_service import detect_time_column, infer_time_format, naive_utc, parse_times, sort_by_time
+
+
+def test_infer_time_format_from_sample():
+    assert infer_time_format(pd.Series(["2024-01-05", "2024-02-11", None])) == "%Y-%m-%d"
+    assert infer_time_format(pd.Series(["01/31/2024 10:00", "02/01/2024 11:30"])) == "%m/%d/%Y %H:%M"
+    assert infer_time_format(pd.Series(["hello", "world"])) is None
+
+
+def test_parse_times_falls_back_for_values_off_format():
+    values = pd.Series(["01/31/2024", "02/01/2024", "Mar 5 2024", "garbage", None])
+
+    parsed = parse_times(values)
+
+    assert parsed.tolist()[:3] == [pd.Timestamp("2024-01-31"), pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-05")]
+    assert parsed[3:].isna().all()
+
+
+def test_parse_times_converts_offsets_to_naive_utc():
+    parsed = parse_times(pd.Series(["2024-01-05T10:00:00+02:00", "2024-01-05T10:00:00-05:00"]))
+    assert parsed.tolist() == [pd.Timestamp("2024-01-05 08:00"), pd.Timestamp("2024-01-05 15:00")]
+
+
+def test_naive_utc_bounds():
+    aware = datetime(2024, 1, 1, 2, tzinfo=timezone(timedelta(hours=5)))
+    assert naive_utc(aware) == pd.Timestamp("2023-12-31 21:00")
+    assert naive_utc(datetime(2024, 1, 1)) == pd.Timestamp("2024-01-01")
+
+
+def test_detect_time_column_prefers_named_columns():
+    df = pd.DataFrame({
+        "reference": ["2024-01-01", "2024-01-02"],
+        "posted_date": ["01/03/2024", "01/04/2024"],
+        "amount": [1.0, 2.0]
+    })
+    assert detect_time_column(df) == "posted_date"
+
+
+def test_timeseries_query_with_aware_bounds(client, upload_csv):
+    file = upload_csv(
+        "date,amount\n2024-01-31,1\n2024-02-01,2\n2024-02-29,4\n2024-03-01,8\n",
+        name="series.csv"
+    )
+
+    # 2024-02-01T03:00+05:00 is still January 31st in UTC, and the end bound
+    # 2024-03-01T01:00+02:00 is February 29th
+    response = client.get(
+        f"/api/analytics/{file['id']}/timeseries",
+        params={
+            "column": "amount",
+            "freq": "M",
+            "start": "2024-02-01T03:00:00+05:00",
+            "end": "2024-03-01T01:00:00+02:00"
+        }
+    )
+
+    assert response.status_code == 200, response.text
+    points = response.json()["points"]
+    assert [point["period"][:10] for point in points] == ["2024-01-01", "2024-02-01"]
+    assert [point["value"] for point in points] == [1.0, 6.0]
+
+
+def test_sort_by_time_tracks_order_across_batches():
+    first, order = sort_by_time(pd.DataFrame({"date": ["2024-01-03", "2024-01-01"]}), "date")
+    assert first["date"].tolist() == ["2024-01-01", "2024-01-03"]
+    assert order == {"sorted": True, "last": "2024-01-03T00:00:00", "missing": False}
+
+    _, later = sort_by_time(pd.DataFrame({"date": ["2024-01-04", "2024-01-03"]}), "date", order)
+    assert later["sorted"] and later["last"] == "2024-01-04T00:00:00"
+
+    _, earlier = sort_by_time(pd.DataFrame({"date": ["2024-01-02"]}), "date", later)
+    assert not earlier["sorted"] and earlier["last"] == "2024-01-04T00:00:00"
+
+    # Unparseable times sort last, so any dated row after them breaks the order
+    _, gap = sort_by_time(pd.DataFrame({"date": ["n/a"]}), "date", later)
+    assert gap["sorted"] and gap["missing"]
+    _, after_gap = sort_by_time(pd.DataFrame({"date": ["2024-02-01"]}), "date", gap)
+    assert not after_gap["sorted"]
+
+
+def test_default_read_order_is_time_order_after_appends(client, upload_csv):
+    file = upload_csv("date,amount\n2024-01-05,5\n2024-01-01,1\n", name="time-order.csv")
+
+    def append(text):
+        response = client.post(
+            f"/api/files/{file['id']}/append",
+            files={"file": ("more.csv", text.encode(), "text/csv")}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["file"]["metadata"]["time_order"]
+
+    assert append("date,amount\n2024-01-09,9\n2024-01-07,7\n")["sorted"]
+    assert not append("date,amount\n2024-01-06,6\n2024-01-02,2\n")["sorted"]
+
+    pages = [
+        client.get(f"/api/files/{file['id']}/data", params={"page": page, "limit": 2}).json()["data"]
+        for page in (1, 2, 3)
+    ]
+    assert [row["amount"] for page in pages for row in page] == [1, 2, 5, 6, 7, 9]
+
+    export = client.get(f"/api/files/{file['id']}/export", params={"columns": "amount"})
+    assert export.text.splitlines() == ["amount", "1", "2", "5", "6", "7", "9"]